@@ -0,0 +1,3 @@
+# Standalone performance benchmarks. Run from the repository root, e.g.
+#
+#     python -m benchmarks.bench_lead_output
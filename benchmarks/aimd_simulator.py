@@ -0,0 +1,174 @@
+"""
+Simulate adaptive throttling against a local rate-limiting server.
+
+A stub server on 127.0.0.1 admits requests through a token bucket
+(--rate per second, --burst) and answers 429 once it's empty, after
+--latency seconds either way. The same crawl of --pages pages is then run
+through PolitenessMiddleware with AIMD and with a fixed delay, and each
+run's throughput and 429 count are reported.
+
+    python -m benchmarks.aimd_simulator [--rate 10] [--pages 200] [--check]
+
+With --check the script exits non-zero unless the AIMD run reaches at least
+half the server's rate while less than 10% of its responses are 429s.
+"""
+
+import argparse
+import json
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def take(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+def serve(rate, burst, latency):
+    bucket = TokenBucket(rate, burst)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            allowed = bucket.take()
+            time.sleep(latency)
+            body = b'<html><body>ok</body></html>' if allowed else b'<html>slow down</html>'
+            self.send_response(200 if allowed else 429)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def run_child(mode, url, pages, delay):
+    """Crawl ``pages`` pages from the stub and print the outcome as JSON."""
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    class SimulationSpider(scrapy.Spider):
+        name = 'aimd_simulation'
+
+        def start_requests(self):
+            for i in range(pages):
+                yield scrapy.Request(f'{url}/page/{i}', dont_filter=True)
+
+        def parse(self, response):
+            self.crawler.stats.inc_value('simulation/pages')
+
+    settings = get_project_settings()
+    # Stub pages must never land in the real cache, even if it gets enabled
+    cache_dir = tempfile.mkdtemp(prefix='httpcache_')
+    settings.setdict({
+        'SPIDER_MODULES': [],
+        'ROBOTSTXT_OBEY': False,
+        'HTTPCACHE_ENABLED': False,
+        'HTTPCACHE_DIR': cache_dir,
+        'DEBUG_CAPTURE_ENABLED': False,
+        'LOG_LEVEL': 'ERROR',
+        'TELNETCONSOLE_ENABLED': False,
+        'CONCURRENT_REQUESTS': 32,
+        'ITEM_PIPELINES': {},
+        'POLITENESS_DELAY': (delay, delay),
+        'POLITENESS_BACKOFF_BASE': 0.5,
+        'POLITENESS_BACKOFF_MAX': 2,
+        'POLITENESS_MAX_RETRIES': 20,
+        'AIMD_ENABLED': mode == 'aimd',
+        'AIMD_MIN_DELAY': 0.01,
+        'AIMD_RATE_STEP': 2,
+        'AIMD_MAX_CONCURRENCY': 16,
+        'RETRY_ENABLED': False,
+    }, priority='cmdline')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(SimulationSpider)
+    process.crawl(crawler)
+    process.start()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    stats = crawler.stats.get_stats()
+    elapsed = stats.get('elapsed_time_seconds') or 0.0
+    done = stats.get('simulation/pages', 0)
+    blocked = stats.get('downloader/response_status_count/429', 0)
+    print(json.dumps({
+        'mode': mode,
+        'pages': done,
+        'elapsed_s': round(elapsed, 2),
+        'pages_per_s': round(done / elapsed, 2) if elapsed else None,
+        'responses_429': blocked,
+        'blocked_ratio': round(blocked / max(1, stats.get('downloader/response_count', 0)), 3),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--rate', type=float, default=10, help='requests per second the stub admits')
+    parser.add_argument('--burst', type=float, default=5)
+    parser.add_argument('--latency', type=float, default=0.1)
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--delay', type=float, default=0.5, help='fixed delay, and AIMD starting delay')
+    parser.add_argument('--check', action='store_true', help='fail unless AIMD keeps up with the stub')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.url, args.pages, args.delay)
+        return
+
+    server = serve(args.rate, args.burst, args.latency)
+    url = f'http://127.0.0.1:{server.server_port}'
+    results = {}
+    try:
+        for mode in ('aimd', 'fixed'):
+            proc = subprocess.run(
+                [sys.executable, '-m', 'benchmarks.aimd_simulator', '--child', mode, '--url', url,
+                 '--pages', str(args.pages), '--delay', str(args.delay)],
+                capture_output=True, text=True,
+            )
+            try:
+                results[mode] = json.loads(proc.stdout.strip().splitlines()[-1])
+            except (IndexError, ValueError):
+                results[mode] = {'failed': proc.returncode, 'stderr': proc.stderr[-2000:]}
+            print(json.dumps(results[mode]))
+    finally:
+        server.shutdown()
+
+    if args.check:
+        aimd = results['aimd']
+        ok = (aimd.get('pages') == args.pages
+              and (aimd.get('pages_per_s') or 0) >= args.rate / 2
+              and aimd.get('blocked_ratio', 1) < 0.1)
+        print('PASS' if ok else 'FAIL')
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+"""
+File size, write time and load time of the lead output formats.
+
+Writes --items Maps-like leads with each LEAD_FORMAT writer, then loads
+every file back into an Arrow table, the way an analytics tool would:
+JSON lines both with json.loads per line (Python loaders) and with
+pyarrow's JSON reader, CSV with pyarrow's CSV reader and Parquet with
+pyarrow.parquet. "write" includes closing (and fsyncing) the file. "peak"
+is the writer's peak Python memory besides the leads themselves, measured
+with tracemalloc in a second, untimed pass over at most 100000 leads; for
+Parquet it is about one row group of column values, whatever --items is.
+
+    python -m benchmarks.bench_columnar_export [--items 1000000] [--row-group-size 50000]
+
+Needs pyarrow.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+import pyarrow
+import pyarrow.csv
+import pyarrow.json
+import pyarrow.parquet
+
+from scrape_machine.items import LeadItem
+from scrape_machine.writers import columns_for, lead_writer
+
+SOURCES = ('google_maps', 'google_search', 'google_maps_selenium')
+STREETS = ('Main St', 'Peoria Ave', 'Harvard Ave', 'Yale Ave', 'Memorial Dr', '71st St')
+
+
+def make_leads(count, rng):
+    leads = []
+    for i in range(count):
+        domain = f'business{i % (count // 3 + 1)}.com'
+        leads.append({
+            'name': f'Business {i}',
+            'company': f'Business {i}',
+            'email': f'office@{domain}' if i % 2 else None,
+            'phone': f'+1918555{i % 10000:04d}' if i % 5 else None,
+            'website': f'https://www.{domain}/',
+            'address': f'{rng.randint(1, 9999)} {rng.choice(STREETS)}, Tulsa, OK 741{rng.randint(0, 99):02d}',
+            'rating': round(rng.uniform(3, 5), 1) if i % 4 else None,
+            'place_id': f'ChIJ{i:012d}abcdefghij',
+            'source': SOURCES[0] if i % 10 else rng.choice(SOURCES),
+            'scraped_date': f'2025-01-01T{i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}.{i % 1000000:06d}',
+        })
+    return leads
+
+
+def load_json_python(paths):
+    rows = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            rows.extend(json.loads(line) for line in f)
+    return pyarrow.Table.from_pylist(rows)
+
+
+def load_json_arrow(paths):
+    return pyarrow.concat_tables([pyarrow.json.read_json(path) for path in paths])
+
+
+def load_csv(paths):
+    return pyarrow.concat_tables([pyarrow.csv.read_csv(path) for path in paths])
+
+
+def load_parquet(paths):
+    return pyarrow.concat_tables([pyarrow.parquet.read_table(path) for path in paths])
+
+
+FORMATS = [
+    # label, LEAD_FORMAT, LEAD_COMPRESSION / LEAD_PARQUET_COMPRESSION, loaders
+    ('jsonl', 'jsonl', None, [('json.loads', load_json_python), ('pyarrow.json', load_json_arrow)]),
+    ('jsonl gzip', 'jsonl', 'gzip', [('pyarrow.json', load_json_arrow)]),
+    ('csv', 'csv', None, [('pyarrow.csv', load_csv)]),
+    ('parquet snappy', 'parquet', 'snappy', [('pyarrow.parquet', load_parquet)]),
+    ('parquet zstd', 'parquet', 'zstd', [('pyarrow.parquet', load_parquet)]),
+]
+
+
+def write(leads, output_format, compression, directory, row_group_size):
+    options = {'compression': compression}
+    if output_format == 'parquet':
+        options = {'parquet_compression': compression, 'row_group_size': row_group_size}
+    writer = lead_writer(output_format, 'leads', columns_for(LeadItem), directory=directory,
+                         batch_size=500, **options)
+    for lead in leads:
+        writer.write(lead)
+    writer.close()
+    return writer.paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=1_000_000)
+    parser.add_argument('--row-group-size', type=int, default=50_000)
+    args = parser.parse_args()
+
+    leads = make_leads(args.items, random.Random(0))
+    sample = leads[:min(len(leads), 100_000)]
+    for label, output_format, compression, loaders in FORMATS:
+        directory = tempfile.mkdtemp(prefix='bench_export_')
+        try:
+            # Memory on a bounded sample first: tracemalloc slows the writer down a lot
+            tracemalloc.start()
+            write(sample, output_format, compression, directory, args.row_group_size)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            shutil.rmtree(directory)
+
+            start = time.perf_counter()
+            paths = write(leads, output_format, compression, directory, args.row_group_size)
+            elapsed = time.perf_counter() - start
+            size = sum(os.path.getsize(path) for path in paths)
+
+            print(f'{label:<15} {size / 1024 ** 2:8.1f} MiB  write {elapsed:6.2f} s  '
+                  f'peak {peak / 1024 ** 2:6.1f} MiB ({len(sample)} leads)')
+            for name, load in loaders:
+                start = time.perf_counter()
+                table = load(paths)
+                loaded = time.perf_counter() - start
+                assert table.num_rows == len(leads), (name, table.num_rows)
+                print(f'{"":<15} load with {name:<16} {loaded:6.2f} s')
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
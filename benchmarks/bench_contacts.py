@@ -0,0 +1,96 @@
+"""
+Contact extraction: BaseSpider's original methods vs scrape_machine.contacts.
+
+The original path runs clean_text (two uncompiled re.sub passes), then
+extract_emails and extract_phones, each rescanning the text. The new path
+is clean_text plus one extract_contact scan, and the batch API over the
+same pages.
+
+    python -m benchmarks.bench_contacts [--pages 50] [--size 300000]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from scrape_machine import contacts
+
+EMAIL = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
+PHONE = re.compile(r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}')
+
+WORDS = ('dental care family practice appointment insurance hours monday friday '
+         'our team doctor patients services contact location parking new welcome '
+         'copyright privacy policy terms menu home about').split()
+
+
+def make_page(size, rng):
+    """Text shaped like `body ::text` of a small-business site: mostly prose and
+    navigation, a few dates and prices, a handful of contact details."""
+    parts = []
+    length = 0
+    while length < size:
+        roll = rng.random()
+        if roll < 0.002:
+            part = f'info{rng.randint(1, 99)}@clinic{rng.randint(1, 9)}.com'
+        elif roll < 0.004:
+            part = f'({rng.randint(200, 999)}) {rng.randint(200, 999)}-{rng.randint(1000, 9999)}'
+        elif roll < 0.02:
+            part = f'{rng.randint(1, 12)}/{rng.randint(1, 28)}/20{rng.randint(10, 25)}'
+        elif roll < 0.1:
+            part = '\n\t\t'
+        else:
+            part = rng.choice(WORDS)
+        parts.append(part)
+        length += len(part) + 1
+    return ' '.join(parts)
+
+
+def original(text):
+    text = re.sub(r'[\r\n\t]+', ' ', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    return list(set(EMAIL.findall(text))), list(set(PHONE.findall(text)))
+
+
+def single_scan(text):
+    return contacts.extract_contact(contacts.clean_text(text))
+
+
+def batch(pages):
+    return contacts.extract_contacts([contacts.clean_text(page) for page in pages])
+
+
+def timed(label, func, pages, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(pages)
+        best = min(best, time.perf_counter() - start)
+    print(f'{label:<28} {best * 1000 / len(pages):8.2f} ms/page')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=50)
+    parser.add_argument('--size', type=int, default=300_000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    pages = [make_page(args.size, rng) for _ in range(args.pages)]
+    # Pages without an "@" are common (phone-only sites)
+    pages += [page.replace('@', ' at ') for page in pages[: args.pages // 2]]
+
+    for page in pages:
+        old_emails, old_phones = original(page)
+        new = single_scan(page)
+        assert set(old_emails) == set(new.emails)
+        assert {phone.strip() for phone in old_phones} == set(new.phones)
+
+    timed('original methods', lambda ps: [original(p) for p in ps], pages, args.repeat)
+    timed('extract_contact', lambda ps: [single_scan(p) for p in ps], pages, args.repeat)
+    timed('extract_contacts (batch)', batch, pages, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
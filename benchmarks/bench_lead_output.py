@@ -0,0 +1,95 @@
+"""
+Throughput of the lead output pipelines.
+
+Compares the original LeadPipeline (json.dumps + write per item on the
+calling thread) with the current LeadPipeline's background LeadWriter and
+with LeadSQLitePipeline, including a second pass that upserts the same
+leads. "in process_item" is the time spent on the reactor thread; "total"
+also includes the final flush in close_spider.
+
+    python -m benchmarks.bench_lead_output [--items 100000]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from itemadapter import ItemAdapter
+from scrapy import Spider
+
+from scrape_machine.items import LeadItem
+from scrape_machine.pipelines import LeadPipeline, LeadSQLitePipeline
+
+
+def make_leads(count):
+    return [
+        LeadItem(
+            name=f'Business {i}',
+            company=f'Business {i}',
+            phone=f'918-555-{i % 10000:04d}' if i % 3 else None,
+            website=f'https://www.business{i}.com/' if i % 2 else None,
+            address=f'{i} Main St, Tulsa, OK',
+            source='google_maps',
+            scraped_date='2025-01-01T00:00:00',
+        )
+        for i in range(count)
+    ]
+
+
+class LegacyLeadPipeline(LeadPipeline):
+    """The original LeadPipeline: one json.dumps and write() per item."""
+
+    def open_spider(self, spider):
+        self.file = open(os.path.join(self.output_dir, 'legacy.json'), 'w')
+
+    def close_spider(self, spider):
+        self.file.close()
+
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if adapter.get('phone'):
+            phone = ''.join(filter(str.isdigit, adapter['phone']))
+            if len(phone) == 10:
+                adapter['phone'] = f"{phone[:3]}-{phone[3:6]}-{phone[6:]}"
+            else:
+                adapter['phone'] = None
+        for field in adapter.field_names():
+            if isinstance(adapter.get(field), str):
+                adapter[field] = adapter[field].strip()
+        self.file.write(json.dumps(ItemAdapter(item).asdict()) + "\n")
+        return item
+
+
+def run(label, pipeline, count, spider):
+    leads = make_leads(count)
+    pipeline.open_spider(spider)
+    start = time.perf_counter()
+    for item in leads:
+        pipeline.process_item(item, spider)
+    hot = time.perf_counter() - start
+    pipeline.close_spider(spider)
+    total = time.perf_counter() - start
+    print(f'{label:<30} in process_item {hot:7.3f}s ({count / hot:10,.0f}/s)  '
+          f'total {total:7.3f}s ({count / total:10,.0f}/s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--items', type=int, default=100_000)
+    args = parser.parse_args()
+
+    spider = Spider(name='bench')
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'leads.sqlite3')
+        run('original LeadPipeline', LegacyLeadPipeline(output_dir=directory), args.items, spider)
+        run('LeadPipeline (LeadWriter)', LeadPipeline(output_dir=directory), args.items, spider)
+        run('LeadSQLitePipeline (insert)', LeadSQLitePipeline(db_path), args.items, spider)
+        run('LeadSQLitePipeline (upsert)', LeadSQLitePipeline(db_path), args.items, spider)
+        run('SQLite, commit per row', LeadSQLitePipeline(db_path + '.single', batch_size=1),
+            args.items // 10, spider)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+"""
+Maps search page decoding: the original regex slicing vs maps_state.
+
+    python -m benchmarks.bench_maps_state [--places 200] [--filler 20000]
+    python -m benchmarks.bench_maps_state --file debug_captures/google_maps/<capture>.html.gz
+"""
+
+import argparse
+import gzip
+import json
+import random
+import re
+import time
+
+from scrape_machine import maps_state
+from .fixtures import maps_place, maps_search_page
+
+
+def original(text):
+    """The original parse_initial_response extraction, returning names found."""
+    names = []
+    data_section = re.search(r'window\.APP_INITIALIZATION_STATE=([^;]+);', text)
+    if not data_section:
+        return names
+    for array in re.findall(r'\[\[.*?\]\]', data_section.group(1)):
+        try:
+            data = json.loads(array)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(data, list) and data and isinstance(data[0], list):
+            for business in data:
+                if isinstance(business, list) and len(business) >= 5:
+                    name = next((x for x in business if isinstance(x, str) and len(x) > 3), None)
+                    if name:
+                        names.append(name)
+    return names
+
+
+def decoded(text):
+    return [place['name'] for place in maps_state.iter_page_places(text)]
+
+
+def timed(label, func, text, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(text)
+        best = min(best, time.perf_counter() - start)
+    print(f'{label:<12} {best * 1000:9.2f} ms  {len(result):5d} businesses')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--file', help='a saved Maps search page (or a gzipped debug capture) to use instead of a synthetic one')
+    parser.add_argument('--places', type=int, default=200)
+    parser.add_argument('--filler', type=int, default=20_000,
+                        help='unrelated state entries, to make the page realistically large')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.file:
+        opener = gzip.open if args.file.endswith('.gz') else open
+        with opener(args.file, 'rt', encoding='utf-8') as f:
+            text = f.read()
+    else:
+        rng = random.Random(0)
+        text = maps_search_page([maps_place(i, rng) for i in range(args.places)], 'token', args.filler)
+    print(f'page size {len(text) / 1024:.0f} KiB')
+    timed('original', original, text, args.repeat)
+    timed('maps_state', decoded, text, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Reactor lag and throughput of Maps page parsing, inline vs in the offload pool.
+
+Parses --pages synthetic Maps search pages with maps_state.parse_search_page,
+first inline on the reactor thread (one page per reactor turn, as Scrapy
+runs callbacks), then through an OffloadPool of 1..--workers processes.
+A LoopingCall ticking every --tick ms measures how late the reactor gets
+to it: that lag is how long downloads, timers and other callbacks wait.
+The second table compares moving bodies of several sizes to a worker
+through shared memory and pickled through the pool's pipe.
+
+    python -m benchmarks.bench_offload [--pages 200] [--places 40] [--filler 20000] [--workers 4]
+
+Throughput only scales with workers up to the number of free cores.
+"""
+
+import argparse
+import os
+import random
+import time
+
+from scrapy.http import HtmlResponse
+from twisted.internet import defer, reactor, task
+
+from scrape_machine import maps_state
+from scrape_machine.offload import OffloadPool
+from .fixtures import maps_place, maps_search_page
+
+
+def body_length(response):
+    """Stand-in job for the transfer table: only touches the body."""
+    return len(response.body)
+
+
+class LagProbe:
+    """How late a LoopingCall of ``interval`` seconds fires, tick by tick."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.lags = []
+        self.last = None
+        self.loop = task.LoopingCall(self.tick)
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.lags.append(max(now - self.last - self.interval, 0.0))
+        self.last = now
+
+    def start(self):
+        self.loop.start(self.interval)
+
+    def stop(self):
+        self.loop.stop()
+        lags = sorted(self.lags) or [0.0]
+        return lags[min(len(lags) - 1, int(len(lags) * 0.99))], lags[-1]
+
+
+@defer.inlineCallbacks
+def parse_inline(responses):
+    for response in responses:
+        yield task.deferLater(reactor, 0, maps_state.parse_search_page, response)
+
+
+def parse_offloaded(pool, responses):
+    return defer.gatherResults([pool.submit_response(maps_state.parse_search_page, r) for r in responses],
+                               consumeErrors=True)
+
+
+@defer.inlineCallbacks
+def measure(label, run, tick):
+    probe = LagProbe(tick)
+    probe.start()
+    start = time.perf_counter()
+    yield run()
+    elapsed = time.perf_counter() - start
+    p99, worst = probe.stop()
+    return label, elapsed, p99, worst
+
+
+@defer.inlineCallbacks
+def warm(pool, workers):
+    """Start the workers before timing, as a crawl's first pages would."""
+    yield defer.gatherResults([pool.submit(time.sleep, 0.2) for _ in range(workers)])
+
+
+@defer.inlineCallbacks
+def main(args):
+    rng = random.Random(0)
+    responses = []
+    for n in range(args.pages):
+        places = [maps_place(n * args.places + i, rng) for i in range(args.places)]
+        body = maps_search_page(places, next_token=f'token{n}', filler=args.filler).encode()
+        responses.append(HtmlResponse(f'https://www.google.com/maps/search/doctor/page{n}', body=body,
+                                      headers={'Content-Type': 'text/html; charset=utf-8'}))
+    size = sum(len(r.body) for r in responses) / len(responses)
+    print(f'{len(responses)} pages of {size / 1024:.0f} KiB, {os.cpu_count()} cores, tick {args.tick * 1000:g} ms')
+    print(f'{"":<12} {"pages/s":>9} {"p99 lag":>10} {"max lag":>10}')
+
+    results = [(yield measure('inline', lambda: parse_inline(responses), args.tick))]
+    workers = 1
+    while workers <= args.workers:
+        pool = OffloadPool(workers)
+        yield warm(pool, workers)
+        results.append((yield measure(f'{workers} workers', lambda: parse_offloaded(pool, responses), args.tick)))
+        pool.close()
+        workers *= 2
+    for label, elapsed, p99, worst in results:
+        print(f'{label:<12} {len(responses) / elapsed:9.1f} {p99 * 1000:8.1f} ms {worst * 1000:8.1f} ms')
+
+    print(f'\n{"body":<8} {"shared memory":>14} {"pickled":>10}   (per call, 1 worker)')
+    for kib in (16, 256, 1024, 4096, 32768):
+        body = b'x' * (kib * 1024)
+        response = HtmlResponse('https://example.com/', body=body)
+        row = []
+        for shm_min_bytes in (0, len(body) + 1):
+            pool = OffloadPool(1, shm_min_bytes=shm_min_bytes)
+            yield warm(pool, 1)
+            calls = max(5, min(200, 64 * 1024 // kib))
+            start = time.perf_counter()
+            for _ in range(calls):
+                yield pool.submit_response(body_length, response)
+            row.append((time.perf_counter() - start) / calls)
+            pool.close()
+        print(f'{kib:>5} KiB {row[0] * 1000:11.2f} ms {row[1] * 1000:7.2f} ms')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=200)
+    parser.add_argument('--places', type=int, default=40)
+    parser.add_argument('--filler', type=int, default=20000, help='config entries padding each page')
+    parser.add_argument('--workers', type=int, default=4, help='largest pool to try (1, 2, 4, ...)')
+    parser.add_argument('--tick', type=float, default=0.005, help='lag probe interval in seconds')
+    args = parser.parse_args()
+    d = main(args)
+    d.addErrback(lambda failure: failure.printTraceback())
+    d.addBoth(lambda _: reactor.stop())
+    reactor.run()
@@ -0,0 +1,80 @@
+"""
+Per-page time and peak memory of contact scanning on business websites.
+
+"body ::text" is the original approach: join every text node under <body>
+(inline scripts and JSON included) and scan it. page_contacts reads links,
+structured data and footer/header regions first and only then walks the
+body text, skipping scripts and styles, up to a character budget. Peak
+memory is measured with tracemalloc, so it counts Python objects only,
+not the parsed lxml tree both approaches share.
+
+    python -m benchmarks.bench_page_text [--pages 20] [--script-kb 800]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from scrapy.http import HtmlResponse
+
+from scrape_machine.contacts import extract_contact, page_contacts
+
+WORDS = 'care team family practice appointment insurance hours welcome our services location'.split()
+
+
+def make_page(i, script_kb, rng, footer=True):
+    """A page builder-style site: big inline app state and CSS, long body, contacts in the footer."""
+    state = {'products': [{'id': n, 'title': ' '.join(rng.choices(WORDS, k=8)), 'sku': f'{n:08d}'}
+                          for n in range(script_kb * 1024 // 120)]}
+    css = '.c%d{margin:0;padding:%dpx}' * 2000 % tuple(v for n in range(2000) for v in (n, n % 9))
+    paragraphs = ''.join(f'<p>{" ".join(rng.choices(WORDS, k=40))}</p>' for _ in range(400))
+    contact = (f'<footer><address>{i} Main St, Tulsa, OK<br>Call (918) 555-{i % 10000:04d} or write '
+               f'<a href="mailto:office@business{i}.com">office@business{i}.com</a></address></footer>')
+    html = (f'<html><head><style>{css}</style></head><body>'
+            f'<header><nav>{"".join(f"<a href=/p{n}>{w}</a>" for n, w in enumerate(WORDS))}</nav></header>'
+            f'<script>window.__STATE__ = {json.dumps(state)};</script>'
+            f'<main>{paragraphs}</main>{contact if footer else ""}</body></html>')
+    return html.encode()
+
+
+def original(response):
+    text = ' '.join(response.css('body ::text').getall())
+    return extract_contact(text)
+
+
+def measure(label, func, bodies):
+    elapsed = 0.0
+    peak = 0
+    for i, body in enumerate(bodies):
+        response = HtmlResponse(f'https://business{i}.example/', body=body)
+        tracemalloc.start()
+        start = time.perf_counter()
+        func(response)
+        elapsed += time.perf_counter() - start
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print(f'{label:<28} {elapsed * 1000 / len(bodies):8.2f} ms/page  peak {peak / 1024 / 1024:7.1f} MiB')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--script-kb', type=int, default=800)
+    parser.add_argument('--budget', type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    with_footer = [make_page(i, args.script_kb, rng) for i in range(args.pages)]
+    without = [make_page(i, args.script_kb, rng, footer=False) for i in range(args.pages)]
+    print(f'average page size {sum(map(len, with_footer)) / len(with_footer) / 1024:.0f} KiB '
+          '(times include HTML parsing)')
+    measure('body ::text', original, with_footer)
+    measure('page_contacts', lambda r: page_contacts(r, args.budget), with_footer)
+    measure('body ::text, no contacts', original, without)
+    measure('page_contacts, no contacts', lambda r: page_contacts(r, args.budget), without)
+
+
+if __name__ == '__main__':
+    main()
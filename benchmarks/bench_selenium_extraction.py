@@ -0,0 +1,138 @@
+"""
+Selenium listing extraction: per-field find_element vs one execute_script.
+
+Serves a stub Maps results page from a local HTTP server. The page has a
+feed of div.Nv2PK cards that grows by --batch cards per scroll up to
+--listings, then shows the end-of-list marker. Every third card has no
+phone and every second has no website, as on real result pages. Needs
+Chrome and chromedriver.
+
+    python -m benchmarks.bench_selenium_extraction [--listings 120] [--implicit-wait 10]
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from scrapy.settings import Settings
+from selenium.webdriver.common.by import By
+
+from scrape_machine.spiders.google_maps_selenium import GoogleMapsSeleniumSpider
+
+PAGE = """<!DOCTYPE html>
+<html><body>
+<div role="feed" style="height: 600px; overflow-y: scroll"></div>
+<script>
+const total = %(listings)d, batch = %(batch)d;
+const feed = document.querySelector("div[role='feed']");
+function card(i) {
+  const phone = i %% 3 ? `<span class="UsdlK">(918) 555-${String(1000 + i)}</span>` : '';
+  const site = i %% 2 ? `<a data-item-id="authority" href="https://business${i}.example/">Website</a>` : '';
+  return `<div class="Nv2PK" style="height: 120px">
+    <div class="qBF1Pd">Business ${i}</div>
+    <span class="MW4etd">4.${i %% 10}</span>
+    <div class="W4Efsd"><span>Doctor</span><span>${i} Main St</span></div>
+    ${phone}${site}</div>`;
+}
+function more() {
+  const count = feed.children.length;
+  if (count >= total) {
+    if (!document.querySelector('span.HlvSq')) {
+      feed.insertAdjacentHTML('beforeend', "<span class='HlvSq'>You've reached the end of the list.</span>");
+    }
+    return;
+  }
+  let html = '';
+  for (let i = count; i < Math.min(total, count + batch); i++) html += card(i);
+  feed.insertAdjacentHTML('beforeend', html);
+}
+more();
+feed.addEventListener('scroll', () => setTimeout(more, 300));
+</script>
+</body></html>
+"""
+
+
+def serve(page):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.end_headers()
+            self.wfile.write(page.encode())
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def per_field(driver):
+    """The original extract_listing_data loop: four find_element calls per card."""
+    leads = []
+    for listing in driver.find_elements(By.CSS_SELECTOR, 'div.Nv2PK'):
+        lead = {'name': listing.find_element(By.CSS_SELECTOR, 'div.qBF1Pd').text}
+        for field, selector in (('address', 'div.W4Efsd span:last-child'), ('phone', 'span.UsdlK')):
+            try:
+                lead[field] = listing.find_element(By.CSS_SELECTOR, selector).text
+            except Exception:
+                lead[field] = None
+        try:
+            lead['website'] = listing.find_element(
+                By.CSS_SELECTOR, "a[data-item-id='authority']").get_attribute('href')
+        except Exception:
+            lead['website'] = None
+        leads.append(lead)
+    return leads
+
+
+def fixed_scroll(driver, scrolls=30, pause=2.0):
+    """The original scroll_results: always 30 scrolls, 2 s apart."""
+    panel = driver.find_element(By.CSS_SELECTOR, "div[role='feed']")
+    for _ in range(scrolls):
+        driver.execute_script('arguments[0].scrollTo(0, arguments[0].scrollHeight);', panel)
+        time.sleep(pause)
+
+
+def timed(label, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    count = f'{len(result):4d} listings' if isinstance(result, list) else ''
+    print(f'{label:<28} {elapsed:8.2f}s  {count}')
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--listings', type=int, default=120)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--implicit-wait', type=float, default=10)
+    parser.add_argument('--skip-fixed-scroll', action='store_true',
+                        help="don't time the original 60 s scroll loop")
+    args = parser.parse_args()
+
+    server = serve(PAGE % {'listings': args.listings, 'batch': args.batch})
+    url = f'http://127.0.0.1:{server.server_port}/'
+    spider = GoogleMapsSeleniumSpider(headless=True)
+    spider.settings = Settings({'SELENIUM_SCROLL_PAUSE': 0.5})
+    driver = spider.make_driver()
+    driver.implicitly_wait(args.implicit_wait)
+    try:
+        if not args.skip_fixed_scroll:
+            driver.get(url)
+            timed('scroll: fixed 30 x 2 s', lambda: fixed_scroll(driver))
+        driver.get(url)
+        timed('scroll: until feed stops', lambda: spider.scroll_results(driver))
+        timed('extract: execute_script', lambda: spider.extract_listings(driver))
+        timed(f'extract: find_element ({args.implicit_wait:g}s wait)', lambda: per_field(driver))
+    finally:
+        driver.quit()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+"""
+Startup cost of the spider loader, measured with ``python -X importtime``.
+
+Runs `scrapy list`, and a script loading the google spider the way
+`scrapy crawl google` does, with Scrapy's default SpiderLoader and with
+LazySpiderLoader. Each run is repeated --runs times; the report gives the
+median wall time, the median total import time and whether Selenium or
+webdriver_manager got imported.
+
+    python -m benchmarks.bench_startup [--runs 5] [--check]
+
+With --check the script exits non-zero if LazySpiderLoader imports
+Selenium or webdriver_manager in either scenario, or if its median import
+time exceeds --max-import-ms.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+LOADERS = {
+    'default': 'scrapy.spiderloader.SpiderLoader',
+    'lazy': 'scrape_machine.spiderloader.LazySpiderLoader',
+}
+HEAVY = ('selenium', 'webdriver_manager')
+
+LOAD_SPIDER = """
+import sys
+from scrapy.utils.misc import load_object
+from scrapy.utils.project import get_project_settings
+settings = get_project_settings()
+settings.set('SPIDER_LOADER_CLASS', sys.argv[1], priority='cmdline')
+load_object(settings['SPIDER_LOADER_CLASS']).from_settings(settings.frozencopy()).load('google')
+"""
+
+
+def import_profile(stderr):
+    """Total top-level import time in microseconds and the set of top-level packages imported."""
+    total, packages = 0, set()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        packages.add(name.strip().split('.')[0])
+        # Nested imports are indented further and already counted in their parent's cumulative time
+        if len(name) - len(name.lstrip()) == 1:
+            total += int(cumulative)
+    return total, packages
+
+
+def run(command, loader, runs):
+    walls, imports, packages = [], [], set()
+    for _ in range(runs):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, '-X', 'importtime', *command(loader)],
+                              capture_output=True, text=True)
+        walls.append(time.perf_counter() - start)
+        if proc.returncode:
+            raise SystemExit(proc.stderr[-2000:])
+        total, found = import_profile(proc.stderr)
+        imports.append(total)
+        packages |= found
+    return {
+        'wall_ms': round(statistics.median(walls) * 1000),
+        'import_ms': round(statistics.median(imports) / 1000),
+        'heavy_imports': sorted(packages.intersection(HEAVY)),
+    }
+
+
+SCENARIOS = {
+    'scrapy list': lambda loader: ['-m', 'scrapy', 'list', '-s', f'SPIDER_LOADER_CLASS={loader}'],
+    'load google spider': lambda loader: ['-c', LOAD_SPIDER, loader],
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--check', action='store_true', help='fail if the lazy loader regresses')
+    parser.add_argument('--max-import-ms', type=float, default=1500,
+                        help='import time budget for the lazy loader under --check')
+    args = parser.parse_args()
+
+    results = {}
+    for scenario, command in SCENARIOS.items():
+        results[scenario] = {label: run(command, loader, args.runs) for label, loader in LOADERS.items()}
+        for label, result in results[scenario].items():
+            print(f'{scenario:<20} {label:<8} wall {result["wall_ms"]:6d} ms  imports {result["import_ms"]:6d} ms  '
+                  f'heavy: {", ".join(result["heavy_imports"]) or "-"}')
+
+    if args.check:
+        lazy = [scenario['lazy'] for scenario in results.values()]
+        ok = all(not r['heavy_imports'] and r['import_ms'] <= args.max_import_ms for r in lazy)
+        print(json.dumps(results))
+        print('PASS' if ok else 'FAIL')
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Synthetic pages shaped like the responses the spiders parse."""
+
+import json
+import random
+
+from scrape_machine.maps_state import STATE_MARKER, XSSI_PREFIX
+
+
+WORDS = ('dental care family practice appointment insurance hours monday friday '
+         'our team doctor patients services contact location parking new welcome').split()
+
+
+def maps_place(i, rng=random):
+    """A place array with the fields at the positions Maps uses."""
+    place = [None] * 180
+    place[4] = [None] * 7 + [round(rng.uniform(3, 5), 1), rng.randint(1, 500)]
+    place[7] = [f'https://www.business{i}.com/', f'business{i}.com']
+    place[9] = [None, None, 36.15 + rng.uniform(-0.2, 0.2), -95.99 + rng.uniform(-0.2, 0.2)]
+    place[11] = f'Business {i} Family Practice'
+    place[13] = ['Doctor', 'Medical clinic']
+    place[18] = f'Business {i}, {i} Main St, Tulsa, OK 74103'
+    place[39] = f'{i} Main St, Tulsa, OK 74103'
+    place[78] = f'ChIJ{i:020d}'
+    place[178] = [[f'(918) 555-{i % 10000:04d}', [None, [f'+1918555{i % 10000:04d}']]]]
+    return place
+
+
+def maps_payload(places, next_token=None):
+    """The ")]}'"-guarded search payload: each entry wraps a place at index 14."""
+    entries = [[None] * 14 + [place] for place in places]
+    payload = [['query', entries, None, [f'"VQF1hc":"{next_token}"' if next_token else None]]]
+    return XSSI_PREFIX + '\n' + json.dumps(payload)
+
+
+def maps_search_page(places, next_token=None, filler=0):
+    """A Maps search page embedding the payload in APP_INITIALIZATION_STATE."""
+    state = [
+        [[15000.0, -95.99, 36.15], [0, 0, 0], [1024, 768], 13.1],
+        [['config', i, [i, i + 1]] for i in range(filler)],
+        None,
+        [None, None, maps_payload(places, next_token)],
+    ]
+    return (
+        '<!DOCTYPE html><html><head><script>'
+        f'{STATE_MARKER}{json.dumps(state)};window.APP_FLAGS=[];'
+        '</script></head><body></body></html>'
+    )
+
+
+def serp_page(start, results=10, rng=random):
+    """A Google results page: LinkedIn profiles and business sites with contact snippets."""
+    blocks = []
+    for n in range(start, start + results):
+        if n % 2:
+            link = f'https://www.linkedin.com/in/person-{n}'
+            title = f'Person {n} - Founder & CEO - Company {n} | LinkedIn'
+        else:
+            link = f'https://www.business{n}.example/'
+            title = f'Company {n} | Home'
+        snippet = (f'Founder at Company {n}. Reach me at person{n}@company{n}.example or '
+                   f'(918) 555-{n % 10000:04d}. ' + ' '.join(rng.choices(WORDS, k=30)))
+        blocks.append(
+            f'<div class="g"><a href="{link}"><h3>{title}</h3></a>'
+            f'<div class="VwiC3b"><span>{snippet}</span></div></div>'
+        )
+    filler = ''.join(f'<script>var s{n} = "{"x" * 2000}";</script>' for n in range(30))
+    return f'<html><head>{filler}</head><body><div id="search">{"".join(blocks)}</div></body></html>'
+
+
+def linkedin_profile(slug):
+    return (
+        f'<html><body><h1>{slug}</h1>'
+        f'<h2 class="top-card-layout__headline">Founder &amp; CEO</h2>'
+        f'<h4 class="top-card-company-name">Company {slug}</h4></body></html>'
+    )
+
+
+def business_page(host, path, rng=random):
+    """A small-business site. Half of them list an email on /contact only."""
+    n = int(''.join(ch for ch in host if ch.isdigit()) or 0)
+    paragraphs = ''.join(f'<p>{" ".join(rng.choices(WORDS, k=60))}</p>' for _ in range(60))
+    email = f'<a href="mailto:office@{host}">office@{host}</a>'
+    if path in ('', '/'):
+        footer = f'<footer>Call (918) 555-{n % 10000:04d} {email if n % 2 else ""}</footer>'
+        links = '<a href="/about">About</a><a href="/contact">Contact us</a>'
+        return f'<html><body><nav>{links}</nav>{paragraphs}{footer}</body></html>'
+    if path.startswith('/contact'):
+        return f'<html><body><h1>Contact</h1>{paragraphs}<address>{email}</address></body></html>'
+    if path.startswith('/about'):
+        return f'<html><body><h1>About</h1>{paragraphs}</body></html>'
+    return None
+
@@ -0,0 +1,194 @@
+"""
+Exercise ProxyPoolMiddleware against local stand-in proxies.
+
+Five stand-in proxies run on 127.0.0.1, each answering requests itself
+(there is no upstream) and naming itself in an X-Proxy header:
+
+    fast     answers after --latency seconds
+    slow     answers after ten times that
+    flaky    answers 502 half of the time
+    blocked  answers 429 every time
+    dead     refuses connections
+
+A crawl of --pages pages then goes through the pool. Half of the pages
+belong to two sticky sessions (``meta['proxy_session']``). The report gives
+each proxy's share of requests, its quarantines and final score, and which
+proxies served each session.
+
+    python -m benchmarks.proxy_simulator [--pages 300] [--check]
+
+With --check the script exits non-zero unless every page was fetched, the
+fast proxy served the most pages, and the blocked and dead proxies were
+quarantined.
+"""
+
+import argparse
+import json
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BEHAVIOURS = ('fast', 'slow', 'flaky', 'blocked', 'dead')
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def serve(behaviour, latency):
+    if behaviour == 'dead':
+        return None, free_port()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latency * 10 if behaviour == 'slow' else latency)
+            status = 200
+            if behaviour == 'blocked':
+                status = 429
+            elif behaviour == 'flaky' and random.random() < 0.5:
+                status = 502
+            body = f'<html><body>{behaviour}</body></html>'.encode()
+            self.send_response(status)
+            self.send_header('X-Proxy', behaviour)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, server.server_port
+
+
+def run_child(proxies, pages):
+    """Crawl through the pool and print the outcome as JSON."""
+    import scrapy
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    names = {f'127.0.0.1:{port}': behaviour for behaviour, port in proxies.items()}
+    sessions = {}
+
+    class SimulationSpider(scrapy.Spider):
+        name = 'proxy_simulation'
+
+        def start_requests(self):
+            for i in range(pages):
+                meta = {'proxy_session': 'ab'[i % 2]} if i % 4 < 2 else {}
+                yield scrapy.Request(f'http://origin.test/page/{i}', meta=meta, dont_filter=True)
+
+        def parse(self, response):
+            self.crawler.stats.inc_value('simulation/pages')
+            session = response.meta.get('proxy_session')
+            if session:
+                sessions.setdefault(session, set()).add(response.headers.get('X-Proxy', b'').decode())
+
+    settings = get_project_settings()
+    # Stub pages must never land in the real cache, even if it gets enabled
+    cache_dir = tempfile.mkdtemp(prefix='httpcache_')
+    settings.setdict({
+        'SPIDER_MODULES': [],
+        'HTTPCACHE_ENABLED': False,
+        'HTTPCACHE_DIR': cache_dir,
+        'DEBUG_CAPTURE_ENABLED': False,
+        'LOG_LEVEL': 'ERROR',
+        'TELNETCONSOLE_ENABLED': False,
+        'CONCURRENT_REQUESTS': 16,
+        'ITEM_PIPELINES': {},
+        'DOWNLOAD_TIMEOUT': 5,
+        'RETRY_TIMES': 10,
+        'POLITENESS_DELAY': (0, 0),
+        'POLITENESS_BACKOFF_BASE': 0.05,
+        'POLITENESS_BACKOFF_MAX': 0.2,
+        'POLITENESS_MAX_RETRIES': 10,
+        'AIMD_ENABLED': False,
+        'PROXY_LIST': [f'http://{name}' for name in names],
+        'PROXY_CONCURRENCY': 4,
+        'PROXY_COOLDOWN': 1,
+        'PROXY_MAX_COOLDOWN': 8,
+    }, priority='cmdline')
+    process = CrawlerProcess(settings)
+    crawler = process.create_crawler(SimulationSpider)
+    process.crawl(crawler)
+    process.start()
+    shutil.rmtree(cache_dir, ignore_errors=True)
+
+    stats = crawler.stats.get_stats()
+    report = {}
+    for name, behaviour in names.items():
+        counts = {outcome: stats.get(f'proxies/{name}/{outcome}', 0) for outcome in ('ok', 'error', 'block')}
+        report[behaviour] = {
+            **counts,
+            'quarantined': stats.get(f'proxies/{name}/quarantined', 0),
+            'latency_ms': stats.get(f'proxies/{name}/latency_ms'),
+            'score': stats.get(f'proxies/{name}/score'),
+        }
+    print(json.dumps({
+        'pages': stats.get('simulation/pages', 0),
+        'elapsed_s': round(stats.get('elapsed_time_seconds') or 0.0, 2),
+        'waited': stats.get('proxies/waited', 0),
+        'proxies': report,
+        'sessions': {session: sorted(used) for session, used in sessions.items()},
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--pages', type=int, default=300)
+    parser.add_argument('--latency', type=float, default=0.02)
+    parser.add_argument('--check', action='store_true', help='fail unless the pool routes around bad proxies')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(json.loads(args.child), args.pages)
+        return
+
+    servers, proxies = [], {}
+    for behaviour in BEHAVIOURS:
+        server, port = serve(behaviour, args.latency)
+        proxies[behaviour] = port
+        if server is not None:
+            servers.append(server)
+    try:
+        proc = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.proxy_simulator', '--child', json.dumps(proxies),
+             '--pages', str(args.pages)],
+            capture_output=True, text=True,
+        )
+    finally:
+        for server in servers:
+            server.shutdown()
+    try:
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+    except (IndexError, ValueError):
+        print(proc.stderr[-2000:], file=sys.stderr)
+        sys.exit(proc.returncode or 1)
+    print(json.dumps(result, indent=2))
+
+    if args.check:
+        served = {behaviour: stats['ok'] for behaviour, stats in result['proxies'].items()}
+        ok = (result['pages'] == args.pages
+              and max(served, key=served.get) == 'fast'
+              and result['proxies']['blocked']['quarantined'] > 0
+              and result['proxies']['dead']['quarantined'] > 0)
+        print('PASS' if ok else 'FAIL')
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,348 @@
+"""
+Offline end-to-end benchmark: run the spiders against a local stand-in for the web.
+
+A local HTTP server plays Google Search, Google Maps, LinkedIn and the
+business websites, from a recorded corpus (--corpus) or from synthetic
+pages. Every spider runs in its own process with a download handler that
+sends all http(s) requests to that server, and reports requests/s,
+items/s, callback CPU time, pipeline time and peak RSS as one JSON
+document.
+
+    python -m benchmarks.replay [--spiders google google_maps] [--output results.json]
+
+A recorded corpus is a directory with an index.json mapping URLs to
+{"file": ..., "status": 200, "content_type": "text/html"}; URLs missing
+from it fall back to the same URL without its query string, then 404.
+"""
+
+import argparse
+import json
+import os
+import re
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from . import fixtures
+
+SPIDERS = ('google', 'google_maps', 'google_maps_selenium')
+
+
+class Corpus:
+    """Maps original URLs to (status, content type, body)."""
+
+    def __init__(self, directory=None, maps_pages=5, places_per_page=40):
+        self.directory = directory
+        self.index = {}
+        if directory:
+            with open(os.path.join(directory, 'index.json')) as f:
+                self.index = json.load(f)
+        self.maps_pages = maps_pages
+        self.places_per_page = places_per_page
+        self.lock = threading.Lock()
+        self.cache = {}
+
+    def lookup(self, url):
+        if self.index:
+            entry = self.index.get(url) or self.index.get(url.split('?')[0])
+            if entry is None:
+                return None
+            with open(os.path.join(self.directory, entry['file']), 'rb') as f:
+                body = f.read()
+            return entry.get('status', 200), entry.get('content_type', 'text/html'), body
+        with self.lock:
+            if url not in self.cache:
+                self.cache[url] = self.synthetic(url)
+        body = self.cache[url]
+        if body is None:
+            return None
+        return 200, 'text/html; charset=utf-8', body.encode('utf-8')
+
+    def synthetic(self, url):
+        parts = urlsplit(url)
+        host = parts.hostname or ''
+        rng = fixtures.random.Random(url)
+        if host.endswith('google.com') and parts.path.startswith('/maps/search'):
+            tokens = re.findall(r'pageToken=page(\d+)', parts.query)
+            page = int(tokens[-1]) if tokens else 0
+            return self.maps_page(page, rng)
+        if host.endswith('google.com') and parts.path == '/search':
+            start = int(parse_qs(parts.query).get('start', ['0'])[0])
+            return fixtures.serp_page(start, rng=rng)
+        if host.endswith('linkedin.com') and parts.path.startswith('/in/'):
+            return fixtures.linkedin_profile(parts.path[4:])
+        if host.endswith('.example'):
+            return fixtures.business_page(host, parts.path, rng)
+        if parts.path.startswith('/stub/maps'):
+            from .bench_selenium_extraction import PAGE
+            return PAGE % {'listings': self.places_per_page * self.maps_pages, 'batch': 20}
+        return None
+
+    def maps_page(self, page, rng):
+        places = []
+        for i in range(page * self.places_per_page, (page + 1) * self.places_per_page):
+            place = fixtures.maps_place(i, rng)
+            # Chains: every fourth place shares its website with the previous one
+            chain = i - 1 if i % 4 == 3 else i
+            place[7] = [f'https://www.business{chain}.example/location-{i}', '']
+            places.append(place)
+        html = fixtures.maps_search_page(places, filler=5000)
+        if page + 1 < self.maps_pages:
+            html = html.replace('</body>', f'<script>{{"VQF1hc":"page{page + 1}"}}</script></body>')
+        return html
+
+
+def serve(corpus):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            # /<scheme>/<host>/<path>?<query> -> <scheme>://<host>/<path>?<query>
+            scheme, _, rest = self.path.lstrip('/').partition('/')
+            found = corpus.lookup(f'{scheme}://{rest}')
+            status, content_type, body = found or (404, 'text/html', b'<html>not found</html>')
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class ReplayDownloadHandler:
+    """Download handler that fetches every http(s) URL from the replay server."""
+
+    lazy = False
+
+    def __init__(self, settings, crawler=None):
+        from scrapy.core.downloader.handlers.http11 import HTTP11DownloadHandler
+        self.http = HTTP11DownloadHandler(settings, crawler)
+        self.server = settings['REPLAY_SERVER']
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.settings, crawler)
+
+    def download_request(self, request, spider):
+        parts = urlsplit(request.url)
+        local = f'{self.server}/{parts.scheme}/{parts.netloc}{parts.path or "/"}'
+        if parts.query:
+            local += f'?{parts.query}'
+        d = self.http.download_request(request.replace(url=local), spider)
+        d.addCallback(lambda response: response.replace(url=request.url))
+        return d
+
+    def close(self):
+        return self.http.close()
+
+
+class ReplayProbe:
+    """
+    Spider middleware collecting callback CPU time.
+
+    As the outermost spider middleware it wraps the raw callback output, so
+    the process time spent producing each result is the callback's own.
+    Pipeline time comes from the crawler's metrics (see TimedPipelineManager).
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.callback_cpu = {}
+        crawler.replay_probe = self
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    def charge(self, response, start):
+        callback = getattr(response.request, 'callback', None)
+        name = getattr(callback, '__name__', 'parse')
+        self.callback_cpu[name] = self.callback_cpu.get(name, 0.0) + time.process_time() - start
+
+    def process_spider_output(self, response, result, spider):
+        iterator = iter(result)
+        while True:
+            start = time.process_time()
+            try:
+                value = next(iterator)
+            except StopIteration:
+                self.charge(response, start)
+                return
+            self.charge(response, start)
+            yield value
+
+    async def process_spider_output_async(self, response, result, spider):
+        iterator = result.__aiter__()
+        while True:
+            start = time.process_time()
+            try:
+                value = await iterator.__anext__()
+            except StopAsyncIteration:
+                self.charge(response, start)
+                return
+            self.charge(response, start)
+            yield value
+
+
+def selenium_unavailable(settings):
+    try:
+        import selenium  # noqa: F401
+    except ImportError:
+        return 'selenium is not installed'
+    if not (settings.get('CHROMEDRIVER_PATH') or shutil.which('chromedriver')):
+        return 'no chromedriver found (set CHROMEDRIVER_PATH)'
+    if not any(shutil.which(name) for name in ('google-chrome', 'chromium', 'chromium-browser', 'chrome')):
+        return 'no Chrome/Chromium binary found'
+    return None
+
+
+def run_child(name, server, overrides):
+    """Crawl with one spider against the replay server and print its metrics as JSON."""
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    from scrape_machine.metrics import registry_for
+
+    settings = get_project_settings()
+    output_dir = tempfile.mkdtemp(prefix='replay_')
+    settings.setdict({
+        'REPLAY_SERVER': server,
+        'DOWNLOAD_HANDLERS': {
+            'http': 'benchmarks.replay.ReplayDownloadHandler',
+            'https': 'benchmarks.replay.ReplayDownloadHandler',
+        },
+        'SPIDER_MIDDLEWARES': {'benchmarks.replay.ReplayProbe': 1000},
+        'HTTPCACHE_ENABLED': False,
+        'HTTPCACHE_DIR': os.path.join(output_dir, 'httpcache'),
+        'POLITENESS_DELAY': (0, 0),
+        'POLITENESS_DOMAIN_DELAYS': {},
+        'AIMD_MIN_DELAY': 0,
+        'LEAD_OUTPUT_DIR': output_dir,
+        'LOG_LEVEL': 'WARNING',
+        'TELNETCONSOLE_ENABLED': False,
+        'METRICS_ENABLED': True,
+        'METRICS_LOG_INTERVAL': 0,
+    }, priority='cmdline')
+    for override in overrides:
+        key, _, value = override.partition('=')
+        settings.set(key, json.loads(value) if value[:1] in '[{0123456789' else value, priority='cmdline')
+
+    spider_args = {}
+    if name == 'google':
+        spider_args = {'num_pages': 3}
+    elif name == 'google_maps':
+        # Synthetic tiles all list the same places: a 2x2 grid split once
+        # exercises tiling and the place id dedupe without thousands of tiles
+        spider_args = {'radius': 20000}
+        settings.set('MAPS_TILE_MAX_DEPTH', 1, priority='project')
+    elif name == 'google_maps_selenium':
+        reason = selenium_unavailable(settings)
+        if reason:
+            print(json.dumps({'skipped': reason}))
+            return
+        spider_args = {'headless': 'true', 'query': 'doctor;dentist', 'location': 'Tulsa, OK'}
+
+    process = CrawlerProcess(settings)
+    spidercls = process.spider_loader.load(name)
+    if name == 'google_maps_selenium':
+        class StubbedSpider(spidercls):
+            def scrape_job(self, driver, query, location):
+                driver.get(f'{server}/http/replay.stub/stub/maps')
+                self.scroll_results(driver)
+                return self.extract_listings(driver)
+        StubbedSpider.__name__ = spidercls.__name__
+        spidercls = StubbedSpider
+
+    crawler = process.create_crawler(spidercls)
+    cpu_start = time.process_time()
+    process.crawl(crawler, **spider_args)
+    process.start()
+
+    stats = crawler.stats.get_stats()
+    probe = getattr(crawler, 'replay_probe', None)
+    pipeline_time = {label: histogram.sum for (name, label), histogram in registry_for(crawler).histograms.items()
+                     if name == 'pipeline_seconds'}
+    elapsed = stats.get('elapsed_time_seconds') or 0.0
+    requests = stats.get('downloader/request_count', 0)
+    items = stats.get('item_scraped_count', 0)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    print(json.dumps({
+        'elapsed_s': round(elapsed, 3),
+        'requests': requests,
+        'items': items,
+        'requests_per_s': round(requests / elapsed, 2) if elapsed else None,
+        'items_per_s': round(items / elapsed, 2) if elapsed else None,
+        'process_cpu_s': round(time.process_time() - cpu_start, 3),
+        'callback_cpu_s': {k: round(v, 4) for k, v in sorted(probe.callback_cpu.items())} if probe else {},
+        'pipeline_s': {k: round(v, 4) for k, v in sorted(pipeline_time.items())},
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        'errors': stats.get('log_count/ERROR', 0),
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--spiders', nargs='+', default=list(SPIDERS), choices=SPIDERS)
+    parser.add_argument('--corpus', help='directory with a recorded corpus and its index.json')
+    parser.add_argument('--maps-pages', type=int, default=5)
+    parser.add_argument('--places-per-page', type=int, default=40)
+    parser.add_argument('--set', action='append', default=[], metavar='SETTING=VALUE',
+                        help='override a Scrapy setting in every run')
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--server', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.server, args.set)
+        return
+
+    corpus = Corpus(args.corpus, maps_pages=args.maps_pages, places_per_page=args.places_per_page)
+    server = serve(corpus)
+    url = f'http://127.0.0.1:{server.server_port}'
+    report = {'commit': git_commit(), 'timestamp': time.time(), 'spiders': {}}
+    try:
+        for name in args.spiders:
+            command = [sys.executable, '-m', 'benchmarks.replay', '--child', name, '--server', url]
+            for override in args.set:
+                command += ['--set', override]
+            proc = subprocess.run(command, capture_output=True, text=True)
+            lines = proc.stdout.strip().splitlines()
+            try:
+                report['spiders'][name] = json.loads(lines[-1])
+            except (IndexError, ValueError):
+                report['spiders'][name] = {'failed': proc.returncode, 'stderr': proc.stderr[-2000:]}
+    finally:
+        server.shutdown()
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Unique businesses per request for Maps search strategies, on a synthetic metro area.
+
+The area holds --businesses places within --radius meters of its center:
+most in a dense downtown and a few suburban clusters, the rest scattered.
+The stand-in search answers a viewport the way Maps does: the places
+inside it, most prominent first, --page-size per page, at most --max-pages
+pages. Three strategies search the same area:
+
+    single     one area-wide search and its pagination (the spider before tiling)
+    grid       a uniform grid of --min-radius tiles, each paginated
+    adaptive   TilePlanner with the spider's defaults: a coarse grid whose
+               saturated tiles are split, pagination only where they can't be
+
+The report gives requests, unique places found, the share of the area's
+places found, unique places per request and the number of request rounds
+(the longest chain of requests that depend on each other; everything else
+runs concurrently).
+
+    python -m benchmarks.tiling_simulator [--businesses 5000] [--check]
+
+With --check the script exits non-zero unless the adaptive planner finds
+more places than the single search and more places per request than the grid.
+"""
+
+import argparse
+import math
+import random
+import sys
+from collections import deque
+
+from scrape_machine.geo import Tile, TilePlanner, offset
+
+CENTER = (36.15, -95.99)
+
+
+def make_world(count, radius, rng):
+    """(lat, lng, prominence) for ``count`` places around CENTER."""
+    clusters = [(0, 0, 3000, 0.45)]
+    for _ in range(5):
+        angle, distance = rng.uniform(0, 2 * math.pi), rng.uniform(0.3, 0.8) * radius
+        clusters.append((distance * math.sin(angle), distance * math.cos(angle), 2000, 0.07))
+    places = []
+    for _ in range(count):
+        pick = rng.random()
+        for north, east, spread, share in clusters:
+            if pick < share:
+                dy, dx = north + rng.gauss(0, spread), east + rng.gauss(0, spread)
+                break
+            pick -= share
+        else:
+            distance, angle = radius * math.sqrt(rng.random()), rng.uniform(0, 2 * math.pi)
+            dy, dx = distance * math.sin(angle), distance * math.cos(angle)
+        if math.hypot(dx, dy) <= radius:
+            places.append((*offset(*CENTER, dy, dx), rng.random()))
+    return places
+
+
+class Search:
+    """Stand-in Maps search over a fixed set of places."""
+
+    def __init__(self, places, page_size, max_pages):
+        self.places = places
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.requests = 0
+
+    def results(self, tile):
+        north, _ = offset(tile.lat, tile.lng, tile.radius, 0)
+        south, _ = offset(tile.lat, tile.lng, -tile.radius, 0)
+        _, east = offset(tile.lat, tile.lng, 0, tile.radius)
+        _, west = offset(tile.lat, tile.lng, 0, -tile.radius)
+        inside = [place for place in self.places if south <= place[0] <= north and west <= place[1] <= east]
+        inside.sort(key=lambda place: -place[2])
+        return inside[:self.page_size * self.max_pages]
+
+    def page(self, results, number):
+        """A page of results and whether there's a next page token."""
+        self.requests += 1
+        page = results[number * self.page_size:(number + 1) * self.page_size]
+        return page, (number + 1) * self.page_size < len(results)
+
+
+def paginate(search, tile, found):
+    """Fetch every page of ``tile``; returns the number of requests made."""
+    results = search.results(tile)
+    number, more = 0, True
+    while more:
+        page, more = search.page(results, number)
+        found.update(page)
+        number += 1
+    return number
+
+
+def single(search, radius, planner):
+    found = set()
+    rounds = paginate(search, Tile(*CENTER, radius), found)
+    return found, rounds
+
+
+def grid(search, radius, planner):
+    found, rounds = set(), 0
+    fine = TilePlanner(tile_radius=planner.min_radius)
+    for tile in fine.plan(*CENTER, radius):
+        rounds = max(rounds, paginate(search, tile, found))
+    return found, rounds
+
+
+def adaptive(search, radius, planner):
+    """What GoogleMapsSpider does with tiling on: split saturated tiles, paginate the rest."""
+    found, rounds = set(), 0
+    queue = deque((tile, 1) for tile in planner.plan(*CENTER, radius))
+    while queue:
+        tile, depth = queue.popleft()
+        results = search.results(tile)
+        page, more = search.page(results, 0)
+        found.update(page)
+        children = planner.children(tile, len(page))
+        if children:
+            queue.extend((child, depth + 1) for child in children)
+            continue
+        number = 1
+        while more:
+            page, more = search.page(results, number)
+            found.update(page)
+            number += 1
+        rounds = max(rounds, depth + number - 1)
+    return found, rounds
+
+
+STRATEGIES = {'single': single, 'grid': grid, 'adaptive': adaptive}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--businesses', type=int, default=5000)
+    parser.add_argument('--radius', type=float, default=50_000)
+    parser.add_argument('--page-size', type=int, default=20)
+    parser.add_argument('--max-pages', type=int, default=6)
+    parser.add_argument('--min-radius', type=float, default=625,
+                        help='smallest tile: the grid uses it throughout, the planner splits down to it')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--check', action='store_true', help='fail unless adaptive tiling beats both baselines')
+    args = parser.parse_args()
+
+    world = make_world(args.businesses, args.radius, random.Random(args.seed))
+    planner = TilePlanner(min_radius=args.min_radius, saturation=args.page_size)
+    print(f'{len(world)} places within {args.radius / 1000:g} km')
+    results = {}
+    for name, strategy in STRATEGIES.items():
+        search = Search(world, args.page_size, args.max_pages)
+        found, rounds = strategy(search, args.radius, planner)
+        results[name] = (search.requests, len(found))
+        print(f'{name:<9} {search.requests:6d} requests  {len(found):6d} places ({len(found) / len(world):6.1%})  '
+              f'{len(found) / search.requests:6.2f} per request  {rounds:3d} rounds')
+
+    if args.check:
+        requests, found = results['adaptive']
+        ok = (found > results['single'][1]
+              and found / requests > results['grid'][1] / results['grid'][0])
+        print('PASS' if ok else 'FAIL')
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
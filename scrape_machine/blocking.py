@@ -0,0 +1,158 @@
+# Block detection and per-domain AIMD rate control, used by PolitenessMiddleware.
+#
+# Every response goes through one BlockDetector, so spiders no longer look
+# for "unusual traffic" themselves. The AIMDController turns the verdicts
+# into a per-domain delay and concurrency: good responses raise the request
+# rate linearly over time and widen concurrency by about one request per
+# window; a block halves both.
+
+import re
+from typing import Dict, Optional
+
+from scrapy.utils.httpobj import urlparse_cached
+
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+
+class BlockDetector:
+    """
+    Decides whether a response means the target is pushing back.
+
+    A response is blocked when its status is in BLOCK_HTTP_CODES, when it
+    (or the redirect it asks for) lands on a URL containing one of
+    BLOCK_URL_MARKERS (CAPTCHA pages), when its body contains one of
+    BLOCK_MARKERS, or when its URL matches a BLOCK_REQUIRED_MARKERS pattern
+    but the body lacks the marker every real page has (e.g. an empty Maps
+    payload).
+    """
+
+    def __init__(self, codes=(429,), markers=(), url_markers=(), required_markers=None):
+        self.codes = {int(code) for code in codes}
+        self.markers = [marker.encode() for marker in markers]
+        self.url_markers = list(url_markers)
+        self.required = [(re.compile(pattern), marker.encode())
+                         for pattern, marker in (required_markers or {}).items()]
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            codes=settings.getlist('BLOCK_HTTP_CODES', [429]),
+            markers=settings.getlist('BLOCK_MARKERS'),
+            url_markers=settings.getlist('BLOCK_URL_MARKERS'),
+            required_markers=settings.getdict('BLOCK_REQUIRED_MARKERS'),
+        )
+
+    def classify(self, response) -> Optional[str]:
+        """Why ``response`` looks blocked (``'status'``, ``'captcha'``, ``'marker'``, ``'empty'``), or None."""
+        if response.status in self.codes:
+            return 'status'
+        url = response.url
+        if response.status in REDIRECT_CODES:
+            url = response.headers.get('Location', b'').decode('latin-1')
+        if any(marker in url for marker in self.url_markers):
+            return 'captcha'
+        if response.status != 200:
+            return None
+        body = response.body
+        if any(marker in body for marker in self.markers):
+            return 'marker'
+        for pattern, marker in self.required:
+            if pattern.search(response.url) and marker not in body:
+                return 'empty'
+        return None
+
+
+class DomainLimits:
+    """Current delay and concurrency for one domain, plus the request sequence used to spot stale blocks."""
+
+    __slots__ = ('delay', 'concurrency', 'sent', 'recover_seq')
+
+    def __init__(self, delay: float, concurrency: float):
+        self.delay = delay
+        self.concurrency = concurrency
+        self.sent = 0
+        self.recover_seq = 0
+
+
+class AIMDController:
+    """
+    Additive-increase / multiplicative-decrease control of per-domain delay and concurrency.
+
+    Domains start at ``start_delay`` (or the value passed to ``limits``)
+    and ``start_concurrency``. The delay is handled as a rate (1 / delay):
+    every success adds ``rate_step / rate`` to it, so the rate grows by
+    ``rate_step`` requests/s per second of good responses whatever its
+    level. Every success also adds ``increase / concurrency`` to the
+    concurrency, so it grows by roughly ``increase`` per window.
+
+    A block multiplies concurrency by ``decrease`` and divides the delay by
+    it, once per window: blocks of requests sent before the last decrease
+    were caused by the old rate and are ignored, as in TCP congestion
+    control.
+    """
+
+    def __init__(self, start_concurrency: float = 1, min_concurrency: float = 1, max_concurrency: float = 8,
+                 start_delay: float = 3.0, min_delay: float = 0.25, max_delay: float = 60.0,
+                 increase: float = 1.0, rate_step: float = 0.5, decrease: float = 0.5):
+        self.start_concurrency = start_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.start_delay = start_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.increase = increase
+        self.rate_step = rate_step
+        self.decrease = decrease
+        self.domains: Dict[str, DomainLimits] = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            start_concurrency=settings.getfloat('AIMD_START_CONCURRENCY', 1),
+            min_concurrency=settings.getfloat('AIMD_MIN_CONCURRENCY', 1),
+            max_concurrency=settings.getfloat('AIMD_MAX_CONCURRENCY', 8),
+            start_delay=settings.getfloat('AIMD_START_DELAY', 3.0),
+            min_delay=settings.getfloat('AIMD_MIN_DELAY', 0.25),
+            max_delay=settings.getfloat('AIMD_MAX_DELAY', 60.0),
+            increase=settings.getfloat('AIMD_INCREASE', 1.0),
+            rate_step=settings.getfloat('AIMD_RATE_STEP', 0.5),
+            decrease=settings.getfloat('AIMD_DECREASE', 0.5),
+        )
+
+    def limits(self, domain: str, start_delay: Optional[float] = None) -> DomainLimits:
+        limits = self.domains.get(domain)
+        if limits is None:
+            delay = self.start_delay if start_delay is None else start_delay
+            limits = self.domains[domain] = DomainLimits(
+                min(self.max_delay, max(self.min_delay, delay)), self.start_concurrency
+            )
+        return limits
+
+    def on_send(self, domain: str) -> int:
+        """Number the next request to ``domain``; pass it back to ``on_block``."""
+        limits = self.limits(domain)
+        limits.sent += 1
+        return limits.sent
+
+    def on_success(self, domain: str) -> DomainLimits:
+        limits = self.limits(domain)
+        limits.concurrency = min(self.max_concurrency, limits.concurrency + self.increase / limits.concurrency)
+        if limits.delay > 0:
+            rate = 1 / limits.delay
+            limits.delay = max(self.min_delay, 1 / (rate + self.rate_step / rate))
+        return limits
+
+    def on_block(self, domain: str, seq: int = 0) -> Optional[DomainLimits]:
+        """Slow ``domain`` down; returns None if the block predates the last decrease."""
+        limits = self.limits(domain)
+        if seq and seq <= limits.recover_seq:
+            return None
+        limits.recover_seq = limits.sent
+        limits.concurrency = max(self.min_concurrency, limits.concurrency * self.decrease)
+        limits.delay = min(self.max_delay, limits.delay / self.decrease)
+        return limits
+
+
+def slot_key(request) -> str:
+    """The downloader slot a request is queued in (Scrapy's default: its hostname)."""
+    return request.meta.get('download_slot') or urlparse_cached(request).hostname or ''
@@ -0,0 +1,100 @@
+# A pool of reusable WebDriver instances driven from a Twisted thread pool.
+#
+# Each worker thread owns one browser. Jobs are plain functions that take the
+# driver as their first argument; submitting one returns a Deferred, so the
+# reactor keeps running while browsers work.
+
+import threading
+from functools import lru_cache
+from typing import Callable, Optional
+
+from twisted.internet.threads import deferToThreadPool
+from twisted.python.threadpool import ThreadPool
+
+
+@lru_cache(maxsize=None)
+def chromedriver_path(explicit: Optional[str] = None) -> str:
+    """
+    Resolve the chromedriver binary once per process.
+
+    An explicit path (e.g. the CHROMEDRIVER_PATH setting) is used as is;
+    otherwise webdriver_manager downloads or finds a cached driver.
+    """
+    if explicit:
+        return explicit
+    from webdriver_manager.chrome import ChromeDriverManager
+    return ChromeDriverManager().install()
+
+
+class BrowserPool:
+    """
+    ``size`` browsers, each recycled after ``max_jobs`` jobs.
+
+    ``make_driver`` is called in a worker thread whenever that thread needs
+    a fresh browser. A job that raises discards its browser, since the
+    session may be left in an unknown state.
+    """
+
+    def __init__(self, make_driver: Callable, size: int = 2, max_jobs: int = 20):
+        self.make_driver = make_driver
+        self.size = size
+        self.max_jobs = max_jobs
+        self.threadpool = ThreadPool(minthreads=size, maxthreads=size, name='browser-pool')
+        self.local = threading.local()
+        self.drivers = set()
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.threadpool.start()
+            self.started = True
+
+    def submit(self, job: Callable, *args, **kwargs):
+        """Run ``job(driver, *args, **kwargs)`` on a pooled browser; returns a Deferred."""
+        from twisted.internet import reactor
+        self.start()
+        return deferToThreadPool(reactor, self.threadpool, self._run, job, *args, **kwargs)
+
+    def _run(self, job, *args, **kwargs):
+        driver = getattr(self.local, 'driver', None)
+        if driver is None:
+            driver = self.make_driver()
+            self.local.driver = driver
+            self.local.jobs = 0
+            with self.lock:
+                self.drivers.add(driver)
+        try:
+            return job(driver, *args, **kwargs)
+        except Exception:
+            self._discard()
+            raise
+        finally:
+            self.local.jobs = getattr(self.local, 'jobs', 0) + 1
+            if self.local.jobs >= self.max_jobs:
+                self._discard()
+
+    def _discard(self):
+        driver = getattr(self.local, 'driver', None)
+        self.local.driver = None
+        if driver is None:
+            return
+        with self.lock:
+            self.drivers.discard(driver)
+        try:
+            driver.quit()
+        except Exception:
+            pass
+
+    def stop(self):
+        """Stop the worker threads and quit every browser still open."""
+        if self.started:
+            self.threadpool.stop()
+            self.started = False
+        with self.lock:
+            drivers, self.drivers = list(self.drivers), set()
+        for driver in drivers:
+            try:
+                driver.quit()
+            except Exception:
+                pass
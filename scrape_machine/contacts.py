@@ -0,0 +1,195 @@
+# Contact extraction shared by spiders, pipelines and replay tools.
+
+import json
+import re
+from typing import Iterable, List, NamedTuple, Optional
+
+from lxml import etree
+
+from .decoding import page_selector
+
+EMAIL = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}'
+PHONE = r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}'
+
+email_pattern = re.compile(EMAIL)
+phone_pattern = re.compile(PHONE)
+
+# Every email contains an "@" and every phone ends with the digits matched by
+# _PHONE_CORE. Scanning for these anchors is far cheaper than trying both full
+# patterns at every offset, and digit runs that can't be phones (ids, prices,
+# dates) never leave the regex engine.
+_PHONE_CORE = r'[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}'
+_anchor = re.compile(f'@|{_PHONE_CORE}')
+_whitespace = re.compile(r'\s+')
+
+# How far before/after an "@" an email may extend, and how far before or
+# after the anchored digits a phone may start or end: the anchor can begin
+# on the "1" of an unseparated "+1", leaving the last digit outside it.
+_EMAIL_BEFORE, _EMAIL_AFTER = 64, 256
+_PHONE_BEFORE, _PHONE_AFTER = 8, 8
+
+
+class Contacts(NamedTuple):
+    """Emails and phones found in a text, de-duplicated in order of appearance."""
+    emails: List[str]
+    phones: List[str]
+
+
+def clean_text(text: Optional[str]) -> Optional[str]:
+    """Collapse all runs of whitespace to a single space and strip."""
+    if not text:
+        return None
+    return _whitespace.sub(' ', text).strip()
+
+
+def extract_contact(text: Optional[str]) -> Contacts:
+    """
+    Find emails and phones in one left-to-right scan over ``text``.
+
+    Only the neighbourhood of each ``@`` or phone-shaped digit run is
+    matched against the email or phone pattern; everything else is skipped
+    by a single regex search.
+    """
+    if not text:
+        return Contacts([], [])
+    emails, phones = {}, {}
+    search = _anchor.search
+    pos = floor = 0
+    while True:
+        anchor = search(text, pos)
+        if anchor is None:
+            break
+        start = anchor.start()
+        if text[start] == '@':
+            match = email_pattern.search(text, max(floor, start - _EMAIL_BEFORE), start + _EMAIL_AFTER)
+            found = emails if match and match.start() <= start else None
+        else:
+            match = phone_pattern.search(text, max(floor, start - _PHONE_BEFORE), anchor.end() + _PHONE_AFTER)
+            found = phones if match else None
+        if found is None:
+            pos = start + 1
+            continue
+        found[match.group().strip()] = None
+        pos = floor = match.end()
+    return Contacts(list(emails), list(phones))
+
+
+def extract_contacts(texts: Iterable[Optional[str]]) -> List[Contacts]:
+    """Batch version of :func:`extract_contact`."""
+    return [extract_contact(text) for text in texts]
+
+
+# Elements whose text never holds contact details worth scanning.
+_SKIP_TAGS = frozenset(['script', 'style', 'noscript', 'template', 'svg', 'iframe', 'head'])
+
+# Where sites usually put their contact details.
+_REGIONS_XPATH = (
+    '//footer | //header | //address'
+    ' | //*[@id="footer" or @id="contact" or @id="contacts"]'
+    ' | //*[contains(@class, "footer") or contains(@class, "contact")]'
+)
+
+
+def page_contacts(response, budget: int = 200_000) -> Contacts:
+    """
+    Find emails and phones on an HTML page, reading as little of it as possible.
+
+    Sources are tried from most to least reliable, stopping once both an
+    email and a phone are known:
+
+    1. ``mailto:`` and ``tel:`` links
+    2. schema.org contact fields (JSON-LD and ``itemprop`` microdata)
+    3. the text of footer, header, address and contact regions
+    4. the body text, skipping scripts and styles, up to ``budget`` characters
+    """
+    selector = page_selector(response)
+    if selector is None:
+        return Contacts([], [])
+    root = selector.root
+    emails, phones = {}, {}
+
+    def done():
+        return emails and phones
+
+    for href in root.xpath('//a[starts-with(@href, "mailto:") or starts-with(@href, "tel:")]/@href'):
+        href = href.strip()
+        if href.startswith('mailto:'):
+            address = href[7:].split('?')[0].strip()
+            if '@' in address:
+                emails[address] = None
+        elif href[4:].strip():
+            phones[href[4:].strip()] = None
+    if done():
+        return Contacts(list(emails), list(phones))
+
+    for email, phone in _structured_contacts(root):
+        if email:
+            emails.setdefault(email, None)
+        if phone:
+            phones.setdefault(phone, None)
+    if done():
+        return Contacts(list(emails), list(phones))
+
+    body = root.find('body')
+    for element in root.xpath(_REGIONS_XPATH) + [root if body is None else body]:
+        found = extract_contact(_element_text(element, budget))
+        for email in found.emails:
+            emails.setdefault(email, None)
+        for phone in found.phones:
+            phones.setdefault(phone, None)
+        if done():
+            break
+    return Contacts(list(emails), list(phones))
+
+
+def _structured_contacts(root):
+    """Yield (email, phone) pairs from JSON-LD blocks and schema.org microdata."""
+    for block in root.xpath('//script[@type="application/ld+json"]/text()'):
+        try:
+            data = json.loads(block)
+        except ValueError:
+            continue
+        stack = [data]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, dict):
+                email, phone = node.get('email'), node.get('telephone')
+                if isinstance(email, str) or isinstance(phone, str):
+                    yield (
+                        email.replace('mailto:', '').strip() if isinstance(email, str) else None,
+                        phone.strip() if isinstance(phone, str) else None,
+                    )
+                stack.extend(node.values())
+            elif isinstance(node, list):
+                stack.extend(node)
+    for element in root.xpath('//*[@itemprop="email" or @itemprop="telephone"]'):
+        value = (element.get('content') or element.text_content() or '').strip()
+        if value:
+            if element.get('itemprop') == 'email':
+                yield value.replace('mailto:', ''), None
+            else:
+                yield None, value
+
+
+def _element_text(element, budget: int) -> str:
+    """Concatenate the text under ``element``, skipping scripts and styles, up to ``budget`` characters."""
+    parts = []
+    size = 0
+    walker = etree.iterwalk(element, events=('start', 'end', 'comment', 'pi'))
+    for event, node in walker:
+        if event == 'start':
+            if node.tag in _SKIP_TAGS:
+                walker.skip_subtree()
+                continue
+            text = node.text
+        elif node is element:
+            break
+        else:
+            # 'end', 'comment' and 'pi': only the text after the node counts
+            text = node.tail
+        if text:
+            parts.append(text)
+            size += len(text)
+            if size >= budget:
+                break
+    return ' '.join(parts)[:budget]
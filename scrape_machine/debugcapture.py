@@ -0,0 +1,236 @@
+# Sampled debug captures of responses, written off the reactor thread.
+#
+# Spiders and middlewares report interesting responses with an outcome
+# ('ok', 'empty', 'blocked', 'exception'). A sampled share of each outcome,
+# per DEBUG_CAPTURE_RATES and the spider's ``debug_capture_rates``, is kept
+# in a byte-bounded ring buffer; a background thread gzips each body into
+# DEBUG_CAPTURE_DIR/<spider>/ with a JSON file of request metadata next to
+# it, and deletes the oldest captures once DEBUG_CAPTURE_MAX_BYTES is used.
+
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+OUTCOMES = ('ok', 'empty', 'blocked', 'exception')
+
+_captures = weakref.WeakKeyDictionary()
+
+
+def capture_for(crawler) -> Optional['DebugCapture']:
+    """The crawler's DebugCapture, or None when DebugCaptureExtension isn't running."""
+    return _captures.get(crawler)
+
+
+def _headers(headers) -> Dict[str, str]:
+    return {
+        key.decode('latin-1'): b', '.join(values).decode('latin-1')
+        for key, values in headers.items()
+        if key.lower() not in (b'cookie', b'set-cookie', b'authorization', b'proxy-authorization')
+    }
+
+
+class DebugCapture:
+    """
+    Samples responses into a ring buffer and writes them from a worker thread.
+
+    ``capture`` only rolls the dice and appends a reference to the body,
+    so it is cheap enough to call on every response. When the pending
+    captures exceed ``buffer_bytes`` the oldest are dropped rather than
+    slowing the crawl down.
+    """
+
+    def __init__(self, directory: str, rates: Dict[str, float], buffer_bytes: int = 16 * 1024 * 1024,
+                 max_bytes: int = 100 * 1024 * 1024, compresslevel: int = 6):
+        self.directory = directory
+        self.rates = {outcome: float(rates.get(outcome, 0)) for outcome in OUTCOMES}
+        self.buffer_bytes = int(buffer_bytes)
+        self.max_bytes = int(max_bytes)
+        self.compresslevel = compresslevel
+
+        self.queued = dict.fromkeys(OUTCOMES, 0)
+        self.dropped = 0
+        self.failed = 0
+        self.written = 0
+        self.evicted = 0
+        self._seq = 0
+        self._pending: deque = deque()
+        self._pending_bytes = 0
+        # (path, size) of the captures on disk, oldest first
+        self._files: deque = deque()
+        self._used = 0
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closing = False
+        self._thread = threading.Thread(target=self._run, name='debug-capture', daemon=True)
+        self._thread.start()
+
+    def capture(self, outcome: str, response, request=None, spider=None, **extra) -> bool:
+        """Queue ``response`` if ``outcome`` is sampled; returns whether it was."""
+        rate = self.rates.get(outcome, 0)
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return False
+        request = request if request is not None else getattr(response, 'request', None)
+        meta = {
+            'outcome': outcome,
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'spider': spider.name if spider is not None else None,
+            'url': response.url,
+            'status': response.status,
+            'response_headers': _headers(response.headers),
+        }
+        if request is not None:
+            meta.update({
+                'request_url': request.url,
+                'method': request.method,
+                'request_headers': _headers(request.headers),
+                'callback': getattr(request.callback, '__name__', None),
+                # The slot names the proxy without its credentials
+                'download_slot': request.meta.get('download_slot'),
+                'download_latency': request.meta.get('download_latency'),
+                'depth': request.meta.get('depth'),
+                'retry_times': request.meta.get('retry_times'),
+                'backoff_attempt': request.meta.get('backoff_attempt'),
+            })
+        meta.update({key: value if isinstance(value, (str, int, float, bool, type(None))) else repr(value)
+                     for key, value in extra.items()})
+        body = response.body
+        with self._wakeup:
+            if self._closing:
+                return False
+            self._seq += 1
+            self._pending.append((self._seq, meta, body))
+            self._pending_bytes += len(body)
+            while self._pending_bytes > self.buffer_bytes and len(self._pending) > 1:
+                _, _, old = self._pending.popleft()
+                self._pending_bytes -= len(old)
+                self.dropped += 1
+            self.queued[outcome] = self.queued.get(outcome, 0) + 1
+            self._wakeup.notify()
+        return True
+
+    def close(self):
+        """Write what is still pending and stop the worker."""
+        with self._wakeup:
+            self._closing = True
+            self._wakeup.notify()
+        self._thread.join()
+
+    def to_stats(self, stats, spider=None):
+        for outcome, count in self.queued.items():
+            if count:
+                stats.set_value(f'debug_capture/queued/{outcome}', count, spider=spider)
+        for key in ('dropped', 'failed', 'written', 'evicted'):
+            stats.set_value(f'debug_capture/{key}', getattr(self, key), spider=spider)
+
+    def _run(self):
+        self._scan()
+        while True:
+            with self._wakeup:
+                while not self._pending and not self._closing:
+                    self._wakeup.wait()
+                if not self._pending:
+                    return
+                seq, meta, body = self._pending.popleft()
+                self._pending_bytes -= len(body)
+            try:
+                self._write(seq, meta, body)
+            except OSError:
+                # A full disk must not take the crawl down with it
+                self.failed += 1
+
+    def _scan(self):
+        """Account for captures left by earlier runs, so the quota covers them too."""
+        found: List[Tuple[float, str, int]] = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                found.append((info.st_mtime, path, info.st_size))
+        for _, path, size in sorted(found):
+            self._files.append((path, size))
+            self._used += size
+
+    def _write(self, seq: int, meta: dict, body: bytes):
+        directory = os.path.join(self.directory, meta['spider'] or 'unknown')
+        os.makedirs(directory, exist_ok=True)
+        stem = os.path.join(directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{seq:06d}-{meta['outcome']}")
+        compressed = gzip.compress(body, self.compresslevel)
+        described = json.dumps(meta, ensure_ascii=False, indent=1).encode('utf-8')
+        size = len(compressed) + len(described)
+        if size > self.max_bytes:
+            self.failed += 1
+            return
+        self._evict(self.max_bytes - size)
+        for path, data in ((f'{stem}.html.gz', compressed), (f'{stem}.json', described)):
+            with open(path, 'wb') as f:
+                f.write(data)
+            self._files.append((path, len(data)))
+        self._used += size
+        self.written += 1
+
+    def _evict(self, budget: int):
+        while self._used > budget and self._files:
+            path, size = self._files.popleft()
+            self._used -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            if path.endswith('.json'):
+                self.evicted += 1
+
+
+class DebugCaptureExtension:
+    """
+    Runs the crawler's DebugCapture and captures exceptions raised by callbacks.
+
+    Sampling rates come from DEBUG_CAPTURE_RATES; spiders can override
+    entries with a ``debug_capture_rates`` dict attribute.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('DEBUG_CAPTURE_ENABLED'):
+            raise NotConfigured
+        rates = settings.getdict('DEBUG_CAPTURE_RATES')
+        rates.update(getattr(crawler.spidercls, 'debug_capture_rates', {}))
+        self.crawler = crawler
+        self.capture = _captures[crawler] = DebugCapture(
+            settings.get('DEBUG_CAPTURE_DIR', 'debug_captures'),
+            rates,
+            buffer_bytes=settings.getint('DEBUG_CAPTURE_BUFFER_BYTES', 16 * 1024 * 1024),
+            max_bytes=settings.getint('DEBUG_CAPTURE_MAX_BYTES', 100 * 1024 * 1024),
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_error, signal=signals.spider_error)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_error(self, failure, response, spider):
+        self.capture.capture('exception', response, spider=spider,
+                             error=''.join(traceback.format_exception_only(failure.type, failure.value)).strip())
+
+    def spider_closed(self, spider):
+        from twisted.internet import threads
+
+        # Joining the worker may wait on the disk; keep that off the reactor
+        d = threads.deferToThread(self.capture.close)
+        d.addCallback(lambda _: self.capture.to_stats(self.crawler.stats, spider=spider))
+        return d
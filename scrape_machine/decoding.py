@@ -0,0 +1,31 @@
+# Decode each response once and share the result between spiders and helpers.
+#
+# Bodies arrive already decompressed: HttpCompressionMiddleware runs above
+# the HTTP cache (see DOWNLOADER_MIDDLEWARES), inflating each download once,
+# in chunks, under DOWNLOAD_MAXSIZE. What's left is turning the bytes into
+# text and an HTML tree, which these helpers do at most once per response.
+
+from typing import Optional
+
+from scrapy.http import TextResponse
+from scrapy.selector import Selector
+
+
+def page_text(response) -> Optional[str]:
+    """The response body as text (decoded once and cached by Scrapy), or None for binary responses."""
+    if not isinstance(response, TextResponse):
+        return None
+    return response.text
+
+
+def page_selector(response) -> Optional[Selector]:
+    """
+    The parsed tree of an HTML or XML response, or None for binary responses.
+
+    This is ``response.selector``, which Scrapy builds from ``response.text``
+    and caches, so page_text, page_selector and ``response.css`` share one
+    decode and one tree.
+    """
+    if not isinstance(response, TextResponse):
+        return None
+    return response.selector
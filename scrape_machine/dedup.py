@@ -0,0 +1,102 @@
+# Bounded-memory "have we seen this before?" index.
+#
+# A Bloom filter answers most lookups in memory; only when it reports a
+# possible match do we consult the exact on-disk SQLite index.
+
+import hashlib
+import math
+import os
+import sqlite3
+from typing import Iterable, Optional
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings."""
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(1, int(capacity))
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(key))
+
+
+class SeenIndex:
+    """
+    Exact set of keys stored in SQLite, fronted by a Bloom filter.
+
+    The database runs in WAL mode, so several processes can share one index
+    file. Inserts are committed every ``commit_every`` new keys. Keys are
+    stored with ``owner``, so the ones a failed crawl added can be removed
+    again (see forget).
+    """
+
+    def __init__(self, path: str, capacity: int = 1_000_000, error_rate: float = 0.001,
+                 commit_every: int = 1000, owner: Optional[str] = None):
+        self.path = path
+        self.owner = owner
+        self.bloom = BloomFilter(capacity, error_rate)
+        self.commit_every = commit_every
+        self.pending = 0
+        self.stats = {'bloom_negative': 0, 'bloom_positive': 0, 'false_positive': 0}
+
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, owner TEXT) WITHOUT ROWID')
+        for (key,) in self.db.execute('SELECT key FROM seen'):
+            self.bloom.add(key)
+
+    def __contains__(self, key: str) -> bool:
+        if key not in self.bloom:
+            self.stats['bloom_negative'] += 1
+            return False
+        self.stats['bloom_positive'] += 1
+        found = self.db.execute('SELECT 1 FROM seen WHERE key = ?', (key,)).fetchone() is not None
+        if not found:
+            self.stats['false_positive'] += 1
+        return found
+
+    def add_many(self, keys: Iterable[str]) -> int:
+        """Add keys to the index and return how many were not already present."""
+        added = 0
+        for key in keys:
+            self.bloom.add(key)
+            added += self.db.execute('INSERT OR IGNORE INTO seen (key, owner) VALUES (?, ?)',
+                                     (key, self.owner)).rowcount
+        self.pending += added
+        if self.pending >= self.commit_every:
+            self.db.commit()
+            self.pending = 0
+        return added
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def forget(path: str, owner: str) -> int:
+    """Remove the keys ``owner`` added to the index at ``path``; returns how many."""
+    if not os.path.exists(path):
+        return 0
+    db = sqlite3.connect(path, timeout=60)
+    try:
+        if not db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'seen'").fetchone():
+            return 0
+        with db:
+            return db.execute('DELETE FROM seen WHERE owner = ?', (owner,)).rowcount
+    finally:
+        db.close()
@@ -0,0 +1,121 @@
+# Fingerprints of what earlier runs saw, for incremental crawls.
+#
+# Nightly runs overlap heavily. With INCREMENTAL = True a lead whose
+# listing is unchanged and was checked within DELTA_FRESHNESS is skipped
+# before enrichment, leads that come out identical to what was emitted
+# before are dropped, and enrichment pages whose content hash hasn't
+# changed reuse the contacts found on them last time.
+
+import hashlib
+import json
+import sqlite3
+import time
+from typing import Optional, Tuple
+
+from .normalize import natural_key
+
+# Fields of the search listing itself; a change here means the lead is re-enriched
+SOURCE_FIELDS = ('name', 'address', 'phone', 'website')
+# Left out of the emitted-lead digest: they change on every run without meaning anything
+VOLATILE_FIELDS = ('scraped_date', 'rating')
+
+
+def lead_key(adapter, region: str = 'US') -> Optional[str]:
+    """The lead's natural key, reading national phone numbers as ``region`` like the pipelines do."""
+    return natural_key(adapter, region)
+
+
+def digest(values) -> bytes:
+    return hashlib.blake2b(json.dumps(values, sort_keys=True, default=str).encode('utf-8'),
+                           digest_size=12).digest()
+
+
+def source_digest(adapter) -> bytes:
+    return digest([adapter.get(field) for field in SOURCE_FIELDS])
+
+
+def lead_digest(adapter) -> bytes:
+    return digest({k: v for k, v in adapter.items() if k not in VOLATILE_FIELDS and v is not None})
+
+
+def content_hash(body: bytes) -> bytes:
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+class DeltaIndex:
+    """
+    Per-lead and per-page fingerprints in SQLite.
+
+    ``leads`` keeps, for every lead key, the digest of its listing as the
+    spider saw it, the digest of the last emitted lead and when that lead
+    was emitted; ``pages`` keeps the content hash of every enrichment page
+    with the contacts found on it. Rows are small fixed-size blobs, so
+    millions of leads stay compact. Statements autocommit, so concurrent
+    runner workers can share the file. Leads are keyed as LeadSQLitePipeline
+    keys them, so ``region`` should be the crawl's phone region.
+    """
+
+    def __init__(self, path: str, freshness: float = 7 * 24 * 3600, region: str = 'US'):
+        self.freshness = freshness
+        self.region = region
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS leads '
+            '(key TEXT PRIMARY KEY, source BLOB, digest BLOB, checked_at REAL) WITHOUT ROWID'
+        )
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS pages '
+            '(url TEXT PRIMARY KEY, hash BLOB, email TEXT, phone TEXT, fetched_at REAL) WITHOUT ROWID'
+        )
+
+    def is_fresh(self, adapter) -> bool:
+        """True if the lead's listing is unchanged and was checked within the freshness window."""
+        key = lead_key(adapter, self.region)
+        if key is None:
+            return False
+        row = self.db.execute('SELECT source, checked_at FROM leads WHERE key = ?', (key,)).fetchone()
+        return (row is not None and row[1] is not None and row[0] == source_digest(adapter)
+                and time.time() - row[1] < self.freshness)
+
+    def note_listing(self, adapter):
+        """Remember the listing as the spider saw it, before enrichment fills in blanks."""
+        key = lead_key(adapter, self.region)
+        if key is not None:
+            self.db.execute(
+                'INSERT INTO leads (key, source) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET source = excluded.source',
+                (key, source_digest(adapter)),
+            )
+
+    def record(self, adapter) -> str:
+        """Store the emitted lead's digest; returns ``'new'``, ``'changed'`` or ``'unchanged'``."""
+        key = lead_key(adapter, self.region)
+        if key is None:
+            return 'new'
+        new_digest = lead_digest(adapter)
+        row = self.db.execute('SELECT digest FROM leads WHERE key = ?', (key,)).fetchone()
+        self.db.execute(
+            'INSERT INTO leads (key, digest, checked_at) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET digest = excluded.digest, checked_at = excluded.checked_at',
+            (key, new_digest, time.time()),
+        )
+        if row is None or row[0] is None:
+            return 'new'
+        return 'unchanged' if row[0] == new_digest else 'changed'
+
+    def page(self, url: str, body: bytes) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """The (email, phone) found on ``url`` last time, if its content is unchanged."""
+        row = self.db.execute('SELECT hash, email, phone FROM pages WHERE url = ?', (url,)).fetchone()
+        if row is None or row[0] != content_hash(body):
+            return None
+        return row[1], row[2]
+
+    def record_page(self, url: str, body: bytes, email: Optional[str], phone: Optional[str]):
+        self.db.execute(
+            'INSERT OR REPLACE INTO pages (url, hash, email, phone, fetched_at) VALUES (?, ?, ?, ?, ?)',
+            (url, content_hash(body), email, phone, time.time()),
+        )
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,170 @@
+# Request dupefilter keyed by canonical URLs.
+#
+# Scrapy's fingerprints tell apart URLs that name the same page: http and
+# https, with and without www., a trailing slash, utm_* and click-id
+# parameters, #fragments. CanonicalDupeFilter fingerprints the canonical
+# form instead, as 64-bit hashes kept mostly in a sorted array (8 bytes per
+# URL). Requests that must be sent again, like PolitenessMiddleware's
+# block retries, opt out with ``dont_filter=True`` as usual.
+
+import hashlib
+import os
+import sys
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.job import job_dir
+from w3lib.url import canonicalize_url
+
+# Query parameters that only track where a click came from
+TRACKING_PARAMS = frozenset({
+    'gclid', 'gclsrc', 'dclid', 'gbraid', 'wbraid', 'fbclid', 'msclkid', 'yclid', 'twclid', 'igshid',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'ref_src', 'srsltid',
+})
+TRACKING_PREFIXES = ('utm_', 'pk_')
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def _tracking(pair: str) -> bool:
+    key = pair.split('=', 1)[0].lower()
+    return key in TRACKING_PARAMS or key.startswith(TRACKING_PREFIXES)
+
+
+def canonical_url(url: str) -> str:
+    """
+    The form of ``url`` that pages reachable under several spellings share.
+
+    On top of w3lib's canonicalize_url (sorted query, normalized escapes,
+    no fragment), http becomes https, a leading www. and default ports are
+    dropped, tracking parameters are removed and the path loses its
+    trailing slash. The result identifies a page; it isn't meant to be fetched.
+    """
+    parts = urlsplit(canonicalize_url(url))
+    scheme = parts.scheme
+    if scheme not in _DEFAULT_PORTS:
+        return urlunsplit(parts)
+    host = (parts.hostname or '').rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    try:
+        port = parts.port
+    except ValueError:
+        port = None
+    if port and port != _DEFAULT_PORTS[scheme]:
+        host = f'{host}:{port}'
+    query = '&'.join(pair for pair in parts.query.split('&') if pair and not _tracking(pair))
+    return urlunsplit(('https', host, parts.path.rstrip('/'), query, ''))
+
+
+def canonical_fingerprint(request) -> int:
+    """64-bit fingerprint of the request's method, canonical URL and body."""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(request.method.encode())
+    digest.update(b' ')
+    digest.update(canonical_url(request.url).encode())
+    if request.body:
+        digest.update(b'\0')
+        digest.update(request.body)
+    return int.from_bytes(digest.digest(), 'big')
+
+
+class FingerprintSet:
+    """
+    A set of 64-bit integers stored in about 8 bytes each.
+
+    New values go into a small set; once it holds a quarter as many values
+    as the sorted array (and at least ``min_merge``), it is merged into
+    the array, so each value is copied a bounded number of times on average.
+    """
+
+    def __init__(self, values=(), min_merge: int = 65536):
+        self.sorted = array('Q', sorted(set(values)))
+        self.recent = set()
+        self.min_merge = min_merge
+
+    def __len__(self) -> int:
+        return len(self.sorted) + len(self.recent)
+
+    def __contains__(self, value: int) -> bool:
+        if value in self.recent:
+            return True
+        values = self.sorted
+        i = bisect_left(values, value)
+        return i < len(values) and values[i] == value
+
+    def add(self, value: int) -> bool:
+        """Add ``value``; returns False if it was already there."""
+        if value in self:
+            return False
+        self.recent.add(value)
+        if len(self.recent) >= max(self.min_merge, len(self.sorted) // 4):
+            self.sorted = array('Q', merge(self.sorted, sorted(self.recent)))
+            self.recent.clear()
+        return True
+
+
+class CanonicalDupeFilter(BaseDupeFilter):
+    """
+    Filters requests whose canonical URL (see canonical_url) was already requested.
+
+    With DUPEFILTER_PATH, or a JOBDIR, fingerprints are appended to a file
+    as they are seen and reloaded on start, so a resumed crawl doesn't
+    fetch pages again. Only reuse the file to resume one crawl: pages
+    that change, like search results, are filtered as well.
+    """
+
+    def __init__(self, path: Optional[str] = None, debug: bool = False):
+        self.debug = debug
+        self.path = path
+        self.file = None
+        self.fingerprints = FingerprintSet(self._load(path) if path else ())
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        path = settings.get('DUPEFILTER_PATH')
+        directory = job_dir(settings)
+        if not path and directory:
+            path = os.path.join(directory, 'requests.fingerprints')
+        return cls(path, settings.getbool('DUPEFILTER_DEBUG'))
+
+    @staticmethod
+    def _load(path: str) -> array:
+        values = array('Q')
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+            # A crash may have cut the last fingerprint short
+            values.frombytes(data[:len(data) - len(data) % 8])
+            if sys.byteorder == 'big':
+                values.byteswap()
+        return values
+
+    def open(self):
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self.file = open(self.path, 'ab')
+            # Drop a fingerprint a crash cut short, or the ones appended after it won't line up
+            self.file.truncate(self.file.tell() - self.file.tell() % 8)
+
+    def request_seen(self, request) -> bool:
+        fp = canonical_fingerprint(request)
+        if not self.fingerprints.add(fp):
+            return True
+        if self.file is not None:
+            self.file.write(fp.to_bytes(8, 'little'))
+        return False
+
+    def log(self, request, spider):
+        if self.debug:
+            spider.logger.debug(f"Filtered duplicate request: {request} ({canonical_url(request.url)})")
+        spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+
+    def close(self, reason):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
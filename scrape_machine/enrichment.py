@@ -0,0 +1,121 @@
+# Per-domain bookkeeping for website contact enrichment.
+#
+# Chains and franchises list the same website for many locations. Each
+# registrable domain is crawled at most once per run (and, with a cache
+# file, once per TTL across runs); every lead pointing at it waits for that
+# single crawl and receives its result.
+
+import sqlite3
+import time
+from typing import Dict, List, Optional
+
+
+class DomainState:
+    """One domain's contact crawl: the leads waiting on it and what was found so far."""
+
+    def __init__(self, domain: str):
+        self.domain = domain
+        self.waiting: List = []
+        self.pending = 0
+        self.email: Optional[str] = None
+        self.phone: Optional[str] = None
+        # Pages actually parsed; a crawl where every fetch failed proves nothing
+        self.parsed = 0
+        self.done = False
+
+
+class EnrichmentCache:
+    """
+    Tracks in-flight and finished domain crawls.
+
+    With ``path`` set, finished results are also stored in SQLite and reused
+    by later runs for ``ttl`` seconds.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 7 * 24 * 3600):
+        self.domains: Dict[str, DomainState] = {}
+        self.ttl = ttl
+        self.db = None
+        if path:
+            self.db = sqlite3.connect(path, timeout=30)
+            self.db.execute('PRAGMA journal_mode=WAL')
+            self.db.execute(
+                'CREATE TABLE IF NOT EXISTS enrichment '
+                '(domain TEXT PRIMARY KEY, email TEXT, phone TEXT, fetched_at REAL)'
+            )
+
+    def stored(self, domain: str) -> Optional[DomainState]:
+        """A finished result from a previous run, if still fresh."""
+        if self.db is None:
+            return None
+        row = self.db.execute(
+            'SELECT email, phone FROM enrichment WHERE domain = ? AND fetched_at >= ?',
+            (domain, time.time() - self.ttl),
+        ).fetchone()
+        if row is None:
+            return None
+        state = DomainState(domain)
+        state.email, state.phone = row
+        state.done = True
+        return state
+
+    def join(self, domain: str, lead) -> DomainState:
+        """
+        Register ``lead`` as interested in ``domain``.
+
+        Returns the domain's state. If it is ``done`` the caller applies the
+        result right away; if the lead is its only waiter the caller starts
+        the crawl; otherwise the lead is released when the crawl finishes.
+        """
+        state = self.domains.get(domain)
+        if state is None:
+            state = self.stored(domain) or DomainState(domain)
+            self.domains[domain] = state
+        if not state.done:
+            state.waiting.append(lead)
+        return state
+
+    def is_done(self, domain: str) -> bool:
+        state = self.domains.get(domain)
+        return state is not None and state.done
+
+    def found(self, domain: str, email: Optional[str] = None, phone: Optional[str] = None):
+        """Record contacts found on one of the domain's pages."""
+        state = self.domains[domain]
+        state.parsed += 1
+        state.email = state.email or email
+        state.phone = state.phone or phone
+
+    def finish(self, domain: str) -> List:
+        """
+        Mark the crawl finished and return the waiting leads with its result applied.
+
+        The result is stored only if a page was parsed: when every fetch
+        failed, the next run tries the domain again instead of reusing "no
+        contacts" for the whole TTL.
+        """
+        state = self.domains[domain]
+        if state.done:
+            return []
+        state.done = True
+        if self.db is not None and state.parsed:
+            with self.db:
+                self.db.execute(
+                    'INSERT OR REPLACE INTO enrichment (domain, email, phone, fetched_at) VALUES (?, ?, ?, ?)',
+                    (domain, state.email, state.phone, time.time()),
+                )
+        leads, state.waiting = state.waiting, []
+        for lead in leads:
+            self.apply(state, lead)
+        return leads
+
+    def apply(self, state: DomainState, lead):
+        if state.email and not lead.get('email'):
+            lead['email'] = state.email
+        if state.phone and not lead.get('phone'):
+            lead['phone'] = state.phone
+
+    def close(self):
+        if self.db is not None:
+            self.db.close()
+            self.db = None
@@ -0,0 +1,187 @@
+# Crawl state shared by the worker processes of scrape_machine.runner.
+#
+# Everything lives in one SQLite file in WAL mode, so workers on the same
+# machine coordinate through the filesystem without an external service:
+# the job queue, the request fingerprints seen by any worker, and (through
+# the LEAD_DEDUP_PATH and ENRICHMENT_CACHE_PATH files next to it) the leads
+# and websites already handled.
+
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterable, List, Optional
+
+from scrapy.dupefilters import BaseDupeFilter
+
+from .dupefilter import canonical_fingerprint
+
+
+def job_key(spider: str, args: Dict) -> str:
+    """Stable identity of a job: its spider plus its arguments."""
+    return f'{spider}:{json.dumps(args, sort_keys=True, ensure_ascii=False)}'
+
+
+def attempt_key(job_id: int, attempt: int) -> str:
+    """Owner tag for the fingerprints and lead keys one attempt at a job adds."""
+    return f'{job_id}.{attempt}'
+
+
+def connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, timeout=60, isolation_level=None)
+    db.execute('PRAGMA journal_mode=WAL')
+    db.execute('PRAGMA synchronous=NORMAL')
+    return db
+
+
+class JobFrontier:
+    """
+    Queue of spider jobs claimed atomically by worker processes.
+
+    A job moves from ``pending`` to ``running`` when a worker claims it and
+    to ``done`` or ``failed`` when the crawl ends. Adding a job that is
+    already known is a no-op, so re-running the runner against the same
+    store resumes where it stopped.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.db = connect(path)
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id INTEGER PRIMARY KEY, key TEXT UNIQUE, spider TEXT, args TEXT, '
+            "state TEXT DEFAULT 'pending', worker INTEGER, attempts INTEGER DEFAULT 0, "
+            'output TEXT, merged INTEGER DEFAULT 0, updated_at REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state)')
+        _create_fingerprints(self.db)
+
+    def add(self, spider: str, jobs: Iterable[Dict]) -> int:
+        """Enqueue jobs; returns how many were new."""
+        added = 0
+        self.db.execute('BEGIN IMMEDIATE')
+        for args in jobs:
+            added += self.db.execute(
+                'INSERT OR IGNORE INTO jobs (key, spider, args, updated_at) VALUES (?, ?, ?, ?)',
+                (job_key(spider, args), spider, json.dumps(args), time.time()),
+            ).rowcount
+        self.db.execute('COMMIT')
+        return added
+
+    def claim(self, worker: int) -> Optional[Dict]:
+        """Take the oldest pending job, or None when there is nothing left."""
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.db.execute(
+                "SELECT id, spider, args, attempts FROM jobs WHERE state = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            job_id, spider, args, attempts = row
+            self.db.execute(
+                "UPDATE jobs SET state = 'running', worker = ?, attempts = ?, updated_at = ? WHERE id = ?",
+                (worker, attempts + 1, time.time(), job_id),
+            )
+            return {'id': job_id, 'spider': spider, 'args': json.loads(args), 'attempts': attempts + 1}
+        finally:
+            self.db.execute('COMMIT')
+
+    def finish(self, job_id: int, ok: bool, output: Optional[str] = None, max_attempts: int = 1):
+        """Record a crawl's outcome; failed jobs go back to pending until ``max_attempts``."""
+        attempts = self.db.execute('SELECT attempts FROM jobs WHERE id = ?', (job_id,)).fetchone()[0]
+        state = 'done' if ok else ('pending' if attempts < max_attempts else 'failed')
+        self.db.execute(
+            'UPDATE jobs SET state = ?, output = ?, updated_at = ? WHERE id = ?',
+            (state, output, time.time(), job_id),
+        )
+
+    def running(self, worker: Optional[int] = None) -> List[Dict]:
+        """Jobs in the ``running`` state (claimed by ``worker``, or by anyone)."""
+        query = "SELECT id, attempts FROM jobs WHERE state = 'running'"
+        rows = (self.db.execute(query).fetchall() if worker is None
+                else self.db.execute(query + ' AND worker = ?', (worker,)).fetchall())
+        return [{'id': job_id, 'attempts': attempts} for job_id, attempts in rows]
+
+    def forget(self, owner: str) -> int:
+        """Drop the request fingerprints an attempt added, so its retry can fetch those pages again."""
+        return self.db.execute('DELETE FROM fingerprints WHERE owner = ?', (owner,)).rowcount
+
+    def release(self, worker: Optional[int] = None) -> int:
+        """Put jobs left running (by ``worker``, or by anyone) back in the queue."""
+        if worker is None:
+            cursor = self.db.execute("UPDATE jobs SET state = 'pending' WHERE state = 'running'")
+        else:
+            cursor = self.db.execute(
+                "UPDATE jobs SET state = 'pending' WHERE state = 'running' AND worker = ?", (worker,)
+            )
+        return cursor.rowcount
+
+    def unmerged(self) -> List[Dict]:
+        """Finished jobs whose output hasn't been merged yet, in job order."""
+        rows = self.db.execute(
+            "SELECT id, output FROM jobs WHERE state = 'done' AND merged = 0 ORDER BY id"
+        ).fetchall()
+        return [{'id': job_id, 'output': output} for job_id, output in rows]
+
+    def mark_merged(self, job_id: int):
+        self.db.execute('UPDATE jobs SET merged = 1 WHERE id = ?', (job_id,))
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.db.execute('SELECT state, COUNT(*) FROM jobs GROUP BY state').fetchall())
+
+    def close(self):
+        self.db.close()
+
+
+class SharedDupeFilter(BaseDupeFilter):
+    """
+    Request dupefilter whose fingerprints are shared by every worker.
+
+    Requests are fingerprinted by canonical URL like CanonicalDupeFilter's
+    (see dupefilter.py). Fingerprints go into the ``fingerprints`` table of
+    FRONTIER_PATH; the insert itself is the check, so two workers racing on
+    the same URL cannot both download it. Each one is tagged with the
+    RUNNER_ATTEMPT that added it (see JobFrontier.forget).
+    """
+
+    def __init__(self, path: str, debug: bool = False, owner: Optional[str] = None):
+        self.debug = debug
+        self.owner = owner
+        self.db = connect(path)
+        _create_fingerprints(self.db)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        path = crawler.settings.get('FRONTIER_PATH')
+        if not path:
+            raise ValueError('SharedDupeFilter needs FRONTIER_PATH')
+        return cls(path, crawler.settings.getbool('DUPEFILTER_DEBUG'), crawler.settings.get('RUNNER_ATTEMPT'))
+
+    def request_seen(self, request) -> bool:
+        fp = canonical_fingerprint(request).to_bytes(8, 'big')
+        return self.db.execute('INSERT OR IGNORE INTO fingerprints (fp, owner) VALUES (?, ?)',
+                               (fp, self.owner)).rowcount == 0
+
+    def log(self, request, spider):
+        if self.debug:
+            spider.logger.debug(f"Filtered duplicate request: {request}")
+        spider.crawler.stats.inc_value('dupefilter/filtered', spider=spider)
+
+    def close(self, reason):
+        self.db.close()
+
+
+def _create_fingerprints(db: sqlite3.Connection):
+    db.execute('CREATE TABLE IF NOT EXISTS fingerprints (fp BLOB PRIMARY KEY, owner TEXT) WITHOUT ROWID')
+
+
+def store_paths(directory: str) -> Dict[str, str]:
+    """Files making up a runner store."""
+    os.makedirs(directory, exist_ok=True)
+    return {
+        'frontier': os.path.join(directory, 'frontier.sqlite3'),
+        'seen': os.path.join(directory, 'seen.sqlite3'),
+        'enrichment': os.path.join(directory, 'enrichment.sqlite3'),
+        'output': os.path.join(directory, 'output'),
+        'logs': os.path.join(directory, 'logs'),
+    }
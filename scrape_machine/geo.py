@@ -0,0 +1,121 @@
+# Geo-tiling for Maps searches.
+#
+# A Maps search returns at most a few pages of results for its viewport, so
+# one "doctor Tulsa, OK" query only ever sees the most prominent places in
+# the whole metro area. TilePlanner covers a circle (location and radius)
+# with square viewport tiles instead. A tile whose result page comes back
+# full is split into four quadrants, so dense areas are searched at finer
+# zoom while sparse ones cost a single request.
+
+import math
+import re
+from typing import List, NamedTuple, Optional, Tuple
+from urllib.parse import quote
+
+EARTH_RADIUS = 6_371_000  # meters
+# Ground resolution of zoom level 0 at the equator, in meters per pixel
+_METERS_PER_PIXEL = 156_543.03392
+# Viewport the tile has to fit in (the smaller side of Maps' default 1024x768)
+VIEWPORT_PIXELS = 768
+
+_coordinates = re.compile(r'^\s*@?(-?\d{1,2}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$')
+
+
+class Tile(NamedTuple):
+    """A square viewport centered on (lat, lng), ``radius`` meters from center to edge."""
+    lat: float
+    lng: float
+    radius: float
+    depth: int = 0
+
+
+def parse_coordinates(text: str) -> Optional[Tuple[float, float]]:
+    """(lat, lng) from a "36.15,-95.99" location, or None for place names."""
+    match = _coordinates.match(text or '')
+    if not match:
+        return None
+    lat, lng = float(match.group(1)), float(match.group(2))
+    if abs(lat) > 90 or abs(lng) > 180:
+        return None
+    return lat, lng
+
+
+def offset(lat: float, lng: float, north: float, east: float) -> Tuple[float, float]:
+    """The point ``north`` and ``east`` meters away from (lat, lng)."""
+    dlat = math.degrees(north / EARTH_RADIUS)
+    dlng = math.degrees(east / (EARTH_RADIUS * math.cos(math.radians(lat))))
+    return lat + dlat, (lng + dlng + 180) % 360 - 180
+
+
+def zoom_for(radius: float, lat: float) -> float:
+    """The Maps zoom level at which a tile of ``radius`` fills the viewport."""
+    meters_per_pixel = 2 * radius / VIEWPORT_PIXELS
+    zoom = math.log2(_METERS_PER_PIXEL * math.cos(math.radians(lat)) / meters_per_pixel)
+    return round(min(max(zoom, 3.0), 21.0), 2)
+
+
+def split(tile: Tile) -> List[Tile]:
+    """The four quadrants of ``tile``."""
+    half = tile.radius / 2
+    return [
+        Tile(*offset(tile.lat, tile.lng, north * half, east * half), half, tile.depth + 1)
+        for north in (1, -1) for east in (-1, 1)
+    ]
+
+
+def tile_url(query: str, tile: Tile) -> str:
+    """Maps search URL for ``query`` with the viewport set to ``tile``."""
+    zoom = zoom_for(tile.radius, tile.lat)
+    return f'https://www.google.com/maps/search/{quote(query)}/@{tile.lat:.6f},{tile.lng:.6f},{zoom:g}z'
+
+
+class TilePlanner:
+    """
+    Covers a circle with tiles and decides which tiles to subdivide.
+
+    ``plan`` lays a grid of ``tile_radius`` tiles over the circle, dropping
+    the ones that miss it entirely. ``children`` splits a tile whose result
+    page held at least ``saturation`` places, down to ``min_radius`` or
+    ``max_depth`` splits; an empty list means the tile's own pagination is
+    all there is left to fetch.
+    """
+
+    def __init__(self, tile_radius: float = 10_000, min_radius: float = 500,
+                 saturation: int = 20, max_depth: int = 4):
+        self.tile_radius = tile_radius
+        self.min_radius = min_radius
+        self.saturation = saturation
+        self.max_depth = max_depth
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            tile_radius=settings.getfloat('MAPS_TILE_RADIUS', 10_000),
+            min_radius=settings.getfloat('MAPS_TILE_MIN_RADIUS', 500),
+            saturation=settings.getint('MAPS_TILE_SATURATION', 20),
+            max_depth=settings.getint('MAPS_TILE_MAX_DEPTH', 4),
+        )
+
+    def plan(self, lat: float, lng: float, radius: float) -> List[Tile]:
+        """Tiles covering the circle of ``radius`` meters around (lat, lng)."""
+        if radius <= self.tile_radius:
+            return [Tile(lat, lng, radius)]
+        side = math.ceil(radius / self.tile_radius)
+        tiles = []
+        for row in range(side):
+            for column in range(side):
+                north = (2 * row - side + 1) * self.tile_radius
+                east = (2 * column - side + 1) * self.tile_radius
+                # Distance from the circle's center to the nearest point of the tile
+                dx = max(abs(east) - self.tile_radius, 0)
+                dy = max(abs(north) - self.tile_radius, 0)
+                if math.hypot(dx, dy) < radius:
+                    tiles.append(Tile(*offset(lat, lng, north, east), self.tile_radius))
+        return tiles
+
+    def children(self, tile: Tile, places: int) -> List[Tile]:
+        """The quadrants to search instead of paginating ``tile``, if its page was saturated."""
+        if (places < self.saturation or tile.depth >= self.max_depth
+                or tile.radius / 2 < self.min_radius):
+            return []
+        return split(tile)
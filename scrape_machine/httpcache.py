@@ -0,0 +1,137 @@
+# HTTP cache storage backed by a single SQLite file per spider.
+#
+# Enable with HTTPCACHE_STORAGE = 'scrape_machine.httpcache.SQLiteCacheStorage'.
+
+import os
+import sqlite3
+import time
+import zlib
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from w3lib.http import headers_dict_to_raw, headers_raw_to_dict
+
+from .blocking import BlockDetector
+
+
+class SQLiteCacheStorage:
+    """
+    Cache responses in ``<HTTPCACHE_DIR>/<spider>.sqlite3`` with zlib-compressed bodies.
+
+    Expiry is decided per request when it is looked up: the request's
+    callback name is looked up in the spider's ``httpcache_ttl`` dict, then
+    in HTTPCACHE_CALLBACK_TTL, falling back to HTTPCACHE_EXPIRATION_SECS
+    (0 means never expire). Once the stored bodies exceed
+    HTTPCACHE_SQLITE_MAX_BYTES, the least recently used entries are evicted.
+    Pages the BlockDetector flags (CAPTCHAs, "unusual traffic", empty Maps
+    pages) are not stored, so retries and later runs don't replay them.
+    """
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings['HTTPCACHE_DIR'], createdir=True)
+        self.expiration_secs = settings.getint('HTTPCACHE_EXPIRATION_SECS')
+        self.callback_ttl = settings.getdict('HTTPCACHE_CALLBACK_TTL')
+        self.max_bytes = settings.getint('HTTPCACHE_SQLITE_MAX_BYTES', 0)
+        self.compression_level = settings.getint('HTTPCACHE_SQLITE_COMPRESSION_LEVEL', 6)
+        self.timeout = settings.getfloat('HTTPCACHE_SQLITE_TIMEOUT', 30)
+        self.detector = BlockDetector.from_settings(settings)
+        self.db = None
+        self.total_bytes = 0
+        self.stats = None
+        self._fingerprinter = None
+
+    def open_spider(self, spider):
+        self.stats = spider.crawler.stats
+        self._fingerprinter = spider.crawler.request_fingerprinter
+        # Runner workers share the file; wait for each other's writes instead of failing
+        self.db = sqlite3.connect(os.path.join(self.cachedir, f'{spider.name}.sqlite3'), timeout=self.timeout)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(
+            'CREATE TABLE IF NOT EXISTS responses ('
+            'fingerprint BLOB PRIMARY KEY, url TEXT, status INTEGER, headers BLOB, '
+            'body BLOB, size INTEGER, stored_at REAL, accessed_at REAL)'
+        )
+        self.db.execute('CREATE INDEX IF NOT EXISTS responses_lru ON responses (accessed_at)')
+        self.total_bytes = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        spider.logger.debug(f"Using SQLite HTTP cache in {self.cachedir} ({self.total_bytes} bytes)")
+
+    def close_spider(self, spider):
+        self.db.commit()
+        self.db.close()
+        self.db = None
+
+    def ttl(self, spider, request):
+        """Seconds a response for ``request`` stays fresh; 0 means forever."""
+        callback = request.callback
+        name = getattr(callback, '__name__', callback) or 'parse'
+        spider_ttl = getattr(spider, 'httpcache_ttl', {})
+        if name in spider_ttl:
+            return spider_ttl[name]
+        return self.callback_ttl.get(name, self.expiration_secs)
+
+    def retrieve_response(self, spider, request):
+        """Return the cached response for ``request``, or None if missing or expired."""
+        fingerprint = self._fingerprinter.fingerprint(request)
+        row = self.db.execute(
+            'SELECT url, status, headers, body, stored_at FROM responses WHERE fingerprint = ?',
+            (fingerprint,),
+        ).fetchone()
+        if row is None:
+            return None
+        url, status, headers, body, stored_at = row
+        now = time.time()
+        ttl = self.ttl(spider, request)
+        if ttl and now - stored_at > ttl:
+            self.stats.inc_value('httpcache/expired', spider=spider)
+            return None
+        # Committed at once: an open write transaction would lock out other processes
+        with self.db:
+            self.db.execute('UPDATE responses SET accessed_at = ? WHERE fingerprint = ?', (now, fingerprint))
+        headers = Headers(headers_raw_to_dict(headers))
+        body = zlib.decompress(body)
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        """Store ``response`` and evict old entries if the cache is over its size cap."""
+        if self.detector.classify(response) is not None:
+            self.stats.inc_value('httpcache/skipped_blocked', spider=spider)
+            return
+        fingerprint = self._fingerprinter.fingerprint(request)
+        body = zlib.compress(response.body, self.compression_level)
+        headers = headers_dict_to_raw(response.headers)
+        size = len(body) + len(headers)
+        now = time.time()
+        previous = self.db.execute('SELECT size FROM responses WHERE fingerprint = ?', (fingerprint,)).fetchone()
+        with self.db:
+            self.db.execute(
+                'INSERT OR REPLACE INTO responses '
+                '(fingerprint, url, status, headers, body, size, stored_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (fingerprint, response.url, response.status, headers, body, size, now, now),
+            )
+        self.total_bytes += size - (previous[0] if previous else 0)
+        self.stats.inc_value('httpcache/stored_bytes', size, spider=spider)
+        if self.max_bytes and self.total_bytes > self.max_bytes:
+            self.evict(spider)
+
+    def evict(self, spider):
+        """Drop least recently used entries until the cache is back to 90% of its cap."""
+        target = self.max_bytes * 0.9
+        evicted = 0
+        with self.db:
+            while self.total_bytes > target:
+                rows = self.db.execute(
+                    'SELECT fingerprint, size FROM responses ORDER BY accessed_at LIMIT 100'
+                ).fetchall()
+                if not rows:
+                    break
+                for fingerprint, size in rows:
+                    self.db.execute('DELETE FROM responses WHERE fingerprint = ?', (fingerprint,))
+                    self.total_bytes -= size
+                    evicted += 1
+                    if self.total_bytes <= target:
+                        break
+        self.stats.inc_value('httpcache/evicted', evicted, spider=spider)
@@ -28,15 +28,22 @@ class LeadItem(Item):
     - scraped_date: When this lead was scraped
     - address: Physical address
     - rating: Business rating (e.g., from Google Maps)
+    - place_id: Google Maps place id
+    
+    ``normalize`` lists the steps LeadPipeline applies to each field (see
+    scrape_machine/normalize.py). ``dtype`` (default 'string') and
+    ``dictionary`` (low-cardinality values) shape the CSV and Parquet
+    columns (see scrape_machine/writers.py).
     """
-    name = Field()
-    email = Field()
-    phone = Field()
-    company = Field()
-    position = Field()
-    website = Field()
-    linkedin_url = Field()
-    source = Field()
-    scraped_date = Field()
-    address = Field()
-    rating = Field()
+    name = Field(normalize=('text',))
+    email = Field(normalize=('email',))
+    phone = Field(normalize=('phone',))
+    company = Field(normalize=('text',))
+    position = Field(normalize=('text',))
+    website = Field(normalize=('url',))
+    linkedin_url = Field(normalize=('url',))
+    source = Field(normalize=('strip',), dictionary=True)
+    scraped_date = Field(normalize=('strip',))
+    address = Field(normalize=('text',))
+    rating = Field(dtype='float64')
+    place_id = Field(normalize=('strip',))
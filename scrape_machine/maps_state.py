@@ -0,0 +1,167 @@
+# Decoder for the data Google Maps embeds in its search pages.
+#
+# Search pages assign a large JSON array to window.APP_INITIALIZATION_STATE.
+# The search results themselves are a second JSON document stored as a
+# string inside that array, prefixed with the anti-XSSI guard ")]}'". The
+# paginated /search endpoint returns that inner document directly.
+
+import json
+import re
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+from .decoding import page_text
+
+STATE_MARKER = 'window.APP_INITIALIZATION_STATE='
+XSSI_PREFIX = ")]}'"
+
+_decoder = json.JSONDecoder()
+# The token of a search's next results page; in a search page it sits inside
+# JSON strings, with its quotes escaped once or twice
+_next_page_token = re.compile(r'\\*"VQF1hc\\*":\\*"([^"\\]+)')
+
+# Positions of each field inside a place array. Google moves things around
+# from time to time, so every field lists the paths to try in order.
+PLACE_SCHEMA: Dict[str, Sequence[Tuple[int, ...]]] = {
+    'name': [(11,)],
+    'address': [(39,), (18,)],
+    'phone': [(178, 0, 0), (178, 0, 1, 1, 0)],
+    'website': [(7, 0)],
+    'rating': [(4, 7)],
+    'place_id': [(78,)],
+    'lat': [(9, 2)],
+    'lng': [(9, 3)],
+}
+
+# A list is treated as a place when it is at least this long and has a
+# string name and a place id where the schema expects them.
+_MIN_PLACE_LENGTH = 79
+
+
+def load_state(text: str) -> Optional[Any]:
+    """
+    Parse the state embedded in a Maps page, or a bare ``)]}'`` JSON payload.
+
+    The array is decoded once from where the assignment starts, so semicolons
+    and brackets inside strings don't cut it short.
+    """
+    stripped = text.lstrip()
+    if stripped.startswith(XSSI_PREFIX):
+        return _decode_guarded(stripped)
+    start = text.find(STATE_MARKER)
+    if start == -1:
+        return None
+    try:
+        state, _ = _decoder.raw_decode(text, start + len(STATE_MARKER))
+    except json.JSONDecodeError:
+        return None
+    return state
+
+
+def _decode_guarded(value: str) -> Optional[Any]:
+    try:
+        return json.loads(value[len(XSSI_PREFIX):])
+    except json.JSONDecodeError:
+        return None
+
+
+def get_path(node: Any, path: Tuple[int, ...]) -> Any:
+    """Follow ``path`` through nested lists, returning None if any step is missing."""
+    for index in path:
+        if not isinstance(node, list) or index >= len(node):
+            return None
+        node = node[index]
+    return node
+
+
+def is_place(node: List[Any]) -> bool:
+    """Whether a list looks like a place record."""
+    return (
+        len(node) >= _MIN_PLACE_LENGTH
+        and isinstance(node[11], str)
+        and isinstance(node[78], str)
+        and node[78].startswith('ChIJ')
+    )
+
+
+def extract_place(node: List[Any]) -> Dict[str, Any]:
+    """Pull the schema fields out of a place array."""
+    place = {}
+    for field, paths in PLACE_SCHEMA.items():
+        for path in paths:
+            value = get_path(node, path)
+            if value not in (None, '', []):
+                place[field] = value
+                break
+    address = place.get('address')
+    if isinstance(address, list):
+        place['address'] = ', '.join(part for part in address if isinstance(part, str)) or None
+    return place
+
+
+def iter_places(state: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Walk a decoded state tree and yield every place found in it.
+
+    Strings carrying a ``)]}'``-guarded JSON payload are decoded and walked
+    too. Each place id is yielded once.
+    """
+    seen = set()
+    stack = [state]
+    pop, push, extend = stack.pop, stack.append, stack.extend
+    while stack:
+        node = pop()
+        kind = type(node)
+        if kind is list:
+            if len(node) >= _MIN_PLACE_LENGTH and is_place(node):
+                place = extract_place(node)
+                if place['place_id'] not in seen:
+                    seen.add(place['place_id'])
+                    yield place
+            else:
+                extend(reversed(node))
+        elif kind is str:
+            if node.startswith(XSSI_PREFIX):
+                nested = _decode_guarded(node)
+                if nested is not None:
+                    push(nested)
+        elif kind is dict:
+            extend(node.values())
+
+
+def iter_page_places(text: str) -> Iterator[Dict[str, Any]]:
+    """Yield the places found in a Maps search page or /search payload."""
+    state = load_state(text)
+    if state is not None:
+        yield from iter_places(state)
+
+
+def viewport_center(state: Any) -> Optional[Tuple[float, float]]:
+    """(lat, lng) of the map viewport a search page was rendered for, if present."""
+    camera = get_path(state, (0, 0))
+    if (isinstance(camera, list) and len(camera) >= 3
+            and all(isinstance(value, (int, float)) for value in camera[1:3])):
+        return float(camera[2]), float(camera[1])
+    return None
+
+
+class SearchPage(NamedTuple):
+    """What a Maps search page holds: whether it had state at all, its places, viewport and next page."""
+    found: bool
+    places: List[Dict[str, Any]]
+    center: Optional[Tuple[float, float]]
+    next_token: Optional[str]
+
+
+def parse_search_page(response) -> SearchPage:
+    """
+    Decode a Maps search response in one go.
+
+    Module-level and returning plain data, so it can run in an offload
+    worker (see offload.run_on_response).
+    """
+    text = page_text(response) or ''
+    state = load_state(text)
+    if state is None:
+        return SearchPage(False, [], None, None)
+    token = _next_page_token.search(text)
+    return SearchPage(True, list(iter_places(state)), viewport_center(state), token.group(1) if token else None)
@@ -0,0 +1,257 @@
+# Histograms for the crawl's hot paths and the extension that reports them.
+#
+# The instrumentation middlewares (see middlewares.py) and
+# TimedPipelineManager, the ITEM_PROCESSOR, record into one MetricsRegistry
+# per crawler. The extension copies summaries into the Scrapy stats, logs them
+# as a JSON line every METRICS_LOG_INTERVAL seconds and, with
+# METRICS_PROMETHEUS_PORT set, serves them in Prometheus text format.
+
+import inspect
+import json
+import time
+import weakref
+from bisect import bisect_left
+from typing import Dict, Iterable, Tuple
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.pipelines import ItemPipelineManager
+from scrapy.utils.defer import deferred_from_coro
+from twisted.internet import defer
+
+# Upper bounds, in seconds, from 1ms to ~65s
+TIME_BUCKETS = tuple(0.001 * 2 ** i for i in range(17))
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+INFLIGHT_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``counts[i]`` holds observations <= ``buckets[i]``, the last slot the rest."""
+
+    __slots__ = ('buckets', 'counts', 'count', 'sum', 'max')
+
+    def __init__(self, buckets: Iterable[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """Estimate the ``q`` quantile by interpolating inside its bucket."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = self.buckets[i - 1] if i else 0.0
+                high = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(low + (high - low) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 6),
+            'mean': round(self.sum / self.count, 6) if self.count else 0.0,
+            'p50': round(self.quantile(0.5), 6),
+            'p95': round(self.quantile(0.95), 6),
+            'p99': round(self.quantile(0.99), 6),
+            'max': round(self.max, 6),
+        }
+
+
+class MetricsRegistry:
+    """Histograms and gauges keyed by metric name and a single label value."""
+
+    def __init__(self):
+        self.histograms: Dict[Tuple[str, str], Histogram] = {}
+        self.gauges: Dict[str, float] = {}
+        self.label_names: Dict[str, str] = {}
+
+    def observe(self, name: str, label: str, value: float, buckets=TIME_BUCKETS, label_name: str = 'name'):
+        histogram = self.histograms.get((name, label))
+        if histogram is None:
+            histogram = self.histograms[name, label] = Histogram(buckets)
+            self.label_names[name] = label_name
+        histogram.observe(value)
+
+    def set_gauge(self, name: str, value: float):
+        self.gauges[name] = value
+
+    def snapshot(self) -> Dict:
+        """Summaries of every histogram, grouped by metric, plus the gauges."""
+        data = {}
+        for (name, label), histogram in sorted(self.histograms.items()):
+            data.setdefault(name, {})[label] = histogram.summary()
+        data.update(self.gauges)
+        return data
+
+    def to_stats(self, stats, spider=None):
+        """Copy the summaries into Scrapy stats as ``metrics/<name>/<label>/<field>``."""
+        for (name, label), histogram in self.histograms.items():
+            for field, value in histogram.summary().items():
+                stats.set_value(f'metrics/{name}/{label}/{field}', value, spider=spider)
+        for name, value in self.gauges.items():
+            stats.set_value(f'metrics/{name}', value, spider=spider)
+
+    def prometheus_text(self, prefix: str = 'scrape_machine') -> str:
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        declared = set()
+        for (name, label), histogram in sorted(self.histograms.items()):
+            metric = f'{prefix}_{name}'
+            if metric not in declared:
+                lines.append(f'# TYPE {metric} histogram')
+                declared.add(metric)
+            label_value = label.replace('\\', '\\\\').replace('"', '\\"')
+            labels = f'{self.label_names[name]}="{label_value}"'
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, histogram.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{labels},le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+            lines.append(f'{metric}_sum{{{labels}}} {histogram.sum:.6f}')
+            lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        for name, value in sorted(self.gauges.items()):
+            lines.append(f'# TYPE {prefix}_{name} gauge')
+            lines.append(f'{prefix}_{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+_registries = weakref.WeakKeyDictionary()
+
+
+def registry_for(crawler) -> MetricsRegistry:
+    """The crawler's shared registry, created on first use."""
+    registry = _registries.get(crawler)
+    if registry is None:
+        registry = _registries[crawler] = MetricsRegistry()
+    return registry
+
+
+class TimedStage:
+    """A pipeline whose process_item is timed into its manager's registry; everything else is the pipeline's."""
+
+    def __init__(self, pipe, manager):
+        self.pipe = pipe
+        self.manager = manager
+        self.name = type(pipe).__name__
+
+    def __getattr__(self, name):
+        return getattr(self.pipe, name)
+
+    def process_item(self, item, spider):
+        registry = self.manager.registry
+        if registry is None:
+            return self.pipe.process_item(item, spider)
+        start = time.perf_counter()
+
+        def observe(result):
+            registry.observe('pipeline_seconds', self.name, time.perf_counter() - start, label_name='stage')
+            return result
+        try:
+            result = self.pipe.process_item(item, spider)
+        except BaseException:
+            observe(None)
+            raise
+        if inspect.isawaitable(result) and not isinstance(result, defer.Deferred):
+            result = deferred_from_coro(result)
+        if isinstance(result, defer.Deferred):
+            # Asynchronous stages are timed until their result is ready
+            return result.addBoth(observe)
+        return observe(result)
+
+
+class TimedPipelineManager(ItemPipelineManager):
+    """
+    The item processor (ITEM_PROCESSOR), timing each pipeline into ``pipeline_seconds``.
+
+    Stages are timed from the call until the item comes out, Deferred or
+    coroutine results included. With METRICS_ENABLED off it only runs the
+    pipelines, like Scrapy's own manager.
+    """
+
+    def __init__(self, *pipes):
+        self.registry = None
+        super().__init__(*(TimedStage(pipe, self) if hasattr(pipe, 'process_item') else pipe for pipe in pipes))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        manager = super().from_crawler(crawler)
+        if crawler.settings.getbool('METRICS_ENABLED'):
+            manager.registry = registry_for(crawler)
+        return manager
+
+
+class MetricsExtension:
+    """
+    Reports the crawler's metrics.
+
+    Summaries are copied into the stats every log interval and when the
+    spider closes.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        self.crawler = crawler
+        self.registry = registry_for(crawler)
+        self.log_interval = settings.getfloat('METRICS_LOG_INTERVAL', 60)
+        self.port = settings.getint('METRICS_PROMETHEUS_PORT', 0)
+        self.host = settings.get('METRICS_PROMETHEUS_HOST', '127.0.0.1')
+        self.task = None
+        self.listener = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_opened(self, spider):
+        if self.log_interval > 0:
+            from twisted.internet.task import LoopingCall
+            self.task = LoopingCall(self.report, spider)
+            self.task.start(self.log_interval, now=False)
+        if self.port:
+            self.listen(spider)
+
+    def spider_closed(self, spider):
+        if self.task and self.task.running:
+            self.task.stop()
+        self.registry.to_stats(self.crawler.stats, spider=spider)
+        if self.listener is not None:
+            return self.listener.stopListening()
+
+    def report(self, spider):
+        self.registry.to_stats(self.crawler.stats, spider=spider)
+        spider.logger.info(f"Metrics: {json.dumps(self.registry.snapshot(), sort_keys=True)}")
+
+    def listen(self, spider):
+        from twisted.internet import reactor
+        from twisted.web.resource import Resource
+        from twisted.web.server import Site
+
+        registry = self.registry
+
+        class MetricsResource(Resource):
+            isLeaf = True
+
+            def render_GET(self, request):
+                request.setHeader(b'Content-Type', b'text/plain; version=0.0.4')
+                return registry.prometheus_text().encode()
+
+        self.listener = reactor.listenTCP(self.port, Site(MetricsResource()), interface=self.host)
+        spider.logger.info(f"Serving Prometheus metrics on http://{self.host}:{self.listener.getHost().port}/metrics")
@@ -3,101 +3,514 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/spider-middleware.html
 
+import itertools
+import random
+import time
+import weakref
+from collections import deque
+from typing import Optional
+
 from scrapy import signals
+from scrapy.downloadermiddlewares.offsite import OffsiteMiddleware as ScrapyOffsiteMiddleware
+from scrapy.exceptions import IgnoreRequest, NotConfigured
+from scrapy.utils.httpobj import urlparse_cached
+from scrapy.utils.misc import load_object
+from twisted.internet.defer import Deferred
 
 # useful for handling different item types with a single interface
 from itemadapter import is_item, ItemAdapter
 
+from .blocking import AIMDController, BlockDetector, slot_key
+from .debugcapture import capture_for
+from .metrics import COUNT_BUCKETS, INFLIGHT_BUCKETS, registry_for
+from .normalize import registrable_domain
+from .proxies import ProxyPool
+
 
 class ScrapeMachineSpiderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the spider middleware does not modify the
-    # passed objects.
+    """
+    Times every spider callback and counts the items it yields.
+
+    Callback time is the wall time spent inside the callback while its
+    output is consumed (for async callbacks this includes what they await),
+    recorded per callback name in ``callback_seconds``; ``callback_items``
+    holds the number of items each call produced. Place it last (highest
+    order) so it wraps the callback's raw output.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(registry_for(crawler))
 
-    def process_spider_input(self, response, spider):
-        # Called for each response that goes through the spider
-        # middleware and into the spider.
+    def callback_name(self, response):
+        callback = getattr(response.request, 'callback', None)
+        return getattr(callback, '__name__', None) or 'parse'
 
-        # Should return None or raise an exception.
-        return None
+    def record(self, response, elapsed, items):
+        name = self.callback_name(response)
+        self.registry.observe('callback_seconds', name, elapsed, label_name='callback')
+        self.registry.observe('callback_items', name, items, buckets=COUNT_BUCKETS, label_name='callback')
 
     def process_spider_output(self, response, result, spider):
-        # Called with the results returned from the Spider, after
-        # it has processed the response.
+        elapsed, items = 0.0, 0
+        iterator = iter(result)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    value = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                if is_item(value):
+                    items += 1
+                yield value
+        finally:
+            self.record(response, elapsed, items)
 
-        # Must return an iterable of Request, or item objects.
-        for i in result:
-            yield i
+    async def process_spider_output_async(self, response, result, spider):
+        elapsed, items = 0.0, 0
+        iterator = result.__aiter__()
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    value = await iterator.__anext__()
+                except StopAsyncIteration:
+                    return
+                finally:
+                    elapsed += time.perf_counter() - start
+                if is_item(value):
+                    items += 1
+                yield value
+        finally:
+            self.record(response, elapsed, items)
 
-    def process_spider_exception(self, response, exception, spider):
-        # Called when a spider or process_spider_input() method
-        # (from other spider middleware) raises an exception.
 
-        # Should return either None or an iterable of Request or item objects.
-        pass
+class ScrapeMachineDownloaderMiddleware:
+    """
+    Records download latency per domain and the number of requests in flight.
 
-    def process_start_requests(self, start_requests, spider):
-        # Called with the start requests of the spider, and works
-        # similarly to the process_spider_output() method, except
-        # that it doesn’t have a response associated.
+    Enable it with a high order so it runs right before the downloader:
+    time spent in earlier middlewares (politeness delays, for one) is then
+    not counted as latency. Latency lands in ``download_seconds`` by
+    hostname; past METRICS_MAX_DOMAINS hostnames (enrichment visits
+    thousands of business sites) the rest share the ``other`` label. Every
+    request entering the downloader adds the current
+    in-flight count to ``inflight_requests`` and updates the
+    ``inflight_requests_current`` gauge.
+    """
 
-        # Must return only requests (not items).
-        for r in start_requests:
-            yield r
+    def __init__(self, registry, max_domains=50):
+        self.registry = registry
+        self.max_domains = max_domains
+        self.domains = set()
+        self.inflight = 0
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+    @classmethod
+    def from_crawler(cls, crawler):
+        if not crawler.settings.getbool('METRICS_ENABLED'):
+            raise NotConfigured
+        return cls(registry_for(crawler), crawler.settings.getint('METRICS_MAX_DOMAINS', 50))
 
+    def domain_label(self, request):
+        domain = urlparse_cached(request).hostname or ''
+        if domain not in self.domains:
+            if len(self.domains) >= self.max_domains:
+                return 'other'
+            self.domains.add(domain)
+        return domain
+
+    def process_request(self, request, spider):
+        request.meta['metrics_start'] = time.perf_counter()
+        self.inflight += 1
+        self.registry.observe('inflight_requests', 'downloader', self.inflight, buckets=INFLIGHT_BUCKETS,
+                              label_name='stage')
+        self.registry.set_gauge('inflight_requests_current', self.inflight)
+        return None
+
+    def finish(self, request):
+        start = request.meta.pop('metrics_start', None)
+        if start is None:
+            return
+        self.inflight -= 1
+        self.registry.set_gauge('inflight_requests_current', self.inflight)
+        self.registry.observe('download_seconds', self.domain_label(request), time.perf_counter() - start,
+                              label_name='domain')
+
+    def process_response(self, request, response, spider):
+        self.finish(request)
+        return response
+
+    def process_exception(self, request, exception, spider):
+        self.finish(request)
+        return None
 
-class ScrapeMachineDownloaderMiddleware:
-    # Not all methods need to be defined. If a method is not defined,
-    # scrapy acts as if the downloader middleware does not modify the
-    # passed objects.
+
+_politeness = weakref.WeakKeyDictionary()
+
+
+def politeness_for(crawler) -> Optional['PolitenessMiddleware']:
+    """The crawler's PolitenessMiddleware, or None when it isn't enabled."""
+    return _politeness.get(crawler)
+
+
+class PolitenessMiddleware:
+    """
+    Jittered per-domain delays, adaptive concurrency and exponential backoff, without holding up other domains.
+
+    Each domain lets one request through per delay, drawn afresh each time.
+    PoliteScheduler (see scheduler.py) holds requests until their domain is
+    due, so waiting ones stay out of the downloader and don't take up
+    CONCURRENT_REQUESTS that other domains could use. A request that still
+    arrives early is handed back to it.
+
+    With AIMD_ENABLED the delay and the downloader slot's concurrency are
+    driven by an AIMDController (see blocking.py), starting from the middle
+    of POLITENESS_DELAY (or a POLITENESS_DOMAIN_DELAYS override): good
+    responses speed a domain up step by step, blocks slow it down sharply.
+    Without it, delays are drawn from those bounds.
+
+    Blocked responses, as judged by the BlockDetector (BLOCK_* settings),
+    also block the whole domain for an exponentially growing, jittered
+    amount, including requests already waiting for their time, and
+    reschedule the request, up to POLITENESS_MAX_RETRIES times.
+
+    Domains are really downloader slots: with ProxyPoolMiddleware each
+    proxy gets its own slot per host, so every exit IP is paced separately.
+    Requests that never reach a site, like local ``data:`` ones, set
+    ``meta['dont_politeness']`` and are left alone.
+
+    All settings can be overridden per spider through ``custom_settings``.
+    """
+
+    def __init__(self, settings, stats, crawler=None):
+        if not settings.getbool('POLITENESS_ENABLED'):
+            raise NotConfigured
+        from .scheduler import PoliteScheduler
+        if not issubclass(load_object(settings['SCHEDULER']), PoliteScheduler):
+            raise NotConfigured('PolitenessMiddleware needs SCHEDULER = scrape_machine.scheduler.PoliteScheduler')
+        self.stats = stats
+        self.crawler = crawler
+        self.capture = capture_for(crawler) if crawler else None
+        self.delay = tuple(settings.getlist('POLITENESS_DELAY', [0, 0]))
+        self.domain_delays = settings.getdict('POLITENESS_DOMAIN_DELAYS')
+        self.backoff_base = settings.getfloat('POLITENESS_BACKOFF_BASE', 30)
+        self.backoff_max = settings.getfloat('POLITENESS_BACKOFF_MAX', 600)
+        self.max_retries = settings.getint('POLITENESS_MAX_RETRIES', 5)
+        self.detector = BlockDetector.from_settings(settings)
+        self.aimd = AIMDController.from_settings(settings) if settings.getbool('AIMD_ENABLED') else None
+        self.next_slot = {}
+        self.blocked_until = {}
 
     @classmethod
     def from_crawler(cls, crawler):
-        # This method is used by Scrapy to create your spiders.
-        s = cls()
-        crawler.signals.connect(s.spider_opened, signal=signals.spider_opened)
-        return s
+        middleware = _politeness[crawler] = cls(crawler.settings, crawler.stats, crawler)
+        return middleware
+
+    def delay_bounds(self, domain):
+        # Proxied requests are keyed '<host>@<proxy>' (see ProxyPoolMiddleware)
+        domain = domain.split('@', 1)[0]
+        for suffix, bounds in self.domain_delays.items():
+            if domain == suffix or domain.endswith('.' + suffix):
+                return bounds
+        return self.delay
+
+    def domain_limits(self, domain):
+        """The domain's AIMD state, starting from the middle of its delay bounds."""
+        low, high = self.delay_bounds(domain)
+        return self.aimd.limits(domain, start_delay=(float(low) + float(high)) / 2)
+
+    def domain_delay(self, domain):
+        """Draw the gap to leave after a request to ``domain``."""
+        if self.aimd is None:
+            low, high = self.delay_bounds(domain)
+            return random.uniform(float(low), float(high))
+        return self.domain_limits(domain).delay * random.uniform(0.5, 1.5)
+
+    def due_at(self, domain):
+        """When ``domain`` may be sent its next request, in time.monotonic() terms."""
+        return max(self.next_slot.get(domain, 0.0), self.blocked_until.get(domain, 0.0))
 
     def process_request(self, request, spider):
-        # Called for each request that goes through the downloader
-        # middleware.
-
-        # Must either:
-        # - return None: continue processing this request
-        # - or return a Response object
-        # - or return a Request object
-        # - or raise IgnoreRequest: process_exception() methods of
-        #   installed downloader middleware will be called
+        if request.meta.get('dont_politeness'):
+            return None
+        domain = slot_key(request)
+        now = time.monotonic()
+        ready = self.due_at(domain)
+        if ready > now:
+            # Back to the scheduler until the domain is free
+            request.meta['politeness_due'] = (domain, ready)
+            return request
+        # Drawn now rather than when the request arrived, so rate changes apply at once
+        self.next_slot[domain] = now + self.domain_delay(domain)
+        since = request.meta.pop('politeness_since', None)
+        if since is not None:
+            self.stats.inc_value('politeness/delay_seconds', round(now - since, 3), spider=spider)
+        if self.aimd is not None:
+            self.domain_limits(domain)
+            request.meta['aimd_seq'] = self.aimd.on_send(domain)
         return None
 
+    def apply_concurrency(self, request, limits):
+        """Resize the request's downloader slot to the controller's concurrency."""
+        engine = self.crawler.engine if self.crawler else None
+        slot = engine.downloader.slots.get(slot_key(request)) if engine else None
+        if slot is not None:
+            slot.concurrency = max(1, int(limits.concurrency))
+
     def process_response(self, request, response, spider):
-        # Called with the response returned from the downloader.
+        if request.meta.get('dont_politeness'):
+            return response
+        domain = slot_key(request)
+        reason = self.detector.classify(response)
+        if reason is None:
+            if self.aimd is not None:
+                self.apply_concurrency(request, self.aimd.on_success(domain))
+            return response
+
+        self.stats.inc_value(f'blocking/{reason}', spider=spider)
+        if self.capture is not None:
+            self.capture.capture('blocked', response, request, spider, reason=reason)
+        attempt = request.meta.get('backoff_attempt', 0) + 1
+        if attempt > self.max_retries:
+            spider.logger.error(f"Still blocked after {self.max_retries} backoffs, giving up on {request.url}")
+            self.stats.inc_value('politeness/backoff_gave_up', spider=spider)
+            return response
+
+        # With AIMD, only the first block of a window slows the domain down;
+        # the others were already in flight and are just retried
+        fresh_block = True
+        if self.aimd is not None:
+            limits = self.aimd.on_block(domain, request.meta.get('aimd_seq', 0))
+            fresh_block = limits is not None
+            if fresh_block:
+                self.apply_concurrency(request, limits)
+                spider.logger.info(f"{domain} slowed to {limits.delay:.2f}s delay, "
+                                   f"concurrency {limits.concurrency:.1f}")
+        if fresh_block:
+            backoff = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+            backoff *= random.uniform(0.5, 1.5)
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.isdigit():
+                backoff = max(backoff, float(retry_after))
+            self.blocked_until[domain] = max(self.blocked_until.get(domain, 0), time.monotonic() + backoff)
+            spider.logger.warning(f"Blocked on {domain} ({reason}, attempt {attempt}), backing off {backoff:.0f}s")
+            self.stats.inc_value('politeness/backoff', spider=spider)
+        # A CAPTCHA redirect is retried from the URL originally asked for
+        url = request.meta.get('redirect_urls', [request.url])[0]
+        retry = request.replace(url=url, dont_filter=True)
+        retry.meta.pop('redirect_urls', None)
+        retry.meta.pop('redirect_times', None)
+        retry.meta['backoff_attempt'] = attempt
+        # The blocked answer may be in the HTTP cache; the retry has to reach the site
+        retry.meta['dont_cache'] = True
+        return retry
 
-        # Must either;
-        # - return a Response object
-        # - return a Request object
-        # - or raise IgnoreRequest
+
+class OffsiteMiddleware(ScrapyOffsiteMiddleware):
+    """
+    Scrapy's OffsiteMiddleware, letting through requests with ``meta['allow_offsite']``.
+
+    Spiders used ``dont_filter=True`` to reach sites outside
+    ``allowed_domains`` (business websites), which also turned off the
+    dupefilter. This is the meta key later Scrapy versions honour.
+    """
+
+    def process_request(self, request, spider):
+        if request.meta.get('allow_offsite'):
+            return None
+        return super().process_request(request, spider)
+
+
+class EnrichmentCancelMiddleware:
+    """
+    Drop queued website-enrichment requests whose domain is already finished.
+
+    Spiders tag enrichment requests with ``meta['enrichment_domain']`` and
+    expose an ``enrichment`` cache (see scrape_machine/enrichment.py). Once
+    one page of a domain yields an email, its remaining candidate pages are
+    not downloaded.
+    """
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler.stats)
+
+    def process_request(self, request, spider):
+        domain = request.meta.get('enrichment_domain')
+        enrichment = getattr(spider, 'enrichment', None)
+        if domain and enrichment is not None and enrichment.is_done(domain):
+            self.stats.inc_value('enrichment/cancelled', spider=spider)
+            raise IgnoreRequest(f"Enrichment of {domain} already finished")
+        return None
+
+
+class ProxyPoolMiddleware:
+    """
+    Send requests through a health-scored pool of proxies (see proxies.py).
+
+    Proxies come from PROXY_LIST and/or PROXY_LIST_FILE; without any the
+    middleware is disabled. Each request gets the best proxy with a free
+    slot (PROXY_CONCURRENCY per proxy) in ``meta['proxy']``, which
+    HttpProxyMiddleware then applies, and a ``download_slot`` of
+    ``<host>@<proxy>`` so downloader concurrency, politeness delays and AIMD
+    all work per exit IP. When no proxy is free the request waits on a
+    Deferred until one is released or comes out of quarantine.
+
+    Requests to PROXY_STICKY_DOMAINS (or with ``meta['proxy_session']``)
+    keep using the proxy their session started on, per cookie jar, until
+    that proxy is quarantined. Requests that set ``meta['proxy']``
+    themselves, or ``meta['dont_proxy']``, are left alone.
+
+    Outcomes are taken from the raw download (the ``response_downloaded``
+    signal), before PolitenessMiddleware turns blocks into retries, so
+    enable it between RetryMiddleware and PolitenessMiddleware. Per-proxy
+    counts land in the stats as ``proxies/<host:port>/<outcome>``.
+    """
+
+    def __init__(self, crawler, pool):
+        self.crawler = crawler
+        self.stats = crawler.stats
+        self.pool = pool
+        self.detector = BlockDetector.from_settings(crawler.settings)
+        self.sticky_domains = set(crawler.settings.getlist('PROXY_STICKY_DOMAINS'))
+        self.registry = registry_for(crawler) if crawler.settings.getbool('METRICS_ENABLED') else None
+        self.leases = {}
+        self.tokens = itertools.count(1)
+        self.waiting = deque()
+        self.timer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pool = ProxyPool.from_settings(crawler.settings)
+        if not len(pool):
+            raise NotConfigured
+        middleware = cls(crawler, pool)
+        crawler.signals.connect(middleware.response_downloaded, signal=signals.response_downloaded)
+        crawler.signals.connect(middleware.request_scheduled, signal=signals.request_scheduled)
+        crawler.signals.connect(middleware.spider_closed, signal=signals.spider_closed)
+        return middleware
+
+    def session_key(self, request):
+        session = request.meta.get('proxy_session')
+        if session is None:
+            domain = registrable_domain(request.url)
+            if domain not in self.sticky_domains:
+                return None
+            session = domain
+        return f"{request.meta.get('cookiejar', 0)}:{session}"
+
+    def process_request(self, request, spider):
+        if request.meta.get('dont_proxy') or ('proxy' in request.meta and 'proxy_lease' not in request.meta):
+            return None
+        # A retried request still carries its previous lease
+        self.release(request, None)
+        request.meta.pop('proxy', None)
+        request.meta.pop('download_slot', None)
+        session = self.session_key(request)
+        proxy = self.pool.acquire(session)
+        if proxy is not None:
+            self.assign(request, proxy)
+            return None
+        d = Deferred()
+        self.waiting.append((d, request, session))
+        self.stats.inc_value('proxies/waited', spider=spider)
+        self.schedule()
+        return d
+
+    def assign(self, request, proxy):
+        token = next(self.tokens)
+        self.leases[token] = (proxy, time.monotonic())
+        request.meta['proxy_lease'] = token
+        request.meta['proxy'] = proxy.url
+        request.meta['download_slot'] = f'{urlparse_cached(request).hostname}@{proxy.name}'
+
+    def dispatch(self):
+        """Hand freed proxies to waiting requests, oldest first."""
+        self.timer = None
+        still_waiting = deque()
+        while self.waiting:
+            d, request, session = self.waiting.popleft()
+            proxy = self.pool.acquire(session)
+            if proxy is None:
+                still_waiting.append((d, request, session))
+                continue
+            self.assign(request, proxy)
+            d.callback(None)
+        self.waiting = still_waiting
+        self.schedule()
+
+    def schedule(self):
+        """Wake the waiting requests when the next quarantined proxy comes back."""
+        wait = self.pool.next_available()
+        if self.waiting and wait is not None:
+            self.wake(wait)
+
+    def wake(self, delay):
+        """Run ``dispatch`` in ``delay`` seconds, unless it is already due sooner."""
+        from twisted.internet import reactor
+        if self.timer is not None and self.timer.active():
+            if self.timer.getTime() <= reactor.seconds() + delay:
+                return
+            self.timer.cancel()
+        self.timer = reactor.callLater(delay, self.dispatch)
+
+    def release(self, request, outcome, latency=None):
+        lease = self.leases.pop(request.meta.get('proxy_lease'), None)
+        if lease is None:
+            return
+        proxy, started = lease
+        if latency is None:
+            latency = time.monotonic() - started
+        cooldown = self.pool.release(proxy, outcome, latency)
+        if outcome is not None:
+            self.stats.inc_value(f'proxies/{proxy.name}/{outcome}')
+            if self.registry is not None and outcome != 'error':
+                self.registry.observe('proxy_seconds', proxy.name, latency, label_name='proxy')
+        if cooldown is not None:
+            self.stats.inc_value(f'proxies/{proxy.name}/quarantined')
+            self.crawler.spider.logger.warning(f"Proxy {proxy.name} quarantined for {cooldown:.0f}s")
+        if self.waiting:
+            # Not inline: resuming a request can release another lease on the way
+            self.wake(0)
+
+    def request_scheduled(self, request, spider):
+        # Retried, or sent back to wait for its politeness delay: the proxy is picked again later
+        self.release(request, None)
+
+    def response_downloaded(self, response, request, spider):
+        status = response.status
+        if self.detector.classify(response):
+            outcome = 'block'
+        elif status >= 500 or status == 407:
+            outcome = 'error'
+        else:
+            outcome = 'ok'
+        self.release(request, outcome, request.meta.get('download_latency'))
+
+    def process_response(self, request, response, spider):
+        # Served without a download (e.g. from the HTTP cache): the proxy wasn't used
+        self.release(request, None)
         return response
 
     def process_exception(self, request, exception, spider):
-        # Called when a download handler or a process_request()
-        # (from other downloader middleware) raises an exception.
-
-        # Must either:
-        # - return None: continue processing this exception
-        # - return a Response object: stops process_exception() chain
-        # - return a Request object: stops process_exception() chain
-        pass
+        self.release(request, None if isinstance(exception, IgnoreRequest) else 'error')
+        return None
 
-    def spider_opened(self, spider):
-        spider.logger.info("Spider opened: %s" % spider.name)
+    def spider_closed(self, spider):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        for proxy in self.pool.proxies.values():
+            if proxy.latency is not None:
+                self.stats.set_value(f'proxies/{proxy.name}/latency_ms', round(proxy.latency * 1000))
+            self.stats.set_value(f'proxies/{proxy.name}/score', round(proxy.score(), 3))
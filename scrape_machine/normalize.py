@@ -0,0 +1,251 @@
+# Normalization helpers shared by pipelines and spiders.
+#
+# Item fields declare how they are cleaned in their metadata, e.g.
+# ``email = Field(normalize=('email',))``; compile_normalizer turns those
+# declarations into one function per field, once per item class and phone
+# region, so normalizing an item is a single pass over its set fields.
+
+import re
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import tldextract
+
+try:
+    import phonenumbers
+except ImportError:
+    phonenumbers = None
+
+# Use the suffix list bundled with tldextract; never fetch it at runtime.
+_extract = tldextract.TLDExtract(suffix_list_urls=())
+
+_whitespace = re.compile(r'\s+')
+# Whitespace that clean_whitespace would change: runs, or anything but a plain space
+_messy_whitespace = re.compile(r'\s\s|[^\S ]')
+_email = re.compile(r'[a-z0-9._%+-]+@[a-z0-9-]+(?:\.[a-z0-9-]+)*\.[a-z]{2,}')
+# A scheme other than a bare "host:port"
+_scheme = re.compile(r'[a-zA-Z][a-zA-Z0-9+.-]*:(?!\d)')
+_extension = re.compile(r'\s*(?:ext\.?|extension|x|#)\s*\d{1,6}\s*$', re.IGNORECASE)
+
+# Region -> (country calling code, national trunk prefix, national number lengths),
+# for numbers written without their country code when phonenumbers isn't installed.
+PHONE_REGIONS = {
+    'US': ('1', '1', (10,)),
+    'CA': ('1', '1', (10,)),
+    'MX': ('52', '', (10,)),
+    'BR': ('55', '0', (10, 11)),
+    'GB': ('44', '0', (9, 10)),
+    'IE': ('353', '0', (7, 8, 9)),
+    'FR': ('33', '0', (9,)),
+    'BE': ('32', '0', (8, 9)),
+    'NL': ('31', '0', (9,)),
+    'DE': ('49', '0', (6, 7, 8, 9, 10, 11)),
+    'AT': ('43', '0', (6, 7, 8, 9, 10, 11, 12, 13)),
+    'CH': ('41', '0', (9,)),
+    # Italian numbers keep their leading 0 after the country code
+    'IT': ('39', '', (6, 7, 8, 9, 10, 11)),
+    'ES': ('34', '', (9,)),
+    'PT': ('351', '', (9,)),
+    'DK': ('45', '', (8,)),
+    'NO': ('47', '', (8,)),
+    'SE': ('46', '0', (7, 8, 9)),
+    'PL': ('48', '', (9,)),
+    'GR': ('30', '', (10,)),
+    'TR': ('90', '0', (10,)),
+    'AE': ('971', '0', (8, 9)),
+    'IN': ('91', '0', (10,)),
+    'JP': ('81', '0', (9, 10)),
+    'AU': ('61', '0', (9,)),
+    'NZ': ('64', '0', (8, 9, 10)),
+    'ZA': ('27', '0', (9,)),
+}
+
+
+def normalize_phone(value: Optional[str], region: str = 'US') -> Optional[str]:
+    """
+    Return a phone number in E.164 form (``+19185551234``), or None if it can't be parsed.
+
+    Numbers starting with ``+`` or ``00`` carry their country code; others
+    are read as national numbers of ``region``. With the phonenumbers
+    package installed it does the parsing; otherwise PHONE_REGIONS does.
+    """
+    if not value:
+        return None
+    value = _extension.sub('', value.strip())
+    if phonenumbers is not None:
+        try:
+            number = phonenumbers.parse(value, region)
+        except phonenumbers.NumberParseException:
+            return None
+        if not phonenumbers.is_possible_number(number):
+            return None
+        return phonenumbers.format_number(number, phonenumbers.PhoneNumberFormat.E164)
+    if value.startswith('+'):
+        # "+44 (0)20 ...": the bracketed trunk prefix is only dialled nationally
+        value = value.replace('(0)', '')
+    digits = ''.join(ch for ch in value if ch.isdigit())
+    if value.startswith('+'):
+        pass
+    elif digits.startswith('00'):
+        digits = digits[2:]
+    else:
+        code, trunk, lengths = PHONE_REGIONS.get(region.upper(), ('', '', ()))
+        if trunk and digits.startswith(trunk) and len(digits) - len(trunk) in lengths:
+            digits = code + digits[len(trunk):]
+        elif len(digits) in lengths:
+            digits = code + digits
+        elif not (digits.startswith(code) and len(digits) - len(code) in lengths):
+            return None
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def normalize_email(value: Optional[str]) -> Optional[str]:
+    """Lowercase and strip an email address; None unless it looks like one."""
+    if not value:
+        return None
+    value = value.strip().lower()
+    if value.startswith('mailto:'):
+        value = value[7:].split('?')[0]
+    return value if _email.fullmatch(value) else None
+
+
+def normalize_url(value: Optional[str]) -> Optional[str]:
+    """
+    Canonical form of a web address: http(s) scheme, lowercase host, no default port, fragment or credentials.
+
+    Bare hosts (``example.com/contact``) get ``http://``. Anything that
+    isn't an http(s) URL with a host gives None.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if '//' not in value:
+        if _scheme.match(value):
+            return None
+        value = f'http://{value}'
+    try:
+        parts = urlsplit(value)
+        host, port = parts.hostname, parts.port
+    except ValueError:
+        return None
+    scheme = parts.scheme.lower()
+    if scheme not in ('http', 'https') or not host:
+        return None
+    netloc = host if port is None or port == (443 if scheme == 'https' else 80) else f'{host}:{port}'
+    return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+
+
+def clean_whitespace(value: Optional[str]) -> Optional[str]:
+    """Strip and collapse whitespace to single spaces; only copies the string if it changes."""
+    if not value:
+        return None
+    value = value.strip()
+    if _messy_whitespace.search(value):
+        value = _whitespace.sub(' ', value)
+    return value or None
+
+
+# Normalization steps by name, as used in ``Field(normalize=...)``. Each
+# factory takes the phone region and returns a function of one value.
+STEPS: Dict[str, Callable[[str], Callable[[str], Optional[str]]]] = {
+    'strip': lambda region: lambda value: value.strip() or None,
+    'text': lambda region: clean_whitespace,
+    'email': lambda region: normalize_email,
+    'phone': lambda region: lambda value: normalize_phone(value, region),
+    'url': lambda region: normalize_url,
+}
+
+
+def _chain(steps):
+    """One function running ``steps`` in order on strings, stopping at None."""
+    if len(steps) == 1:
+        step, = steps
+        return lambda value: step(value) if isinstance(value, str) else value
+
+    def run(value):
+        for step in steps:
+            if not isinstance(value, str):
+                break
+            value = step(value)
+        return value
+    return run
+
+
+@lru_cache(maxsize=None)
+def compile_normalizer(item_class, region: str = 'US') -> Callable:
+    """
+    Build the function normalizing items of ``item_class`` in place.
+
+    Fields are normalized by the steps listed in their ``normalize``
+    metadata; other fields and non-string values are left alone.
+    """
+    fields = {
+        name: _chain([STEPS[step](region) for step in meta['normalize']])
+        for name, meta in getattr(item_class, 'fields', {}).items()
+        if meta.get('normalize')
+    }
+    get = fields.get
+
+    def normalize(item):
+        # Only the fields that are set; values are replaced, so iterating is safe
+        for name, value in item.items():
+            run = get(name)
+            if run is not None and value is not None:
+                clean = run(value)
+                if clean is not value:
+                    item[name] = clean
+        return item
+    return normalize
+
+
+def normalize_record(item_class, region: str, record: dict) -> dict:
+    """Normalize a plain dict of ``item_class`` fields, as offload workers do (see LeadPipeline)."""
+    return compile_normalizer(item_class, region)(record)
+
+
+@lru_cache(maxsize=65536)
+def registrable_domain(url: Optional[str]) -> Optional[str]:
+    """Return the registrable domain of a URL (``https://www.shop.example.co.uk/x`` -> ``example.co.uk``)."""
+    if not url:
+        return None
+    host = urlsplit(url if '//' in url else f'//{url}').hostname
+    if not host:
+        return None
+    parts = _extract(host)
+    if parts.domain and parts.suffix:
+        return f'{parts.domain}.{parts.suffix}'
+    return host
+
+
+def normalize_name(value: Optional[str]) -> Optional[str]:
+    """Lowercase and collapse whitespace, for use in comparison keys."""
+    if not value:
+        return None
+    return _whitespace.sub(' ', value).strip().lower() or None
+
+
+def natural_key(adapter, region: str = 'US') -> Optional[str]:
+    """
+    Return the key that identifies a lead across runs.
+
+    Prefers the Maps place id, then the E.164 phone (national numbers read
+    as ``region``), then the website's registrable domain, then name +
+    address. Branches of a chain share a domain, so it only keys leads
+    that have neither a place id nor a phone.
+    """
+    place_id = adapter.get('place_id')
+    if place_id:
+        return f'place:{place_id}'
+    phone = normalize_phone(adapter.get('phone'), region)
+    if phone:
+        return f'phone:{phone}'
+    domain = registrable_domain(adapter.get('website'))
+    if domain:
+        return f'domain:{domain}'
+    name = normalize_name(adapter.get('name'))
+    if name:
+        return f'name:{name}|{normalize_name(adapter.get("address")) or ""}'
+    return None
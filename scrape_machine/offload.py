@@ -0,0 +1,232 @@
+# Process-pool offload of CPU-heavy parsing, off the reactor thread.
+#
+# While a callback decodes a Maps search page or scans a website for
+# contacts, the reactor can't move downloads along. OffloadPool runs such
+# functions in worker processes and returns a Deferred for the result, so
+# callbacks (``async def``) and pipelines opt in one call at a time.
+# Response bodies of OFFLOAD_SHM_MIN_BYTES or more travel through shared
+# memory rather than the pool's pipe; workers rebuild the response around
+# them, so the same module-level function runs offloaded or inline.
+#
+# At most OFFLOAD_MAX_PENDING calls are in the pool; later ones wait in
+# line without a copy of their body. Callbacks waiting on the pool keep
+# their responses in the scraper, which holds back new downloads once
+# SCRAPER_SLOT_MAX_ACTIVE_SIZE is reached.
+
+import multiprocessing
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Optional
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Headers
+from twisted.internet import defer
+
+from .metrics import registry_for
+
+# Imported by the forkserver once, so workers start with them loaded
+PRELOAD = ['scrapy.http', 'scrape_machine.contacts', 'scrape_machine.maps_state', 'scrape_machine.normalize']
+
+_pools = weakref.WeakKeyDictionary()
+
+
+def pool_for(crawler) -> Optional['OffloadPool']:
+    """The crawler's OffloadPool, or None when OffloadExtension isn't running."""
+    return _pools.get(crawler)
+
+
+def run(crawler, func: Callable, *args, **kwargs) -> defer.Deferred:
+    """``func(*args, **kwargs)`` in the crawler's pool, or inline without one; returns a Deferred."""
+    pool = pool_for(crawler)
+    if pool is None:
+        return defer.maybeDeferred(func, *args, **kwargs)
+    return pool.submit(func, *args, **kwargs)
+
+
+def run_on_response(crawler, func: Callable, response, *args, **kwargs) -> defer.Deferred:
+    """
+    ``func(response, *args, **kwargs)`` in the crawler's pool; returns a Deferred.
+
+    Bodies under the pool's ``min_bytes`` are parsed inline, where that
+    costs less than the round trip. In a worker, ``func`` gets a response
+    of the same class, URL, status, headers and body, but no request or meta.
+    """
+    pool = pool_for(crawler)
+    if pool is None or len(response.body) < pool.min_bytes:
+        return defer.maybeDeferred(func, response, *args, **kwargs)
+    return pool.submit_response(func, response, *args, **kwargs)
+
+
+def _call(func, args, kwargs):
+    return func(*args, **kwargs)
+
+
+def _call_on_response(func, spec, body, shm_name, args, kwargs):
+    """Worker side of submit_response: rebuild the response, then call ``func``."""
+    cls, url, status, headers = spec
+    if shm_name is not None:
+        shm = SharedMemory(shm_name)
+        try:
+            body = bytes(shm.buf[:body])
+        finally:
+            shm.close()
+    response = cls(url=url, status=status, headers=Headers(headers), body=body)
+    return func(response, *args, **kwargs)
+
+
+class OffloadPool:
+    """
+    ``workers`` processes running submitted functions, at most ``max_pending`` at a time.
+
+    Functions and their arguments must pickle, so functions are module-level.
+    A worker that dies (a crash, the OOM killer) breaks the executor; the
+    calls in flight fail and the next call starts a fresh one.
+    """
+
+    def __init__(self, workers: int, max_pending: int = 0, min_bytes: int = 0, shm_min_bytes: int = 512 * 1024,
+                 start_method: Optional[str] = None, stats=None, registry=None):
+        self.workers = workers
+        self.max_pending = max_pending or 2 * workers
+        self.min_bytes = min_bytes
+        self.shm_min_bytes = shm_min_bytes
+        methods = multiprocessing.get_all_start_methods()
+        # Forking a process with the reactor's threads running isn't safe
+        self.context = multiprocessing.get_context(
+            start_method or ('forkserver' if 'forkserver' in methods else 'spawn'))
+        if self.context.get_start_method() == 'forkserver':
+            self.context.set_forkserver_preload(PRELOAD)
+        self.stats = stats
+        self.registry = registry
+        self.slots = defer.DeferredSemaphore(self.max_pending)
+        self.executor = None
+        self.closed = False
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(self.workers, mp_context=self.context)
+        return self.executor
+
+    def _inc(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(f'offload/{key}', count)
+
+    def submit(self, func: Callable, *args, **kwargs) -> defer.Deferred:
+        """Run ``func(*args, **kwargs)`` in a worker; returns a Deferred."""
+        return self._queue(func, lambda: (_call, (func, args, kwargs), None))
+
+    def submit_response(self, func: Callable, response, *args, **kwargs) -> defer.Deferred:
+        """Run ``func(rebuilt response, *args, **kwargs)`` in a worker; returns a Deferred."""
+        def prepare():
+            body = response.body
+            spec = (type(response), response.url, response.status, dict(response.headers))
+            if len(body) < self.shm_min_bytes:
+                self._inc('pickled_bytes', len(body))
+                return _call_on_response, (func, spec, body, None, args, kwargs), None
+            # Created only once the call has a slot, so waiting calls hold no copy
+            shm = SharedMemory(create=True, size=len(body))
+            shm.buf[:len(body)] = body
+            self._inc('shm_bytes', len(body))
+            return _call_on_response, (func, spec, len(body), shm.name, args, kwargs), shm
+        return self._queue(func, prepare)
+
+    def _queue(self, func, prepare) -> defer.Deferred:
+        if self.closed:
+            return defer.fail(RuntimeError('offload pool is closed'))
+        if not self.slots.tokens:
+            self._inc('waited')
+        start = time.perf_counter()
+        d = self.slots.run(self._start, prepare)
+
+        def observe(result):
+            if self.registry is not None:
+                name = getattr(func, '__name__', 'function')
+                self.registry.observe('offload_seconds', name, time.perf_counter() - start, label_name='function')
+            return result
+        return d.addBoth(observe)
+
+    def _start(self, prepare) -> defer.Deferred:
+        from twisted.internet import reactor
+
+        target, args, shm = prepare()
+        d = defer.Deferred()
+
+        def done(future):
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            try:
+                result = future.result()
+            except BaseException as error:
+                if isinstance(error, BrokenProcessPool):
+                    self._inc('broken')
+                    self._reset(executor)
+                self._inc('errors')
+                d.errback(error)
+            else:
+                d.callback(result)
+
+        self._inc('submitted')
+        try:
+            executor = self._executor()
+            future = executor.submit(target, *args)
+        except BaseException:
+            if shm is not None:
+                shm.close()
+                shm.unlink()
+            raise
+        # Futures complete in the executor's thread; results are handed back on the reactor's
+        future.add_done_callback(lambda future: reactor.callFromThread(done, future))
+        return d
+
+    def _reset(self, executor):
+        if self.executor is executor:
+            self.executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def close(self):
+        """Wait for the calls in flight and stop the workers."""
+        self.closed = True
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+
+
+class OffloadExtension:
+    """
+    Runs the crawler's OffloadPool of OFFLOAD_WORKERS processes.
+
+    Without it (OFFLOAD_WORKERS = 0), run and run_on_response call the
+    function inline, so code that offloads works the same either way.
+    """
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        workers = settings.getint('OFFLOAD_WORKERS')
+        if workers <= 0:
+            raise NotConfigured
+        self.crawler = crawler
+        self.pool = _pools[crawler] = OffloadPool(
+            workers,
+            max_pending=settings.getint('OFFLOAD_MAX_PENDING'),
+            min_bytes=settings.getint('OFFLOAD_MIN_BYTES', 0),
+            shm_min_bytes=settings.getint('OFFLOAD_SHM_MIN_BYTES', 512 * 1024),
+            start_method=settings.get('OFFLOAD_START_METHOD') or None,
+            stats=crawler.stats,
+            registry=registry_for(crawler) if settings.getbool('METRICS_ENABLED') else None,
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        ext = cls(crawler)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        return ext
+
+    def spider_closed(self, spider):
+        from twisted.internet import threads
+
+        # Worker shutdown joins processes; keep that off the reactor
+        return threads.deferToThread(self.pool.close)
@@ -6,8 +6,20 @@
 
 # useful for handling different item types with a single interface
 from itemadapter import ItemAdapter
-import json
+import os
+import sqlite3
+import tempfile
+import time
 from datetime import datetime
+from scrapy.exceptions import DropItem, NotConfigured
+
+from . import offload
+from .dedup import SeenIndex
+from .delta import DeltaIndex
+from .items import LeadItem
+from .normalize import (compile_normalizer, natural_key, normalize_email, normalize_name, normalize_phone,
+                        normalize_record, registrable_domain)
+from .writers import columns_for, lead_writer
 
 
 class ScrapeMachinePipeline:
@@ -15,49 +27,346 @@ class ScrapeMachinePipeline:
         return item
 
 
+def phone_region(spider, settings):
+    """Region for phones without a country code: the spider's ``phone_region`` argument, else LEAD_PHONE_REGION."""
+    return (getattr(spider, 'phone_region', None) or settings.get('LEAD_PHONE_REGION') or 'US').upper()
+
+
+class LeadDedupPipeline:
+    """
+    Drop leads already seen during the crawl.
+
+    Each lead is keyed on the fields in LEAD_DEDUP_KEYS, by default its Maps
+    place id and normalized phone (E.164, see phone_region); if any of
+    those keys was seen before, the lead is a duplicate. Website domains
+    and emails are shared by a chain's locations (and fanned out to all of
+    them by enrichment), so a lead without those keys is identified by its
+    email, domain and name together, then by name + address.
+
+    Several crawls may share one LEAD_DEDUP_PATH index (see runner.py);
+    with LEAD_DEDUP_COMMIT_EVERY = 1 a key inserted by another process is
+    caught when this one tries to insert it.
+    """
+    
+    def __init__(self, stats, path=None, capacity=1_000_000, error_rate=0.001, keys=('place_id', 'phone'),
+                 commit_every=1000, settings=None, owner=None):
+        self.stats = stats
+        self.owner = owner
+        self.settings = settings
+        self.region = 'US'
+        self.path = path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.keys = tuple(keys)
+        self.commit_every = commit_every
+        self.index = None
+        self.temporary = path is None
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            crawler.stats,
+            path=settings.get('LEAD_DEDUP_PATH'),
+            capacity=settings.getint('LEAD_DEDUP_CAPACITY', 1_000_000),
+            error_rate=settings.getfloat('LEAD_DEDUP_ERROR_RATE', 0.001),
+            keys=settings.getlist('LEAD_DEDUP_KEYS', ['place_id', 'phone']),
+            commit_every=settings.getint('LEAD_DEDUP_COMMIT_EVERY', 1000),
+            settings=settings,
+            owner=settings.get('RUNNER_ATTEMPT'),
+        )
+        
+    def open_spider(self, spider):
+        """Open the seen-key index (a temporary file unless LEAD_DEDUP_PATH is set)."""
+        if self.settings is not None:
+            self.region = phone_region(spider, self.settings)
+        if self.temporary:
+            fd, self.path = tempfile.mkstemp(prefix=f'{spider.name}_dedup_', suffix='.sqlite3')
+            os.close(fd)
+        self.index = SeenIndex(self.path, capacity=self.capacity, error_rate=self.error_rate,
+                               commit_every=self.commit_every, owner=self.owner)
+        
+    def close_spider(self, spider):
+        """Record index stats and close it."""
+        if not self.index:
+            return
+        for key, value in self.index.stats.items():
+            self.stats.set_value(f'dedup/{key}', value)
+        hits = self.stats.get_value('dedup/duplicates', 0)
+        total = hits + self.stats.get_value('dedup/unique', 0)
+        if total:
+            self.stats.set_value('dedup/hit_ratio', round(hits / total, 4))
+        self.index.close()
+        if self.temporary:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+                    
+    def lead_keys(self, adapter):
+        """Return the normalized dedup keys for a lead."""
+        keys = []
+        if 'place_id' in self.keys:
+            place_id = (adapter.get('place_id') or '').strip()
+            if place_id:
+                keys.append(f'place:{place_id}')
+        if 'phone' in self.keys:
+            phone = normalize_phone(adapter.get('phone'), self.region)
+            if phone:
+                keys.append(f'phone:{phone}')
+        email = normalize_email(adapter.get('email'))
+        if 'email' in self.keys and email:
+            keys.append(f'email:{email}')
+        domain = registrable_domain(adapter.get('website'))
+        if 'website' in self.keys and domain:
+            keys.append(f'domain:{domain}')
+        if keys:
+            return keys
+        name = normalize_name(adapter.get('name'))
+        if email or domain:
+            return [f'contact:{email or ""}|{domain or ""}|{name or ""}']
+        if name:
+            return [f'name:{name}|{normalize_name(adapter.get("address")) or ""}']
+        return []
+        
+    def process_item(self, item, spider):
+        """Drop the item if any of its keys has been seen before."""
+        keys = self.lead_keys(ItemAdapter(item))
+        # Keys added by another process sharing the index only show up on insert
+        if any(key in self.index for key in keys) or self.index.add_many(keys) < len(keys):
+            self.stats.inc_value('dedup/duplicates')
+            raise DropItem(f"Duplicate lead: {keys}")
+        self.stats.inc_value('dedup/unique')
+        return item
+
+
+class DeltaPipeline:
+    """
+    In incremental runs, drop leads identical to what an earlier run emitted.
+
+    Only active with INCREMENTAL = True. Every lead's fingerprint is stored
+    in the DELTA_INDEX_PATH index; leads are counted as new, changed or
+    unchanged and the unchanged ones are dropped.
+    """
+    
+    def __init__(self, stats, path, freshness, settings=None):
+        self.stats = stats
+        self.path = path
+        self.freshness = freshness
+        self.settings = settings
+        self.index = None
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        if not settings.getbool('INCREMENTAL'):
+            raise NotConfigured
+        return cls(
+            crawler.stats,
+            settings.get('DELTA_INDEX_PATH', 'delta.sqlite3'),
+            settings.getfloat('DELTA_FRESHNESS', 7 * 24 * 3600),
+            settings,
+        )
+        
+    def open_spider(self, spider):
+        region = phone_region(spider, self.settings) if self.settings is not None else 'US'
+        self.index = DeltaIndex(self.path, self.freshness, region)
+        
+    def close_spider(self, spider):
+        if self.index:
+            self.index.close()
+            
+    def process_item(self, item, spider):
+        status = self.index.record(ItemAdapter(item))
+        self.stats.inc_value(f'delta/{status}')
+        if status == 'unchanged':
+            raise DropItem("Lead unchanged since the last run")
+        return item
+
+
 class LeadPipeline:
-    """Pipeline for processing and storing lead items."""
+    """
+    Pipeline for normalizing and storing lead items.
+    
+    Fields are cleaned as declared in their ``normalize`` metadata (see
+    LeadItem), with a normalizer compiled once per item class and phone
+    region; then the record goes to the background writer for LEAD_FORMAT
+    (see writers.lead_writer). With LEAD_NORMALIZE_OFFLOAD, normalizing
+    runs in the offload pool (see offload.py).
+    """
     
-    def __init__(self):
-        self.file = None
+    def __init__(self, output_dir='.', batch_size=500, flush_interval=2.0,
+                 max_bytes=0, max_records=0, compression=None, settings=None,
+                 output_format='jsonl', row_group_size=50_000, parquet_compression='zstd',
+                 crawler=None, offload_normalize=False):
+        self.settings = settings
+        self.crawler = crawler
+        self.offload_normalize = offload_normalize
+        self.output_format = output_format
+        self.row_group_size = row_group_size
+        self.parquet_compression = parquet_compression
+        self.region = 'US'
+        self.output_dir = output_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.compression = compression
+        self.writer = None
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            output_dir=settings.get('LEAD_OUTPUT_DIR', '.'),
+            batch_size=settings.getint('LEAD_BATCH_SIZE', 500),
+            flush_interval=settings.getfloat('LEAD_FLUSH_INTERVAL', 2.0),
+            max_bytes=settings.getint('LEAD_ROTATE_MAX_BYTES', 0),
+            max_records=settings.getint('LEAD_ROTATE_MAX_RECORDS', 0),
+            compression=settings.get('LEAD_COMPRESSION') or None,
+            settings=settings,
+            output_format=settings.get('LEAD_FORMAT', 'jsonl'),
+            row_group_size=settings.getint('LEAD_ROW_GROUP_SIZE', 50_000),
+            parquet_compression=settings.get('LEAD_PARQUET_COMPRESSION') or None,
+            crawler=crawler,
+            offload_normalize=settings.getbool('LEAD_NORMALIZE_OFFLOAD'),
+        )
         
     def open_spider(self, spider):
-        """Called when spider starts - open the output file."""
-        filename = f'leads_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
-        self.file = open(filename, 'w')
+        """Called when spider starts - start the background writer."""
+        if self.settings is not None:
+            self.region = phone_region(spider, self.settings)
+        basename = f'leads_{datetime.now().strftime("%Y%m%d_%H%M%S")}'
+        self.writer = lead_writer(
+            self.output_format,
+            basename,
+            columns_for(LeadItem),
+            row_group_size=self.row_group_size,
+            parquet_compression=self.parquet_compression,
+            directory=self.output_dir,
+            batch_size=self.batch_size,
+            flush_interval=self.flush_interval,
+            max_bytes=self.max_bytes,
+            max_records=self.max_records,
+            compression=self.compression,
+        )
+        if self.output_format == 'parquet' and self.writer.suffix != '.parquet':
+            spider.logger.warning("pyarrow is not installed; writing leads as CSV instead of Parquet")
         
     def close_spider(self, spider):
-        """Called when spider ends - close the output file."""
-        if self.file:
-            self.file.close()
+        """Called when spider ends - flush, fsync and close the output."""
+        if self.writer:
+            self.writer.close()
+            spider.logger.info(f"Wrote {self.writer.records_written} leads to {', '.join(self.writer.paths) or 'no file'}")
             
     def process_item(self, item, spider):
-        """Process each lead item."""
-        adapter = ItemAdapter(item)
+        """Normalize the lead in place and hand it to the background writer."""
+        if self.offload_normalize and self.crawler is not None:
+            d = offload.run(self.crawler, normalize_record, type(item), self.region, dict(item))
+            d.addCallback(self.write_normalized, item)
+            return d
+        compile_normalizer(type(item), self.region)(item)
+        # Leads are flat: a shallow copy is all the writer needs
+        self.writer.write(dict(item))
+        return item
         
-        # Clean and validate email
-        if adapter.get('email'):
-            adapter['email'] = adapter['email'].lower()
+    def write_normalized(self, record, item):
+        """Copy a record normalized in the offload pool back into the lead and write it."""
+        item.update(record)
+        self.writer.write(record)
+        return item
+
+
+class LeadSQLitePipeline:
+    """
+    Store leads in a SQLite database.
+
+    Rows are buffered and written with ``executemany`` in one transaction per
+    batch, upserting on the lead's natural key (Maps place id, then phone,
+    then website domain) so re-runs update existing rows. A batch is written when it reaches
+    ``batch_size`` rows or ``commit_interval`` seconds after the last commit.
+    Leads without a natural key can't be upserted; they are counted in
+    ``sqlite/skipped_no_key`` and logged instead. Columns added to LeadItem
+    since the database was created are added to its table.
+    """
+    
+    columns = tuple(LeadItem.fields)
+    
+    def __init__(self, path='leads.sqlite3', batch_size=500, commit_interval=5.0, stats=None, settings=None):
+        self.path = path
+        self.stats = stats
+        self.settings = settings
+        self.region = 'US'
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.db = None
+        self.rows = []
+        self.last_commit = 0.0
+        
+        columns = ', '.join(self.columns)
+        placeholders = ', '.join('?' for _ in range(len(self.columns) + 1))
+        updates = ', '.join(f'{c} = COALESCE(excluded.{c}, leads.{c})' for c in self.columns)
+        self.upsert_sql = (
+            f'INSERT INTO leads (lead_key, {columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT(lead_key) DO UPDATE SET {updates}'
+        )
+        
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        return cls(
+            path=settings.get('LEAD_SQLITE_PATH', 'leads.sqlite3'),
+            batch_size=settings.getint('LEAD_SQLITE_BATCH_SIZE', 500),
+            commit_interval=settings.getfloat('LEAD_SQLITE_COMMIT_INTERVAL', 5.0),
+            stats=crawler.stats,
+            settings=settings,
+        )
+        
+    def open_spider(self, spider):
+        """Open the database, creating the leads table or adding its missing columns."""
+        if self.settings is not None:
+            self.region = phone_region(spider, self.settings)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        columns = ', '.join(f'{c} TEXT' for c in self.columns)
+        self.db.execute(f'CREATE TABLE IF NOT EXISTS leads (lead_key TEXT PRIMARY KEY, {columns})')
+        existing = {row[1] for row in self.db.execute('PRAGMA table_info(leads)')}
+        for column in self.columns:
+            if column not in existing:
+                spider.logger.info(f"Adding column {column} to the leads table in {self.path}")
+                self.db.execute(f'ALTER TABLE leads ADD COLUMN {column} TEXT')
+        self.db.commit()
+        self.last_commit = time.monotonic()
+        
+    def close_spider(self, spider):
+        """Write whatever is still buffered and close the database."""
+        if self.db:
+            self.flush()
+            self.db.close()
+            self.db = None
             
-        # Clean and format phone number
-        if adapter.get('phone'):
-            # Remove all non-numeric characters
-            phone = ''.join(filter(str.isdigit, adapter['phone']))
-            # Format as XXX-XXX-XXXX
-            if len(phone) == 10:
-                adapter['phone'] = f"{phone[:3]}-{phone[3:6]}-{phone[6:]}"
-            elif len(phone) == 11 and phone.startswith('1'):
-                adapter['phone'] = f"{phone[1:4]}-{phone[4:7]}-{phone[7:]}"
-            else:
-                adapter['phone'] = None
-                
-        # Ensure all strings are stripped of whitespace
-        for field in adapter.field_names():
-            if isinstance(adapter.get(field), str):
-                adapter[field] = adapter[field].strip()
-                
-        # Write to JSON file
-        line = json.dumps(ItemAdapter(item).asdict()) + "\n"
-        self.file.write(line)
+    def flush(self):
+        """Upsert all buffered rows in a single transaction."""
+        if self.rows:
+            with self.db:
+                self.db.executemany(self.upsert_sql, self.rows)
+            self.rows = []
+        self.last_commit = time.monotonic()
         
+    def process_item(self, item, spider):
+        """Buffer the lead and write the batch when it's full or due."""
+        adapter = ItemAdapter(item)
+        key = natural_key(adapter, self.region)
+        if key:
+            row = [key]
+            for column in self.columns:
+                value = adapter.get(column)
+                row.append(value if value is None or isinstance(value, str) else str(value))
+            self.rows.append(row)
+        else:
+            if self.stats is not None:
+                self.stats.inc_value('sqlite/skipped_no_key', spider=spider)
+            spider.logger.warning(f"Not storing lead without place id, phone, website or name in {self.path}: {dict(adapter)}")
+        if len(self.rows) >= self.batch_size or time.monotonic() - self.last_commit >= self.commit_interval:
+            self.flush()
         return item
@@ -0,0 +1,148 @@
+# Health-scored proxy pool, used by ProxyPoolMiddleware.
+#
+# Every proxy keeps moving averages of its latency, error rate and block
+# rate. Requests go to the cheapest proxy that has a free concurrency slot,
+# so slow or flaky proxies get less traffic without being dropped. A proxy
+# that fails PROXY_QUARANTINE_AFTER times in a row is quarantined, for twice
+# as long each time it relapses; long clean runs slowly earn that back. Sessions (e.g. a cookie jar on google.com)
+# can be pinned to one proxy so the target sees them coming from one IP.
+
+import random
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+OUTCOMES = ('ok', 'error', 'block')
+
+
+def proxy_name(url: str) -> str:
+    """``host:port`` of a proxy URL, without credentials, for logs and stats."""
+    parts = urlsplit(url if '//' in url else f'//{url}')
+    return f'{parts.hostname}:{parts.port}' if parts.port else parts.hostname or url
+
+
+class Proxy:
+    """One proxy's health, load and quarantine state."""
+
+    __slots__ = ('url', 'name', 'max_concurrency', 'inflight', 'latency', 'error_rate', 'block_rate',
+                 'strikes', 'clean', 'quarantines', 'quarantined_until')
+
+    def __init__(self, url: str, max_concurrency: int = 4):
+        self.url = url if '//' in url else f'http://{url}'
+        self.name = proxy_name(url)
+        self.max_concurrency = max_concurrency
+        self.inflight = 0
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.block_rate = 0.0
+        self.strikes = 0
+        self.clean = 0
+        self.quarantines = 0
+        self.quarantined_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.quarantined_until <= now and self.inflight < self.max_concurrency
+
+    def score(self, error_weight: float = 5.0, block_weight: float = 10.0) -> float:
+        """Expected cost of a request through this proxy; lower is better."""
+        latency = 1.0 if self.latency is None else self.latency
+        return latency * (1 + error_weight * self.error_rate + block_weight * self.block_rate)
+
+
+class ProxyPool:
+    """
+    Picks a proxy per request and keeps score of how each one does.
+
+    ``acquire`` returns the available proxy with the lowest score times
+    load (or the one pinned to ``session``), or None when every proxy is
+    busy or quarantined; ``release`` hands the slot back with the request's
+    outcome (``'ok'``, ``'error'``, ``'block'`` or None when the proxy
+    wasn't actually used) and returns the cooldown if this quarantined it.
+    """
+
+    def __init__(self, urls: Iterable[str], concurrency: int = 4, quarantine_after: int = 3,
+                 cooldown: float = 30.0, max_cooldown: float = 1800.0, forgive_after: int = 50,
+                 alpha: float = 0.2):
+        self.proxies: Dict[str, Proxy] = {}
+        for url in urls:
+            proxy = Proxy(url, concurrency)
+            self.proxies[proxy.name] = proxy
+        self.quarantine_after = quarantine_after
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.forgive_after = forgive_after
+        self.alpha = alpha
+        self.sessions: Dict[str, str] = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        urls = list(settings.getlist('PROXY_LIST'))
+        path = settings.get('PROXY_LIST_FILE')
+        if path:
+            with open(path, encoding='utf-8') as f:
+                urls.extend(line.strip() for line in f if line.strip() and not line.startswith('#'))
+        return cls(
+            urls,
+            concurrency=settings.getint('PROXY_CONCURRENCY', 4),
+            quarantine_after=settings.getint('PROXY_QUARANTINE_AFTER', 3),
+            cooldown=settings.getfloat('PROXY_COOLDOWN', 30),
+            max_cooldown=settings.getfloat('PROXY_MAX_COOLDOWN', 1800),
+            forgive_after=settings.getint('PROXY_FORGIVE_AFTER', 50),
+        )
+
+    def __len__(self):
+        return len(self.proxies)
+
+    def acquire(self, session: Optional[str] = None, now: Optional[float] = None) -> Optional[Proxy]:
+        now = time.monotonic() if now is None else now
+        pinned = self.proxies.get(self.sessions.get(session)) if session else None
+        if pinned is not None and pinned.quarantined_until <= now:
+            # Wait for the session's own proxy rather than switching IPs mid-session
+            if pinned.inflight >= pinned.max_concurrency:
+                return None
+            proxy = pinned
+        else:
+            candidates: List[Proxy] = [p for p in self.proxies.values() if p.available(now)]
+            if not candidates:
+                return None
+            random.shuffle(candidates)
+            proxy = min(candidates, key=lambda p: p.score() * (p.inflight + 1))
+            if session:
+                self.sessions[session] = proxy.name
+        proxy.inflight += 1
+        return proxy
+
+    def release(self, proxy: Proxy, outcome: Optional[str] = None, latency: Optional[float] = None,
+                now: Optional[float] = None) -> Optional[float]:
+        proxy.inflight = max(0, proxy.inflight - 1)
+        if outcome is None:
+            return None
+        a = self.alpha
+        if latency is not None and outcome != 'error':
+            proxy.latency = latency if proxy.latency is None else (1 - a) * proxy.latency + a * latency
+        proxy.error_rate = (1 - a) * proxy.error_rate + a * (outcome == 'error')
+        proxy.block_rate = (1 - a) * proxy.block_rate + a * (outcome == 'block')
+        if outcome == 'ok':
+            proxy.strikes = 0
+            proxy.clean += 1
+            # Half forgiven per long clean run, so a flapping proxy's cooldown keeps growing
+            if proxy.clean >= self.forgive_after:
+                proxy.clean = 0
+                proxy.quarantines //= 2
+            return None
+        proxy.clean = 0
+        proxy.strikes += 1
+        if proxy.strikes < self.quarantine_after:
+            return None
+        now = time.monotonic() if now is None else now
+        proxy.strikes = 0
+        proxy.quarantines += 1
+        cooldown = min(self.max_cooldown, self.cooldown * 2 ** (proxy.quarantines - 1))
+        proxy.quarantined_until = now + cooldown
+        return cooldown
+
+    def next_available(self, now: Optional[float] = None) -> Optional[float]:
+        """Seconds until a quarantined proxy comes back, or None if none is quarantined."""
+        now = time.monotonic() if now is None else now
+        waits = [p.quarantined_until - now for p in self.proxies.values() if p.quarantined_until > now]
+        return min(waits) if waits else None
@@ -0,0 +1,241 @@
+# Run a list of spider jobs on several worker processes.
+#
+#     python -m scrape_machine.runner jobs.yaml --workers 4
+#
+# The job file (JSON, or YAML with PyYAML installed) names a spider and its
+# jobs, either listed one by one or as every combination of queries and
+# locations:
+#
+#     spider: google_maps
+#     settings: {ENRICHMENT_MAX_PAGES_PER_DOMAIN: 2}
+#     queries: [dentist, orthodontist]
+#     locations: ["Tulsa, OK", "Boston, MA"]
+#     jobs:
+#       - {query: plumber, location: "Austin, TX", radius: 20000}
+#
+# Each worker claims one job at a time from the shared store (see
+# frontier.py) and runs it as a regular crawl. Leads are deduplicated across
+# workers through one seen-lead index, and every finished job's output is
+# appended to a single merged file. Re-running with the same --store
+# resumes: finished jobs are not run again.
+#
+# A failed attempt's output is thrown away, so the lead keys and request
+# fingerprints it added to the shared indexes are removed too (see
+# rollback); otherwise its retry would take everything it finds again for
+# duplicates.
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import time
+from datetime import datetime
+from itertools import product
+
+from .dedup import forget
+from .frontier import JobFrontier, attempt_key, store_paths
+from .writers import LeadWriter
+
+logger = logging.getLogger(__name__)
+
+
+def load_config(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("YAML job files need PyYAML (pip install pyyaml); or use JSON")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def expand_jobs(config):
+    """Spider arguments for every job in the config."""
+    common = config.get('args', {})
+    jobs = [{**common, **job} for job in config.get('jobs', [])]
+    for query, location in product(config.get('queries', []), config.get('locations', [])):
+        jobs.append({**common, 'query': query, 'location': location})
+    return jobs
+
+
+def worker_settings(config, paths, worker, incremental=False):
+    """Project settings with the job file's overrides and the shared store wired in."""
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    settings.setdict(config.get('settings', {}), priority='cmdline')
+    if incremental:
+        settings.set('INCREMENTAL', True, priority='cmdline')
+    settings.setdict({
+        'FRONTIER_PATH': paths['frontier'],
+        'DUPEFILTER_CLASS': 'scrape_machine.frontier.SharedDupeFilter',
+        'LEAD_DEDUP_PATH': paths['seen'],
+        # Commit every key at once: an open write transaction would block the other workers
+        'LEAD_DEDUP_COMMIT_EVERY': 1,
+        # Job outputs are merged by concatenation, which only JSON lines survive
+        'LEAD_FORMAT': 'jsonl',
+    }, priority='cmdline')
+    if not settings.get('ENRICHMENT_CACHE_PATH'):
+        settings.set('ENRICHMENT_CACHE_PATH', paths['enrichment'], priority='cmdline')
+    if not settings.get('LOG_FILE'):
+        os.makedirs(paths['logs'], exist_ok=True)
+        settings.set('LOG_FILE', os.path.join(paths['logs'], f'worker-{worker}.log'), priority='cmdline')
+    return settings
+
+
+def rollback(frontier, paths, job):
+    """Remove what a failed or interrupted attempt at ``job`` added to the shared indexes."""
+    owner = attempt_key(job['id'], job['attempts'])
+    fingerprints = frontier.forget(owner)
+    keys = forget(paths['seen'], owner)
+    if fingerprints or keys:
+        logger.info(f"Rolled back job {job['id']} attempt {job['attempts']}: "
+                    f"{fingerprints} request fingerprints, {keys} lead keys")
+
+
+def run_worker(config, paths, worker, max_attempts, incremental=False):
+    """Claim and crawl jobs until the frontier is empty."""
+    from scrapy.crawler import CrawlerRunner
+    from scrapy.utils.log import configure_logging
+    from scrapy.utils.reactor import install_reactor
+
+    settings = worker_settings(config, paths, worker, incremental)
+    install_reactor(settings['TWISTED_REACTOR'])
+    configure_logging(settings)
+
+    from twisted.internet import defer, reactor
+
+    frontier = JobFrontier(paths['frontier'])
+
+    @defer.inlineCallbacks
+    def crawl_jobs():
+        try:
+            while True:
+                job = frontier.claim(worker)
+                if job is None:
+                    break
+                output = os.path.join(paths['output'], f'job-{job["id"]:06d}')
+                shutil.rmtree(output, ignore_errors=True)
+                job_settings = settings.copy()
+                job_settings.set('LEAD_OUTPUT_DIR', output, priority='cmdline')
+                job_settings.set('RUNNER_ATTEMPT', attempt_key(job['id'], job['attempts']), priority='cmdline')
+                runner = CrawlerRunner(job_settings)
+                crawler = runner.create_crawler(job['spider'])
+                logger.info(f"Worker {worker} starting job {job['id']}: {job['args']}")
+                try:
+                    yield runner.crawl(crawler, **job['args'])
+                    ok = crawler.stats.get_value('finish_reason') == 'finished'
+                except Exception as e:
+                    logger.error(f"Job {job['id']} crashed: {e}")
+                    ok = False
+                if not ok:
+                    rollback(frontier, paths, job)
+                frontier.finish(job['id'], ok, output, max_attempts=max_attempts)
+        finally:
+            frontier.close()
+            reactor.stop()
+
+    reactor.callWhenRunning(crawl_jobs)
+    reactor.run()
+
+
+def merge_outputs(frontier, target):
+    """Append every finished job's lead files to ``target``, once each."""
+    merged = 0
+    for job in frontier.unmerged():
+        output = job['output']
+        if output and os.path.isdir(output):
+            with open(target, 'ab') as out:
+                for name in sorted(os.listdir(output)):
+                    # gzip members and zstd frames can be concatenated as is
+                    with open(os.path.join(output, name), 'rb') as f:
+                        shutil.copyfileobj(f, out)
+            shutil.rmtree(output)
+        frontier.mark_merged(job['id'])
+        merged += 1
+    return merged
+
+
+def run(config_path, workers=None, store='.runner', output=None, max_attempts=2, max_restarts=3,
+        incremental=False):
+    """Queue the config's jobs, run them on ``workers`` processes and merge the leads."""
+    config = load_config(config_path)
+    paths = store_paths(store)
+    frontier = JobFrontier(paths['frontier'])
+    # Jobs left running belong to workers of an earlier, interrupted run
+    for job in frontier.running():
+        rollback(frontier, paths, job)
+    frontier.release()
+    added = frontier.add(config['spider'], expand_jobs(config))
+    workers = int(workers or config.get('workers') or os.cpu_count() or 1)
+
+    if output is None:
+        compression = config.get('settings', {}).get('LEAD_COMPRESSION')
+        output = f'leads_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json{LeadWriter.EXTENSIONS[compression]}'
+    logger.info(f"{added} new jobs queued ({frontier.counts()}), {workers} workers, writing {output}")
+
+    def spawn(worker):
+        command = [sys.executable, '-m', 'scrape_machine.runner', config_path,
+                   '--store', store, '--worker', str(worker), '--max-attempts', str(max_attempts)]
+        if incremental:
+            command.append('--incremental')
+        return subprocess.Popen(command)
+
+    procs = {worker: spawn(worker) for worker in range(workers)}
+    restarts = 0
+    try:
+        while procs:
+            time.sleep(1)
+            merge_outputs(frontier, output)
+            for worker, proc in list(procs.items()):
+                code = proc.poll()
+                if code is None:
+                    continue
+                del procs[worker]
+                if code != 0:
+                    for job in frontier.running(worker):
+                        rollback(frontier, paths, job)
+                    released = frontier.release(worker)
+                    logger.warning(f"Worker {worker} exited with {code}, {released} job(s) requeued")
+                    if frontier.counts().get('pending') and restarts < max_restarts:
+                        restarts += 1
+                        procs[worker] = spawn(worker)
+    except KeyboardInterrupt:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            proc.wait()
+        logger.warning("Interrupted; run again with the same --store to resume")
+    finally:
+        merge_outputs(frontier, output)
+        logger.info(f"Jobs: {frontier.counts()}")
+        frontier.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run spider jobs on several processes sharing one frontier.')
+    parser.add_argument('config', help='job file (.json, or .yaml/.yml with PyYAML)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: config, then CPU count)')
+    parser.add_argument('--store', default='.runner', help='directory holding the shared frontier and indexes')
+    parser.add_argument('--output', help='merged JSON-lines output (default: leads_<timestamp>.json)')
+    parser.add_argument('--max-attempts', type=int, default=2, help='tries per job before it is marked failed')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only emit new or changed leads (see INCREMENTAL in settings.py)')
+    parser.add_argument('--worker', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker is not None:
+        run_worker(load_config(args.config), store_paths(args.store), args.worker, args.max_attempts,
+                   args.incremental)
+    else:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(name)s] %(levelname)s: %(message)s')
+        run(args.config, workers=args.workers, store=args.store, output=args.output,
+            max_attempts=args.max_attempts, incremental=args.incremental)
+
+
+if __name__ == '__main__':
+    main()
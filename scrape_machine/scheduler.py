@@ -0,0 +1,141 @@
+# Scheduler that keeps requests out of the downloader until their domain is due.
+#
+# A request waiting inside a downloader middleware still counts against
+# CONCURRENT_REQUESTS, so one slow or backed-off domain would fill every
+# slot and stall the others. PoliteScheduler asks PolitenessMiddleware
+# when each domain is next free and holds early requests in per-domain
+# queues, handing them out in order as their domains come due. Requests the
+# middleware still finds early (a proxy slot picked after scheduling) come
+# back with ``meta['politeness_due']`` and rejoin the front of their queue.
+
+import heapq
+import itertools
+import time
+from collections import deque
+
+from scrapy.core.scheduler import Scheduler
+
+from .blocking import slot_key
+from .middlewares import politeness_for
+
+
+class PoliteScheduler(Scheduler):
+    """
+    Scrapy's scheduler plus per-domain holding queues for requests that aren't due yet.
+
+    Held requests already passed the dupefilter. They count as pending, so
+    the spider isn't closed as idle while they wait; a JOBDIR crawl stopped
+    meanwhile saves them with the rest of the queue. At most
+    SCHEDULER_MAX_HELD are held; past that, new requests wait in the
+    regular queue until held ones are sent. Without PolitenessMiddleware it
+    is Scrapy's scheduler.
+    """
+
+    def __init__(self, *args, max_held=10_000, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_held = max_held
+        self.held = {}
+        self.held_count = 0
+        # (due, seq, domain), one entry per domain with held requests
+        self.due = []
+        self.order = itertools.count()
+        self.timer = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scheduler = super().from_crawler(crawler)
+        scheduler.max_held = crawler.settings.getint('SCHEDULER_MAX_HELD', 10_000)
+        return scheduler
+
+    def enqueue_request(self, request):
+        due = request.meta.pop('politeness_due', None)
+        if due is None:
+            return super().enqueue_request(request)
+        # Sent back by PolitenessMiddleware: first in line for its domain
+        self.hold(request, due[0], front=True)
+        self.wake()
+        return True
+
+    def next_request(self):
+        politeness = politeness_for(self.crawler) if self.crawler else None
+        if politeness is None:
+            return super().next_request()
+        try:
+            now = time.monotonic()
+            while self.due and self.due[0][0] <= now:
+                _, _, domain = heapq.heappop(self.due)
+                ready = politeness.due_at(domain)
+                if ready > now:
+                    heapq.heappush(self.due, (ready, next(self.order), domain))
+                    continue
+                queue = self.held[domain]
+                request = queue.popleft()
+                self.held_count -= 1
+                if queue:
+                    # Checked again once this one has taken the domain's turn
+                    heapq.heappush(self.due, (now, next(self.order), domain))
+                else:
+                    del self.held[domain]
+                return request
+            while self.held_count < self.max_held:
+                request = super().next_request()
+                if request is None:
+                    return None
+                domain = slot_key(request)
+                if request.meta.get('dont_politeness') or (
+                        domain not in self.held and politeness.due_at(domain) <= now):
+                    return request
+                self.hold(request, domain)
+            return None
+        finally:
+            self.wake()
+
+    def hold(self, request, domain, front=False):
+        if 'politeness_since' not in request.meta:
+            request.meta['politeness_since'] = time.monotonic()
+            self.stats.inc_value('politeness/delayed', spider=self.spider)
+        queue = self.held.get(domain)
+        if queue is None:
+            queue = self.held[domain] = deque()
+            politeness = politeness_for(self.crawler)
+            ready = politeness.due_at(domain) if politeness is not None else 0.0
+            heapq.heappush(self.due, (ready, next(self.order), domain))
+        if front:
+            queue.appendleft(request)
+        else:
+            queue.append(request)
+        self.held_count += 1
+
+    def has_pending_requests(self):
+        return self.held_count > 0 or super().has_pending_requests()
+
+    def __len__(self):
+        return self.held_count + super().__len__()
+
+    def wake(self):
+        """Have the engine ask for requests again when the first held domain is due."""
+        engine = getattr(self.crawler, 'engine', None) if self.crawler else None
+        if not self.due or engine is None or engine.slot is None:
+            return
+        from twisted.internet import reactor
+        delay = max(0.0, self.due[0][0] - time.monotonic())
+        if self.timer is not None and self.timer.active():
+            if self.timer.getTime() <= reactor.seconds() + delay:
+                return
+            self.timer.cancel()
+        self.timer = reactor.callLater(delay, engine.slot.nextcall.schedule)
+
+    def close(self, reason):
+        if self.timer is not None and self.timer.active():
+            self.timer.cancel()
+        if self.dqs is not None:
+            # Already past the dupefilter; saved with the rest of the queue
+            for queue in self.held.values():
+                for request in queue:
+                    request.meta.pop('politeness_since', None)
+                    request.dont_filter = True
+                    super().enqueue_request(request)
+        self.held.clear()
+        self.due.clear()
+        self.held_count = 0
+        return super().close(reason)
@@ -0,0 +1,138 @@
+# Spider loader that finds spiders by name without importing them.
+#
+# Enable with SPIDER_LOADER_CLASS = 'scrape_machine.spiderloader.LazySpiderLoader'.
+#
+# Scrapy's default loader imports every module under SPIDER_MODULES on
+# startup, so `scrapy crawl google` or `scrapy list` paid for (and failed
+# without) Selenium and webdriver_manager, which only google_maps_selenium
+# needs. This one reads the spider modules' source to find each spider's
+# name and imports a module only when one of its spiders is loaded.
+
+import ast
+import importlib
+import importlib.util
+import os
+import pkgutil
+import traceback
+import warnings
+from typing import Dict, Iterator, List, Tuple
+
+from scrapy.interfaces import ISpiderLoader
+from scrapy.spiders import Spider
+from zope.interface import implementer
+
+
+def spider_names(source: str) -> Iterator[Tuple[str, str]]:
+    """Yield (spider name, class name) for top-level classes assigning a string literal to ``name``."""
+    for node in ast.parse(source).body:
+        if not isinstance(node, ast.ClassDef) or not node.bases:
+            continue
+        for statement in node.body:
+            if (isinstance(statement, ast.Assign)
+                    and any(isinstance(target, ast.Name) and target.id == 'name' for target in statement.targets)
+                    and isinstance(statement.value, ast.Constant) and isinstance(statement.value.value, str)
+                    and statement.value.value):
+                yield statement.value.value, node.name
+                break
+
+
+def module_files(package: str) -> Iterator[Tuple[str, str]]:
+    """Yield (module name, source path) for ``package`` and every module below it, without importing them."""
+    spec = importlib.util.find_spec(package)
+    if spec is None:
+        raise ImportError(f"No module named {package!r}")
+    if spec.origin and spec.origin.endswith('.py'):
+        yield package, spec.origin
+    for path in spec.submodule_search_locations or ():
+        for info in pkgutil.iter_modules([path]):
+            name = f'{package}.{info.name}'
+            if info.ispkg:
+                yield from module_files(name)
+            else:
+                yield name, os.path.join(path, f'{info.name}.py')
+
+
+@implementer(ISpiderLoader)
+class LazySpiderLoader:
+    """
+    Locates spiders in SPIDER_MODULES by parsing their source; imports them on ``load``.
+
+    Spider classes must set ``name`` to a string literal in their class
+    body to be found. Modules that can't be read or parsed are reported
+    like import errors in Scrapy's loader (a warning with
+    SPIDER_LOADER_WARN_ONLY, an error otherwise).
+    """
+
+    def __init__(self, settings):
+        self.spider_modules: List[str] = settings.getlist('SPIDER_MODULES')
+        self.warn_only: bool = settings.getbool('SPIDER_LOADER_WARN_ONLY')
+        self._locations: Dict[str, Tuple[str, str]] = {}
+        self._spiders: Dict[str, type] = {}
+        self._discover()
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(settings)
+
+    def _fail(self, what):
+        if not self.warn_only:
+            raise
+        warnings.warn(f"\n{traceback.format_exc()}Could not load spiders from {what}. "
+                      "See above traceback for details.", category=RuntimeWarning)
+
+    def _discover(self):
+        found = {}
+        for package in self.spider_modules:
+            try:
+                files = list(module_files(package))
+            except (ImportError, SyntaxError):
+                self._fail(f"module '{package}'")
+                continue
+            for module, path in files:
+                try:
+                    with open(path, encoding='utf-8') as f:
+                        names = list(spider_names(f.read()))
+                except (OSError, SyntaxError, UnicodeDecodeError):
+                    self._fail(f"module '{module}'")
+                    continue
+                for name, class_name in names:
+                    found.setdefault(name, []).append((module, class_name))
+                    self._locations[name] = (module, class_name)
+        dupes = [f"  {class_name} named {name!r} (in {module})"
+                 for name, locations in found.items() if len(locations) > 1
+                 for module, class_name in locations]
+        if dupes:
+            warnings.warn("There are several spiders with the same name:\n\n" + "\n\n".join(dupes)
+                          + "\n\n  This can cause unexpected behavior.", category=UserWarning)
+
+    def load(self, spider_name: str):
+        """Import and return the Spider class named ``spider_name``; KeyError if there is none."""
+        if spider_name in self._spiders:
+            return self._spiders[spider_name]
+        try:
+            module, class_name = self._locations[spider_name]
+        except KeyError:
+            raise KeyError(f"Spider not found: {spider_name}")
+        spider_class = getattr(importlib.import_module(module), class_name, None)
+        if not (isinstance(spider_class, type) and issubclass(spider_class, Spider)
+                and spider_class.name == spider_name):
+            raise KeyError(f"Spider not found: {spider_name} ({module}.{class_name} is not it)")
+        self._spiders[spider_name] = spider_class
+        return spider_class
+
+    def find_by_request(self, request) -> List[str]:
+        """Names of the spiders that can handle ``request``; this imports every spider."""
+        names = []
+        for name in self._locations:
+            try:
+                spider_class = self.load(name)
+            except (ImportError, KeyError) as e:
+                # A spider whose dependencies are missing can't handle anything
+                warnings.warn(f"Skipping spider {name!r}: {e}", category=RuntimeWarning)
+                continue
+            if spider_class.handles_request(request):
+                names.append(name)
+        return names
+
+    def list(self) -> List[str]:
+        return list(self._locations)
@@ -1,7 +1,10 @@
-import re
 from datetime import datetime
 from scrapy import Spider
-from typing import List, Optional
+from typing import Iterable, List, Optional
+
+from .. import contacts
+from ..debugcapture import capture_for
+from ..decoding import page_selector
 
 class BaseSpider(Spider):
     """
@@ -11,30 +14,36 @@ class BaseSpider(Spider):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Common regex patterns
-        self.email_pattern = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}')
-        self.phone_pattern = re.compile(r'\+?1?\s*\(?[0-9]{3}\)?[-.\s]?[0-9]{3}[-.\s]?[0-9]{4}')
+        self.email_pattern = contacts.email_pattern
+        self.phone_pattern = contacts.phone_pattern
+        
+    def extract_contact(self, text: Optional[str]) -> contacts.Contacts:
+        """Extract emails and phone numbers from text in a single scan."""
+        return contacts.extract_contact(text)
+    
+    def extract_contacts(self, texts: Iterable[Optional[str]]) -> List[contacts.Contacts]:
+        """Extract emails and phone numbers from several texts."""
+        return contacts.extract_contacts(texts)
         
     def extract_emails(self, text: str) -> List[str]:
         """Extract email addresses from text."""
-        if not text:
-            return []
-        return list(set(self.email_pattern.findall(text)))
+        return contacts.extract_contact(text).emails
     
     def extract_phones(self, text: str) -> List[str]:
         """Extract phone numbers from text."""
-        if not text:
-            return []
-        return list(set(self.phone_pattern.findall(text)))
+        return contacts.extract_contact(text).phones
     
     def clean_text(self, text: Optional[str]) -> Optional[str]:
-        """Clean text by removing extra whitespace and special characters."""
-        if not text:
-            return None
-        # Remove special characters and normalize whitespace
-        text = re.sub(r'[\r\n\t]+', ' ', text)
-        text = re.sub(r'\s+', ' ', text)
-        return text.strip()
+        """Clean text by collapsing whitespace in a single pass."""
+        return contacts.clean_text(text)
     
+    def capture_debug(self, outcome: str, response, **extra):
+        """Hand ``response`` to the debug capture (see debugcapture.py), which samples it by ``outcome``."""
+        crawler = getattr(self, 'crawler', None)
+        capture = capture_for(crawler) if crawler is not None else None
+        if capture is not None:
+            capture.capture(outcome, response, spider=self, **extra)
+        
     def get_current_datetime(self) -> str:
         """Get current datetime in ISO format."""
         return datetime.now().isoformat()
@@ -42,7 +51,8 @@ class BaseSpider(Spider):
     def safe_extract_text(self, response, css_selector: str) -> Optional[str]:
         """Safely extract text from a CSS selector."""
         try:
-            text = response.css(css_selector).get()
+            selector = page_selector(response)
+            text = selector.css(css_selector).get() if selector is not None else None
             return self.clean_text(text)
         except Exception as e:
             self.logger.warning(f"Error extracting text with selector {css_selector}: {str(e)}")
@@ -1,35 +1,85 @@
+import json
 import time
-import random
+from itertools import product
+from urllib.parse import quote
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException, ElementClickInterceptedException
-from webdriver_manager.chrome import ChromeDriverManager
-from scrapy import Spider
+from selenium.common.exceptions import TimeoutException
+from scrapy.http import Request
+from ..browser_pool import BrowserPool, chromedriver_path
 from ..items import LeadItem
 from .base_spider import BaseSpider
 
+# Scrolls the feed passed as arguments[0] and reports how many listings it
+# holds and whether Maps shows its end-of-list marker.
+SCROLL_FEED_JS = """
+const feed = arguments[0];
+feed.scrollTo(0, feed.scrollHeight);
+return [feed.querySelectorAll('div.Nv2PK').length, document.querySelector('span.HlvSq') !== null];
+"""
+
+# Serializes every listing card to JSON in the browser.
+EXTRACT_LISTINGS_JS = """
+const text = (card, selector) => {
+    const el = card.querySelector(selector);
+    return el ? el.textContent.trim() || null : null;
+};
+return JSON.stringify(Array.from(document.querySelectorAll('div.Nv2PK'), card => {
+    const website = card.querySelector("a[data-item-id='authority']");
+    return {
+        name: text(card, 'div.qBF1Pd'),
+        address: text(card, 'div.W4Efsd span:last-child'),
+        phone: text(card, 'span.UsdlK'),
+        website: website ? website.href : null,
+        rating: text(card, 'span.MW4etd'),
+    };
+}));
+"""
+
 class GoogleMapsSeleniumSpider(BaseSpider):
+    """
+    Google Maps scraper driving a pool of Chrome browsers.
+
+    ``query`` and ``location`` accept several values separated by ``;`` and
+    every (query, location) pair becomes one job. Jobs are spread over
+    ``browsers`` Chrome instances running in worker threads and their leads
+    are yielded as each job finishes.
+    """
     name = 'google_maps_selenium'
     allowed_domains = ['google.com']
-    
+
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
-        'DOWNLOAD_DELAY': random.uniform(3, 5),
+        'POLITENESS_DELAY': (3, 5),
         'COOKIES_ENABLED': True,
+        # Jobs are dispatched as data: requests; nothing worth caching
+        'HTTPCACHE_ENABLED': False,
     }
-    
-    def __init__(self, query=None, location=None, *args, **kwargs):
+
+    def __init__(self, query=None, location=None, browsers=None, headless=False, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.query = query or "doctor"
         self.location = location or "Tulsa, OK"
-        
+        self.browsers = browsers
+        self.headless = str(headless).lower() in ('1', 'true', 'yes')
+        self.pool = None
+
+    def jobs(self):
+        """All (query, location) pairs to scrape."""
+        queries = [q.strip() for q in self.query.split(';') if q.strip()]
+        locations = [l.strip() for l in self.location.split(';') if l.strip()]
+        return list(product(queries, locations))
+
+    def make_driver(self):
+        """Start a Chrome instance. Called from a pool worker thread."""
         # Setup Chrome options
         chrome_options = Options()
-        # chrome_options.add_argument("--headless")  # Commented out to avoid detection
+        if self.headless:
+            chrome_options.add_argument("--headless=new")  # Off by default to avoid detection
         chrome_options.add_argument("--no-sandbox")
         chrome_options.add_argument("--disable-dev-shm-usage")
         chrome_options.add_argument("--disable-gpu")
@@ -37,102 +87,116 @@ class GoogleMapsSeleniumSpider(BaseSpider):
         chrome_options.add_argument("--disable-blink-features=AutomationControlled")
         chrome_options.add_experimental_option("excludeSwitches", ["enable-automation"])
         chrome_options.add_experimental_option('useAutomationExtension', False)
-        
-        # Initialize the Chrome WebDriver
-        self.driver = webdriver.Chrome(
-            service=Service(ChromeDriverManager().install()),
+
+        driver = webdriver.Chrome(
+            service=Service(chromedriver_path(self.settings.get('CHROMEDRIVER_PATH'))),
             options=chrome_options
         )
-        
-        # Add random delay between actions
-        self.driver.implicitly_wait(10)
-        
-    def scroll_results(self):
-        """Scroll through the results panel to load more listings."""
+        driver.implicitly_wait(10)
+        return driver
+
+    def scroll_results(self, driver):
+        """
+        Scroll the results feed until it stops growing.
+
+        Stops when Maps shows its end-of-list marker, when the number of
+        listings hasn't changed for SELENIUM_SCROLL_PATIENCE scrolls, or
+        after SELENIUM_MAX_SCROLLS scrolls.
+        """
+        pause = self.settings.getfloat('SELENIUM_SCROLL_PAUSE', 1.0)
+        patience = self.settings.getint('SELENIUM_SCROLL_PATIENCE', 3)
+        max_scrolls = self.settings.getint('SELENIUM_MAX_SCROLLS', 60)
         try:
-            results_panel = self.driver.find_element(By.CSS_SELECTOR, "div[role='feed']")
-            for _ in range(30):  # Just scroll 30 times
-                self.driver.execute_script("arguments[0].scrollTo(0, arguments[0].scrollHeight);", results_panel)
-                time.sleep(2)
+            results_panel = driver.find_element(By.CSS_SELECTOR, "div[role='feed']")
         except Exception:
-            pass
-            
-    def extract_listing_data(self, listing):
-        """Extract data from a listing element."""
-        try:
+            return
+        last_count, unchanged = -1, 0
+        for _ in range(max_scrolls):
+            count, at_end = driver.execute_script(SCROLL_FEED_JS, results_panel)
+            if at_end:
+                break
+            if count == last_count:
+                unchanged += 1
+                if unchanged >= patience:
+                    break
+            else:
+                last_count, unchanged = count, 0
+            time.sleep(pause)
+
+    def extract_listings(self, driver):
+        """Serialize every listing card in one round trip."""
+        leads = []
+        for card in json.loads(driver.execute_script(EXTRACT_LISTINGS_JS)):
+            if not card.get('name'):
+                continue
             lead = LeadItem()
-            
-            # Get name
-            name_elem = listing.find_element(By.CSS_SELECTOR, "div.qBF1Pd")
-            lead['name'] = name_elem.text
-            lead['company'] = lead['name']
-            
-            # Get address
-            try:
-                address_elem = listing.find_element(By.CSS_SELECTOR, "div.W4Efsd span:last-child")
-                lead['address'] = address_elem.text
-            except:
-                lead['address'] = None
-            
-            # Get phone
-            try:
-                phone_elem = listing.find_element(By.CSS_SELECTOR, "span.UsdlK")
-                lead['phone'] = phone_elem.text
-            except:
-                lead['phone'] = None
-            
-            # Get website
-            try:
-                website_elem = listing.find_element(By.CSS_SELECTOR, "a[data-item-id='authority']")
-                lead['website'] = website_elem.get_attribute('href')
-            except:
-                lead['website'] = None
-            
+            lead['name'] = card['name']
+            lead['company'] = card['name']
+            lead['address'] = card.get('address')
+            lead['phone'] = card.get('phone')
+            lead['website'] = card.get('website')
+            lead['rating'] = self.parse_rating(card.get('rating'))
             lead['source'] = 'google_maps'
             lead['scraped_date'] = self.get_current_datetime()
-            
-            return lead
-            
-        except Exception:
+            leads.append(lead)
+        return leads
+
+    def parse_rating(self, value):
+        """Parse a rating like '4,7' or '4.7' into a float."""
+        try:
+            return float(value.replace(',', '.'))
+        except (AttributeError, ValueError):
             return None
-        
+
+    def scrape_job(self, driver, query, location):
+        """Scrape one search with a pooled browser. Runs in a worker thread."""
+        url = f'https://www.google.com/maps/search/{quote(query)}+{quote(location)}'
+        driver.get(url)
+        time.sleep(5)
+
+        # Wait for results to load
+        try:
+            WebDriverWait(driver, 15).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, "div.Nv2PK"))
+            )
+        except TimeoutException:
+            return []
+
+        # Scroll to load more results
+        self.scroll_results(driver)
+
+        return self.extract_listings(driver)
+
     def start_requests(self):
-        """Start with a direct search request."""
-        url = f'https://www.google.com/maps/search/{self.query}+{self.location}'
-        
+        """Queue one job per (query, location) pair."""
+        size = int(self.browsers or self.settings.getint('SELENIUM_POOL_SIZE', 2))
+        self.pool = BrowserPool(
+            self.make_driver,
+            size=size,
+            max_jobs=self.settings.getint('SELENIUM_MAX_JOBS_PER_DRIVER', 20),
+        )
+        for query, location in self.jobs():
+            # data: URIs are served locally; the request only carries the job
+            # through the scheduler so jobs run concurrently
+            yield Request(
+                f'data:,{quote(query)}|{quote(location)}',
+                callback=self.parse_job,
+                cb_kwargs={'query': query, 'location': location},
+                dont_filter=True
+            )
+
+    async def parse_job(self, response, query, location):
+        """Hand the job to the browser pool and yield its leads when done."""
         try:
-            self.driver.get(url)
-            time.sleep(5)
-            
-            # Wait for results to load
-            try:
-                WebDriverWait(self.driver, 15).until(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, "div.Nv2PK"))
-                )
-            except TimeoutException:
-                return
-            
-            # Scroll to load more results
-            self.scroll_results()
-            
-            # Get all listings
-            listings = self.driver.find_elements(By.CSS_SELECTOR, "div.Nv2PK")
-            
-            # Process each listing
-            for listing in listings:
-                try:
-                    lead = self.extract_listing_data(listing)
-                    if lead:
-                        yield lead
-                except Exception:
-                    continue
-                    
-        except Exception:
-            pass
-        finally:
-            self.driver.quit()
-            
+            leads = await self.pool.submit(self.scrape_job, query, location)
+        except Exception as e:
+            self.logger.error(f"Job {query!r} in {location!r} failed: {e}")
+            return
+        self.crawler.stats.inc_value('selenium/jobs_done')
+        for lead in leads:
+            yield lead
+
     def closed(self, reason):
         """Clean up when spider closes."""
-        if hasattr(self, 'driver'):
-            self.driver.quit() 
\ No newline at end of file
+        if self.pool:
+            self.pool.stop()
@@ -1,21 +1,37 @@
 from urllib.parse import urlencode, quote
+import json
+import os
 import random
 import time
-import json
-import re
+from scrapy import signals
 from scrapy.http import Request, JsonRequest
+from scrapy.utils.job import job_dir
+from w3lib.url import add_or_replace_parameter
+from .. import geo, maps_state, offload
+from ..contacts import page_contacts
+from ..decoding import page_selector
+from ..delta import DeltaIndex
+from ..dupefilter import canonical_url
+from ..enrichment import EnrichmentCache
 from ..items import LeadItem
+from ..normalize import registrable_domain
+from ..pipelines import phone_region
 from .base_spider import BaseSpider
 
 class GoogleMapsSpider(BaseSpider):
     name = 'google_maps'
     allowed_domains = ['google.com']
+    contact_keywords = ('contact', 'about', 'impressum', 'kontakt')
     
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
-        'CONCURRENT_REQUESTS': 1,
-        'DOWNLOAD_DELAY': random.uniform(2, 4),
+        # Per-domain concurrency is adapted by PolitenessMiddleware (AIMD)
+        'CONCURRENT_REQUESTS': 8,
+        'POLITENESS_DELAY': (2, 4),
+        'AIMD_MIN_DELAY': 1,
         'COOKIES_ENABLED': True,
+        # Keep the Maps cookies on one IP
+        'PROXY_STICKY_DOMAINS': ['google.com'],
     }
     
     def __init__(self, query=None, location=None, radius=50000, *args, **kwargs):
@@ -23,17 +39,85 @@ class GoogleMapsSpider(BaseSpider):
         self.query = query or "doctor"
         self.location = location or "Tulsa, OK"
         self.radius = int(radius)  # radius in meters
+        self.planner = None
+        self.tiles_planned = False
+        self.seen_places = set()
+        self.enrichment = None
+        self.delta = None
+        self.max_enrichment_pages = 4
         self.user_agents = [
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
             'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36',
         ]
         
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        if crawler.settings.getbool('MAPS_TILING', True):
+            spider.planner = geo.TilePlanner.from_settings(crawler.settings)
+        crawler.signals.connect(spider.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(spider.request_dropped, signal=signals.request_dropped)
+        return spider
+        
+    def spider_opened(self, spider):
+        """
+        Open the enrichment cache and, in incremental runs, the delta index.
+        
+        When resuming a JOBDIR crawl, requests from the saved queue may run
+        before start_requests, so the leads that were waiting on website
+        crawls are restored here.
+        """
+        self.enrichment = EnrichmentCache(
+            self.settings.get('ENRICHMENT_CACHE_PATH'),
+            ttl=self.settings.getfloat('ENRICHMENT_CACHE_TTL', 7 * 24 * 3600),
+        )
+        self.max_enrichment_pages = self.settings.getint('ENRICHMENT_MAX_PAGES_PER_DOMAIN', 4)
+        if self.settings.getbool('INCREMENTAL'):
+            self.delta = DeltaIndex(
+                self.settings.get('DELTA_INDEX_PATH', 'delta.sqlite3'),
+                freshness=self.settings.getfloat('DELTA_FRESHNESS', 7 * 24 * 3600),
+                region=phone_region(self, self.settings),
+            )
+        path = self.waiting_path()
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                for domain, saved in json.load(f).items():
+                    for lead in saved['leads']:
+                        self.enrichment.join(domain, LeadItem(lead))
+                    state = self.enrichment.domains[domain]
+                    state.pending = saved['pending']
+                    state.email, state.phone = saved['email'], saved['phone']
+                    state.parsed = saved.get('parsed', 0)
+            os.remove(path)
+            
+    def waiting_path(self):
+        """Where leads waiting on enrichment are saved between JOBDIR runs."""
+        directory = job_dir(self.settings)
+        return os.path.join(directory, 'enrichment_waiting.json') if directory else None
+        
     def start_requests(self):
-        """Start with a direct search request."""
+        """
+        Search the whole area first, or go straight to the tiles for a "lat,lng" location.
+        
+        With tiling on, the first results page supplies the map center the
+        tiles are planned around (see parse_initial_response).
+        """
+        coordinates = geo.parse_coordinates(self.location)
+        if self.planner and coordinates:
+            yield from self.plan_tiles(*coordinates)
+            return
         encoded_query = quote(f"{self.query} {self.location}")
         url = f'https://www.google.com/maps/search/{encoded_query}'
+        # Entry points are fetched on every run, like Scrapy's start_urls
+        yield Request(
+            url=url,
+            callback=self.parse_initial_response,
+            headers=self.search_headers(),
+            dont_filter=True
+        )
         
-        headers = {
+    def search_headers(self):
+        return {
             'User-Agent': random.choice(self.user_agents),
             'Accept': '*/*',
             'Accept-Language': 'en-US,en;q=0.9',
@@ -41,161 +125,267 @@ class GoogleMapsSpider(BaseSpider):
             'Origin': 'https://www.google.com',
         }
         
-        yield Request(
-            url=url,
-            callback=self.parse_initial_response,
-            headers=headers,
-            dont_filter=True
-        )
+    def plan_tiles(self, lat, lng):
+        """Search requests for the tiles covering ``radius`` meters around (lat, lng)."""
+        self.tiles_planned = True
+        tiles = self.planner.plan(lat, lng, self.radius)
+        self.logger.info(f"Searching {len(tiles)} tiles around {lat:.5f},{lng:.5f} (radius {self.radius} m)")
+        yield from self.tile_requests(tiles)
+        
+    def tile_requests(self, tiles):
+        for tile in tiles:
+            self.crawler.stats.inc_value('tiles/requested')
+            yield Request(
+                geo.tile_url(self.query, tile),
+                callback=self.parse_initial_response,
+                headers=self.search_headers(),
+                meta={'maps_tile': tile},
+            )
         
-    def parse_initial_response(self, response):
+    async def parse_initial_response(self, response):
         """Parse the initial response to extract the data."""
         try:
-            # Save response for debugging
-            with open('debug_response.html', 'w', encoding='utf-8') as f:
-                f.write(response.text)
-            
-            # Extract the data section
-            data_section = re.search(r'window\.APP_INITIALIZATION_STATE=([^;]+);', response.text)
-            if not data_section:
+            # Decoding the embedded state is the heaviest work here; it runs
+            # in the offload pool when there is one
+            page = await offload.run_on_response(self.crawler, maps_state.parse_search_page, response)
+            if not page.found:
                 self.logger.error("Could not find APP_INITIALIZATION_STATE")
+                self.capture_debug('empty', response, reason='no APP_INITIALIZATION_STATE')
                 return
                 
-            # The data is a list of lists, we need to find the one with business data
-            raw_data = data_section.group(1)
-            
-            # Find all arrays in the data
-            arrays = re.findall(r'\[\[.*?\]\]', raw_data)
-            
-            for array in arrays:
-                try:
-                    data = json.loads(array)
-                    # Business data typically has specific fields we can check for
-                    if isinstance(data, list) and len(data) > 0 and isinstance(data[0], list):
-                        for business_data in data:
-                            if not isinstance(business_data, list) or len(business_data) < 5:
-                                continue
-                                
-                            # Try to extract business information
-                            try:
-                                lead = LeadItem()
-                                
-                                # Extract what we can find
-                                for item in business_data:
-                                    if isinstance(item, str):
-                                        # Look for business name
-                                        if not lead.get('name') and len(item) > 3:
-                                            lead['name'] = item
-                                            lead['company'] = item
-                                        # Look for website
-                                        elif item.startswith('http'):
-                                            lead['website'] = item
-                                        # Look for phone
-                                        elif re.match(r'[\d\-\(\)\s\+]{10,}', item):
-                                            lead['phone'] = item
-                                    elif isinstance(item, list):
-                                        # Address is often in a list
-                                        if len(item) > 0 and isinstance(item[0], str):
-                                            lead['address'] = item[0]
-                                
-                                if lead.get('name'):  # Only yield if we found at least a name
-                                    lead['source'] = 'google_maps'
-                                    lead['scraped_date'] = self.get_current_datetime()
-                                    
-                                    # If we have a website, try to find email there
-                                    if lead.get('website'):
-                                        yield Request(
-                                            lead['website'],
-                                            callback=self.parse_website,
-                                            meta={'lead': lead},
-                                            headers={'User-Agent': random.choice(self.user_agents)},
-                                            dont_filter=True,
-                                            errback=self.handle_error
-                                        )
-                                    else:
-                                        yield lead
-                                        
-                            except Exception as e:
-                                self.logger.error(f"Error parsing business data: {str(e)}")
-                                continue
-                                
-                except json.JSONDecodeError:
+            self.crawler.stats.inc_value('maps/search_pages')
+            places = len(page.places)
+            for place in page.places:
+                # Tiles overlap each other and the area-wide search
+                if place['place_id'] in self.seen_places:
+                    self.crawler.stats.inc_value('maps/duplicate_places')
                     continue
+                self.seen_places.add(place['place_id'])
+                self.crawler.stats.inc_value('maps/unique_places')
+                lead = self.place_to_lead(place)
+                if self.delta:
+                    if self.delta.is_fresh(lead):
+                        self.crawler.stats.inc_value('delta/skipped')
+                        continue
+                    self.delta.note_listing(lead)
+                
+                # If we have a website, try to find email there
+                if lead.get('website'):
+                    for result in self.enrich(lead):
+                        yield result
+                else:
+                    yield lead
+            self.capture_debug('ok' if places else 'empty', response, places=places)
+                    
+            tile = response.meta.get('maps_tile')
+            if self.planner and tile is None and not self.tiles_planned:
+                if page.center:
+                    # The tiles cover this search's area; its own pages would only repeat them
+                    for request in self.plan_tiles(*page.center):
+                        yield request
+                    return
+            elif tile is not None:
+                children = self.planner.children(tile, places)
+                if children:
+                    # Saturated: the quadrants will surface more than this tile's pages
+                    self.crawler.stats.inc_value('tiles/split')
+                    for request in self.tile_requests(children):
+                        yield request
+                    return
                     
             # Look for pagination token
-            next_token = re.search(r'"VQF1hc":"([^"]+)"', response.text)
-            if next_token:
-                next_url = f"{response.url}?pageToken={next_token.group(1)}"
+            if page.next_token:
+                # A token handed out twice gives the same URL, which the dupefilter stops
+                next_url = add_or_replace_parameter(response.url, 'pageToken', page.next_token)
                 yield Request(
                     next_url,
                     callback=self.parse_initial_response,
                     headers={'User-Agent': random.choice(self.user_agents)},
-                    dont_filter=True
+                    meta={'maps_tile': tile} if tile is not None else {},
                 )
                 
         except Exception as e:
             self.logger.error(f"Error in parse_initial_response: {str(e)}")
-            # Save the raw response for debugging
-            with open('error_response.html', 'w', encoding='utf-8') as f:
-                f.write(response.text)
+            self.capture_debug('exception', response, error=repr(e))
                 
-    def parse_website(self, response):
+    def place_to_lead(self, place):
+        """Build a LeadItem from a decoded Maps place."""
+        lead = LeadItem()
+        lead['name'] = place.get('name')
+        lead['company'] = place.get('name')
+        lead['address'] = place.get('address')
+        lead['phone'] = place.get('phone')
+        lead['website'] = place.get('website')
+        lead['rating'] = place.get('rating')
+        lead['place_id'] = place.get('place_id')
+        lead['source'] = 'google_maps'
+        lead['scraped_date'] = self.get_current_datetime()
+        return lead
+        
+    def enrich(self, lead):
+        """Attach the lead to its website's domain crawl, starting the crawl if needed."""
+        domain = registrable_domain(lead['website'])
+        if not domain:
+            yield lead
+            return
+        state = self.enrichment.join(domain, lead)
+        if state.done:
+            self.crawler.stats.inc_value('enrichment/cache_hit')
+            self.enrichment.apply(state, lead)
+            yield lead
+        elif len(state.waiting) == 1:
+            self.crawler.stats.inc_value('enrichment/domains')
+            state.pending = 1
+            yield self.enrichment_request(lead['website'], domain, self.parse_website)
+        else:
+            self.crawler.stats.inc_value('enrichment/shared')
+            
+    def enrichment_request(self, url, domain, callback):
+        return Request(
+            url,
+            callback=callback,
+            cb_kwargs={'domain': domain},
+            meta={'enrichment_domain': domain, 'allow_offsite': True},
+            headers={'User-Agent': random.choice(self.user_agents)},
+            errback=self.handle_error
+        )
+        
+    def request_dropped(self, request, spider):
+        """
+        Count an enrichment page the dupefilter dropped as done.
+        
+        That happens when a redirect lands on a page already fetched. The
+        page's leads can only be released from a callback, so a local
+        data: request carries the domain to one.
+        """
+        domain = request.meta.get('enrichment_domain')
+        if domain and not self.enrichment.is_done(domain):
+            self.crawler.stats.inc_value('enrichment/duplicate_pages')
+            self.crawler.engine.crawl(Request(
+                'data:,',
+                callback=self.parse_dropped,
+                cb_kwargs={'domain': domain},
+                meta={'allow_offsite': True, 'dont_proxy': True, 'dont_politeness': True},
+                dont_filter=True,
+            ))
+            
+    def parse_dropped(self, response, domain):
+        yield from self.page_done(domain)
+        
+    def contact_candidates(self, response, domain):
+        """Contact-ish pages on the same domain: linked ones first, then common paths."""
+        selector = page_selector(response)
+        links = [
+            href for href in (selector.css('a::attr(href)').getall() if selector is not None else [])
+            if any(keyword in href.lower() for keyword in self.contact_keywords)
+        ]
+        links += ['/contact', '/contact-us', '/about', '/impressum']
+        # Compared as the dupefilter does, so none of these gets dropped as a duplicate
+        seen = {canonical_url(response.url)}
+        candidates = []
+        for link in links:
+            url = response.urljoin(link).split('#')[0]
+            if not url.startswith('http') or canonical_url(url) in seen or registrable_domain(url) != domain:
+                continue
+            seen.add(canonical_url(url))
+            candidates.append(url)
+            if len(candidates) >= self.max_enrichment_pages:
+                break
+        return candidates
+        
+    async def parse_website(self, response, domain):
         """Parse business website to find contact information."""
         try:
-            lead = response.meta.get('lead', LeadItem())
-            
-            # Look for contact page links
-            contact_links = response.css('a[href*="contact"]::attr(href), a[href*="Contact"]::attr(href)').getall()
-            if contact_links:
-                # Visit the first contact page found
-                contact_url = response.urljoin(contact_links[0])
-                yield Request(
-                    contact_url,
-                    callback=self.parse_contact_page,
-                    meta={'lead': lead},
-                    headers={'User-Agent': random.choice(self.user_agents)},
-                    dont_filter=True,
-                    errback=self.handle_error
-                )
+            await self.extract_contact_info(response, domain)
+            state = self.enrichment.domains[domain]
+            candidates = [] if state.email else self.contact_candidates(response, domain)
+            if candidates:
+                # Fetch contact pages in parallel; the first one with an email wins
+                state.pending = len(candidates)
+                for url in candidates:
+                    yield self.enrichment_request(url, domain, self.parse_contact_page)
             else:
-                # If no contact page, extract from current page
-                self.extract_contact_info(response, lead)
-                yield lead
+                for lead in self.enrichment.finish(domain):
+                    yield lead
                 
         except Exception as e:
             self.logger.error(f"Error parsing website: {str(e)}")
-            yield response.meta.get('lead')
+            for lead in self.enrichment.finish(domain):
+                yield lead
             
-    def parse_contact_page(self, response):
+    async def parse_contact_page(self, response, domain):
         """Parse the contact page for information."""
         try:
-            lead = response.meta.get('lead', LeadItem())
-            self.extract_contact_info(response, lead)
-            yield lead
+            if self.enrichment.is_done(domain):
+                return
+            await self.extract_contact_info(response, domain)
+            for lead in self.page_done(domain):
+                yield lead
             
         except Exception as e:
             self.logger.error(f"Error parsing contact page: {str(e)}")
-            yield response.meta.get('lead')
-            
-    def extract_contact_info(self, response, lead):
-        """Extract contact information from a page."""
-        # Extract all text from the page
-        text = ' '.join(response.css('body ::text').getall())
-        
-        # Look for email addresses
-        emails = self.extract_emails(text)
-        if emails and not lead.get('email'):
-            lead['email'] = emails[0]
+            for lead in self.page_done(domain):
+                yield lead
             
-        # Look for additional phone numbers
-        phones = self.extract_phones(text)
-        if phones and not lead.get('phone'):
-            lead['phone'] = phones[0]
+    def page_done(self, domain):
+        """Finish the domain once an email is found or no pages are left."""
+        state = self.enrichment.domains[domain]
+        state.pending -= 1
+        if state.email or state.pending <= 0:
+            yield from self.enrichment.finish(domain)
             
+    async def extract_contact_info(self, response, domain):
+        """Extract contact information from a page, reusing last run's result if it is unchanged."""
+        known = self.delta.page(response.url, response.body) if self.delta else None
+        if known is not None:
+            self.crawler.stats.inc_value('delta/pages_unchanged')
+            self.enrichment.found(domain, *known)
+            return
+        found = await offload.run_on_response(self.crawler, page_contacts, response,
+                                              self.settings.getint('ENRICHMENT_TEXT_BUDGET', 200_000))
+        email = found.emails[0] if found.emails else None
+        phone = found.phones[0] if found.phones else None
+        if self.delta:
+            self.delta.record_page(response.url, response.body, email, phone)
+        self.enrichment.found(domain, email, phone)
+        
     def handle_error(self, failure):
         """Handle request errors."""
-        self.logger.error(f"Request failed: {failure.value}")
-        # If there's a lead in meta, yield it even if we couldn't get more info
-        lead = failure.request.meta.get('lead')
-        if lead:
-            return lead 
\ No newline at end of file
+        domain = failure.request.meta.get('enrichment_domain')
+        if domain and self.enrichment.is_done(domain):
+            return
+        if not domain:
+            self.logger.error(f"Request failed: {failure.value}")
+            return
+        # Guessed contact pages often don't exist; release the leads waiting
+        # on the domain even if we couldn't get more info
+        self.logger.debug(f"Enrichment request failed: {failure.value}")
+        yield from self.page_done(domain)
+                
+    def closed(self, reason):
+        """Save leads still waiting on enrichment (JOBDIR runs) and close the caches."""
+        stats = self.crawler.stats
+        pages = stats.get_value('maps/search_pages', 0)
+        if pages:
+            unique = stats.get_value('maps/unique_places', 0)
+            self.logger.info(f"{unique} unique places from {pages} search pages "
+                             f"({unique / pages:.1f} per request, {stats.get_value('tiles/split', 0)} tiles split)")
+        path = self.waiting_path()
+        if self.enrichment:
+            waiting = {
+                domain: {
+                    'leads': [dict(lead) for lead in state.waiting],
+                    'pending': state.pending,
+                    'email': state.email,
+                    'phone': state.phone,
+                    'parsed': state.parsed,
+                }
+                for domain, state in self.enrichment.domains.items()
+                if state.waiting and not state.done
+            }
+            if path and waiting:
+                with open(path, 'w', encoding='utf-8') as f:
+                    json.dump(waiting, f)
+            self.enrichment.close()
+        if self.delta:
+            self.delta.close()
@@ -1,25 +1,26 @@
 from urllib.parse import urlencode
 import random
-import time
-import gzip
-import brotli
 from scrapy.http import Request
+from ..decoding import page_selector
 from ..items import LeadItem
 from .base_spider import BaseSpider
 
 class GoogleSpider(BaseSpider):
     name = 'google'
-    allowed_domains = ['google.com']
+    allowed_domains = ['google.com', 'linkedin.com']
     
     custom_settings = {
         'ROBOTSTXT_OBEY': False,
-        'CONCURRENT_REQUESTS': 1,
-        'DOWNLOAD_DELAY': random.uniform(3, 7),
+        # Per-domain concurrency is adapted by PolitenessMiddleware (AIMD)
+        'CONCURRENT_REQUESTS': 8,
+        'POLITENESS_DELAY': (3, 7),
+        'AIMD_MIN_DELAY': 2,
+        'POLITENESS_DOMAIN_DELAYS': {'linkedin.com': (2, 4)},
         'COOKIES_ENABLED': False,
         'DEFAULT_REQUEST_HEADERS': {
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
             'Accept-Language': 'en-US,en;q=0.5',
-            'Accept-Encoding': 'gzip, deflate, br',
+            # Accept-Encoding is left to HttpCompressionMiddleware, which only offers what it can decode
             'DNT': '1',
             'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
@@ -47,9 +48,6 @@ class GoogleSpider(BaseSpider):
         base_url = 'https://www.google.com/search?'
         
         for page in range(self.num_pages):
-            # Add random delay between requests
-            time.sleep(random.uniform(2, 5))
-            
             params = {
                 'q': self.query,
                 'start': page * 10,
@@ -64,6 +62,7 @@ class GoogleSpider(BaseSpider):
                 'User-Agent': random.choice(self.user_agents)
             }
             
+            # Entry points are fetched on every run, like Scrapy's start_urls
             yield Request(
                 url,
                 callback=self.parse,
@@ -75,25 +74,15 @@ class GoogleSpider(BaseSpider):
     def parse(self, response):
         """Parse Google search results page."""
         try:
-            # Get the response body and decode it
-            body = response.body
-            if response.headers.get('Content-Encoding', b'').lower() == b'br':
-                body = brotli.decompress(body)
-            elif response.headers.get('Content-Encoding', b'').lower() == b'gzip':
-                body = gzip.decompress(body)
-            
-            # Convert to text
-            text = body.decode('utf-8', errors='ignore')
-            
-            # Check if we got blocked
-            if 'Our systems have detected unusual traffic' in text:
-                self.logger.warning('Google detected automated traffic. Waiting...')
-                time.sleep(random.uniform(30, 60))
-                yield Request(response.url, callback=self.parse, dont_filter=True)
+            # Bodies arrive decompressed (HttpCompressionMiddleware); parse the bytes once
+            selector = page_selector(response)
+            if selector is None:
                 return
-                
+            
             # Extract search result links
-            for result in response.css('div.g'):
+            results = selector.css('div.g')
+            self.capture_debug('ok' if results else 'empty', response, results=len(results))
+            for result in results:
                 # Extract title and link
                 title_elem = result.css('h3::text').get()
                 link = result.css('a::attr(href)').get()
@@ -111,47 +100,52 @@ class GoogleSpider(BaseSpider):
                 snippet = self.clean_text(snippet)
                 
                 # Extract potential lead information from the snippet
-                emails = self.extract_emails(snippet)
-                phones = self.extract_phones(snippet)
+                found = self.extract_contact(snippet)
+                
+                if not (found.emails or found.phones):
+                    continue
+                lead = LeadItem()
+                lead['name'] = title
+                lead['email'] = found.emails[0] if found.emails else None
+                lead['phone'] = found.phones[0] if found.phones else None
+                lead['website'] = link
+                lead['source'] = 'google_search'
+                lead['scraped_date'] = self.get_current_datetime()
                 
-                if emails or phones:
-                    lead = LeadItem()
-                    lead['name'] = title
-                    lead['email'] = emails[0] if emails else None
-                    lead['phone'] = phones[0] if phones else None
-                    lead['website'] = link
-                    lead['source'] = 'google_search'
-                    lead['scraped_date'] = self.get_current_datetime()
-                    yield lead
-                    
                 # Follow the link if it's a LinkedIn profile
                 if 'linkedin.com/in/' in link:
-                    # Add random delay before following LinkedIn links
-                    time.sleep(random.uniform(2, 4))
+                    # The lead is emitted once, after the profile fills it in (or fails to),
+                    # so this request must not be dropped as a duplicate
                     yield Request(
                         link,
                         callback=self.parse_linkedin_profile,
+                        errback=self.linkedin_failed,
                         meta={'lead': lead},
                         headers={'User-Agent': random.choice(self.user_agents)},
-                        dont_filter=True
+                        dont_filter=True,
                     )
+                else:
+                    yield lead
                     
         except Exception as e:
             self.logger.error(f"Error parsing response: {str(e)}")
-            # Save the response for debugging
-            with open(f'error_response_{int(time.time())}.html', 'wb') as f:
-                f.write(response.body)
+            self.capture_debug('exception', response, error=repr(e))
                 
     def parse_linkedin_profile(self, response):
         """Parse LinkedIn profile page for additional information."""
+        lead = response.meta['lead']
         try:
-            lead = response.meta.get('lead', LeadItem())
-            
-            # Extract more information from LinkedIn profile
-            lead['position'] = self.clean_text(response.css('h2.top-card-layout__headline::text').get())
-            lead['company'] = self.clean_text(response.css('h4.top-card-company-name::text').get())
-            lead['linkedin_url'] = response.url
-            
-            yield lead
+            selector = page_selector(response)
+            if selector is not None:
+                # Extract more information from LinkedIn profile
+                lead['position'] = self.clean_text(selector.css('h2.top-card-layout__headline::text').get())
+                lead['company'] = self.clean_text(selector.css('h4.top-card-company-name::text').get())
+                lead['linkedin_url'] = response.url
         except Exception as e:
-            self.logger.error(f"Error parsing LinkedIn profile: {str(e)}") 
\ No newline at end of file
+            self.logger.error(f"Error parsing LinkedIn profile: {str(e)}")
+            self.capture_debug('exception', response, error=repr(e))
+        yield lead
+            
+    def linkedin_failed(self, failure):
+        """Emit the search lead without the profile's details."""
+        yield failure.request.meta['lead'] 
\ No newline at end of file
@@ -0,0 +1,335 @@
+# Output writers used by the item pipelines.
+#
+# Serialization and disk I/O happen on a background thread so the Twisted
+# reactor only pays for appending a dict to an in-memory buffer.
+
+import csv
+import gzip
+import io
+import json
+import os
+import threading
+import time
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class LeadWriter:
+    """
+    Buffered JSON-lines writer with background flushing, rotation and compression.
+
+    Records are collected in memory and handed to a worker thread when the
+    buffer reaches ``batch_size`` records or every ``flush_interval`` seconds,
+    whichever comes first. A new segment is started once the current one
+    exceeds ``max_bytes`` (uncompressed) or ``max_records``; zero disables
+    that limit. ``compression`` may be ``None``, ``'gzip'`` or ``'zstd'``
+    (the latter needs the ``zstandard`` package).
+    """
+
+    EXTENSIONS = {None: '', 'gzip': '.gz', 'zstd': '.zst'}
+    suffix = '.json'
+
+    def __init__(self, basename: str, directory: str = '.', batch_size: int = 500,
+                 flush_interval: float = 2.0, max_bytes: int = 0, max_records: int = 0,
+                 compression: Optional[str] = None):
+        if compression not in self.EXTENSIONS:
+            raise ValueError(f"Unsupported compression: {compression!r}")
+        if compression == 'zstd':
+            import zstandard  # noqa: F401  fail early if the dependency is missing
+
+        self.basename = basename
+        self.directory = directory
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.max_bytes = int(max_bytes)
+        self.max_records = int(max_records)
+        self.compression = compression
+
+        self.paths: List[str] = []
+        self.records_written = 0
+        self._segment = 0
+        self._raw = None
+        self._stream = None
+        self._segment_bytes = 0
+        self._segment_records = 0
+
+        self._buffer: List[dict] = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._closing = False
+        self._error: Optional[BaseException] = None
+        self._thread = threading.Thread(target=self._run, name='lead-writer', daemon=True)
+        self._thread.start()
+
+    def write(self, record: dict):
+        """Queue a record for writing. Never touches the disk on the calling thread."""
+        if self._error:
+            raise self._error
+        with self._wakeup:
+            if self._closing:
+                raise ValueError("write() on a closed LeadWriter")
+            self._buffer.append(record)
+            if len(self._buffer) >= self.batch_size:
+                self._wakeup.notify()
+
+    def close(self):
+        """Flush everything still buffered, fsync the current segment and close it."""
+        with self._wakeup:
+            if self._closing:
+                return
+            self._closing = True
+            self._wakeup.notify()
+        self._thread.join()
+        if self._error:
+            raise self._error
+
+    def _run(self):
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                with self._wakeup:
+                    while (not self._closing and len(self._buffer) < self.batch_size
+                           and time.monotonic() < deadline):
+                        self._wakeup.wait(max(0.0, deadline - time.monotonic()))
+                    batch, self._buffer = self._buffer, []
+                    closing = self._closing
+                if batch:
+                    self._write_batch(batch)
+                deadline = time.monotonic() + self.flush_interval
+                if closing:
+                    break
+        except BaseException as e:
+            self._error = e
+        finally:
+            self._close_segment()
+
+    def _encode(self, record: dict) -> bytes:
+        return (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+    def _header(self) -> bytes:
+        """Bytes starting every segment."""
+        return b''
+
+    def _write_batch(self, batch: List[dict]):
+        for record in batch:
+            if self._stream is None or self._needs_rotation():
+                self._open_segment()
+            data = self._encode(record)
+            self._stream.write(data)
+            self._segment_bytes += len(data)
+            self._segment_records += 1
+        self._stream.flush()
+        self.records_written += len(batch)
+
+    def _needs_rotation(self) -> bool:
+        if self.max_records and self._segment_records >= self.max_records:
+            return True
+        if self.max_bytes and self._segment_bytes >= self.max_bytes:
+            return True
+        return False
+
+    def _segment_path(self) -> str:
+        if self.max_bytes or self.max_records:
+            name = f'{self.basename}_{self._segment:05d}{self.suffix}'
+        else:
+            name = f'{self.basename}{self.suffix}'
+        return os.path.join(self.directory, name + self.EXTENSIONS[self.compression])
+
+    def _open_segment(self):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._segment_path()
+        self._raw = open(path, 'wb')
+        if self.compression == 'gzip':
+            self._stream = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        elif self.compression == 'zstd':
+            import zstandard
+            self._stream = zstandard.ZstdCompressor().stream_writer(self._raw, closefd=False)
+        else:
+            self._stream = self._raw
+        self.paths.append(path)
+        self._segment += 1
+        self._segment_bytes = 0
+        self._segment_records = 0
+        header = self._header()
+        if header:
+            self._stream.write(header)
+            self._segment_bytes += len(header)
+
+    def _close_segment(self):
+        if self._raw is None:
+            return
+        if self._stream is not self._raw:
+            self._stream.close()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+        self._raw = self._stream = None
+
+
+class Column(NamedTuple):
+    """An output column: ``dtype`` is 'string' or 'float64'; ``dictionary`` marks low-cardinality fields."""
+    name: str
+    dtype: str = 'string'
+    dictionary: bool = False
+
+
+def columns_for(item_class) -> List[Column]:
+    """Columns for an Item class, from its fields' ``dtype`` and ``dictionary`` metadata."""
+    return [
+        Column(name, field.get('dtype', 'string'), bool(field.get('dictionary')))
+        for name, field in item_class.fields.items()
+    ]
+
+
+class CSVLeadWriter(LeadWriter):
+    """
+    LeadWriter producing CSV with a header row per segment.
+
+    Only ``columns`` are written, in that order; missing values are empty.
+    """
+
+    suffix = '.csv'
+
+    def __init__(self, basename: str, columns: Sequence[Column], **kwargs):
+        self.columns = [column.name for column in columns]
+        self._text = io.StringIO()
+        self._csv = csv.writer(self._text, lineterminator='\n')
+        super().__init__(basename, **kwargs)
+
+    def _row(self, values) -> bytes:
+        self._text.seek(0)
+        self._text.truncate()
+        self._csv.writerow(values)
+        return self._text.getvalue().encode('utf-8')
+
+    def _header(self) -> bytes:
+        return self._row(self.columns)
+
+    def _encode(self, record: dict) -> bytes:
+        return self._row([record.get(name) for name in self.columns])
+
+
+class ParquetLeadWriter(LeadWriter):
+    """
+    LeadWriter producing Parquet files, one row group per ``row_group_size`` records.
+
+    Records are gathered into per-column lists on the writer thread, so at
+    most one row group is held in memory, however long the crawl. Columns
+    marked ``dictionary`` are dictionary-encoded in the file and typed as
+    dictionaries in Arrow; the others are written plain, since encoding
+    nearly unique values (emails, phones, place ids) only costs time.
+    ``compression`` is the Parquet codec ('zstd', 'snappy', 'gzip' or None).
+    A segment becomes readable once it is closed and its footer written.
+    """
+
+    suffix = '.parquet'
+
+    def __init__(self, basename: str, columns: Sequence[Column], row_group_size: int = 50_000,
+                 compression: Optional[str] = 'zstd', **kwargs):
+        if pyarrow is None:
+            raise ImportError("ParquetLeadWriter needs the pyarrow package")
+        self.columns = list(columns)
+        self.row_group_size = max(1, int(row_group_size))
+        self.codec = compression or 'none'
+        self.schema = pyarrow.schema([
+            (column.name, pyarrow.dictionary(pyarrow.int32(), pyarrow.string()) if column.dictionary
+             else pyarrow.type_for_alias(column.dtype))
+            for column in self.columns
+        ])
+        self._values: Dict[str, list] = {column.name: [] for column in self.columns}
+        self._writer = None
+        super().__init__(basename, **kwargs)
+
+    def _write_batch(self, batch: List[dict]):
+        values = [(column.name, self._values[column.name]) for column in self.columns]
+        for record in batch:
+            if self._writer is None or self._needs_rotation():
+                self._open_segment()
+            for name, column in values:
+                column.append(record.get(name))
+            self._segment_records += 1
+            if len(values[0][1]) >= self.row_group_size:
+                self._write_row_group()
+        self.records_written += len(batch)
+
+    def _array(self, column: Column, values: list):
+        kind = pyarrow.string() if column.dictionary else pyarrow.type_for_alias(column.dtype)
+        try:
+            array = pyarrow.array(values, type=kind)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError):
+            array = pyarrow.array([_coerce(value, column.dtype) for value in values], type=kind)
+        return array.dictionary_encode() if column.dictionary else array
+
+    def _write_row_group(self):
+        if not self._values[self.columns[0].name]:
+            return
+        arrays = [self._array(column, self._values[column.name]) for column in self.columns]
+        self._writer.write_table(pyarrow.Table.from_arrays(arrays, schema=self.schema))
+        for column in self._values.values():
+            column.clear()
+        self._segment_bytes = self._raw.tell()
+
+    def _open_segment(self):
+        self._close_segment()
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._segment_path()
+        self._raw = pyarrow.OSFile(path, 'wb')
+        self._writer = pyarrow.parquet.ParquetWriter(
+            self._raw, self.schema, compression=self.codec,
+            use_dictionary=[column.name for column in self.columns if column.dictionary],
+        )
+        self.paths.append(path)
+        self._segment += 1
+        self._segment_bytes = 0
+        self._segment_records = 0
+
+    def _close_segment(self):
+        if self._writer is None:
+            return
+        self._write_row_group()
+        self._writer.close()
+        self._raw.close()
+        fd = os.open(self.paths[-1], os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self._writer = self._raw = None
+
+
+def _coerce(value, dtype: str):
+    """``value`` as the column's type, or None when it can't be converted."""
+    if value is None:
+        return None
+    if dtype == 'string':
+        return value if isinstance(value, str) else str(value)
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def lead_writer(output_format: str, basename: str, columns: Sequence[Column], row_group_size: int = 50_000,
+                parquet_compression: Optional[str] = 'zstd', **kwargs) -> LeadWriter:
+    """
+    The writer for LEAD_FORMAT ``output_format``: 'jsonl', 'csv' or 'parquet'.
+
+    Parquet falls back to CSV when pyarrow isn't installed; check the
+    returned writer's ``suffix`` to see which one you got.
+    """
+    if output_format == 'parquet' and pyarrow is not None:
+        # Parquet compresses its pages itself; LEAD_COMPRESSION is for the text formats
+        kwargs.pop('compression', None)
+        return ParquetLeadWriter(basename, columns, row_group_size=row_group_size,
+                                 compression=parquet_compression, **kwargs)
+    if output_format in ('csv', 'parquet'):
+        return CSVLeadWriter(basename, columns, **kwargs)
+    if output_format in ('jsonl', 'json'):
+        return LeadWriter(basename, **kwargs)
+    raise ValueError(f"Unsupported lead output format: {output_format!r}")
@@ -0,0 +1,62 @@
+import time
+
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from scrape_machine.blocking import AIMDController
+from scrape_machine.middlewares import PolitenessMiddleware
+
+
+def test_domains_start_within_bounds():
+    aimd = AIMDController(start_delay=3.0, min_delay=0.25, max_delay=60.0)
+    assert aimd.limits('a.test').delay == 3.0
+    assert aimd.limits('b.test', start_delay=0.1).delay == 0.25
+    assert aimd.limits('c.test', start_delay=100).delay == 60.0
+
+
+def test_successes_speed_up_to_the_limits():
+    aimd = AIMDController(start_delay=1.0, min_delay=0.1, rate_step=0.5, max_concurrency=4)
+    delays = [aimd.on_success('a.test').delay for _ in range(200)]
+    assert all(later < earlier for earlier, later in zip(delays, delays[1:]) if earlier > 0.1)
+    # The rate grows by rate_step/rate per success, so rate**2 by a little over 2 * rate_step
+    assert 1 + 2 * 0.5 * 10 < 1 / delays[9] ** 2 < 1 + 2 * 0.5 * 10 + 1
+    assert delays[-1] == 0.1
+    assert aimd.limits('a.test').concurrency == 4
+
+
+def test_block_halves_once_per_window():
+    aimd = AIMDController(start_delay=1.0, start_concurrency=4, decrease=0.5)
+    in_flight = [aimd.on_send('a.test') for _ in range(3)]
+    limits = aimd.on_block('a.test', in_flight[0])
+    assert (limits.delay, limits.concurrency) == (2.0, 2.0)
+    # Sent before the decrease: caused by the old rate
+    assert aimd.on_block('a.test', in_flight[2]) is None
+    limits = aimd.on_block('a.test', aimd.on_send('a.test'))
+    assert (limits.delay, limits.concurrency) == (4.0, 1.0)
+
+
+def test_block_backs_off_the_domain(monkeypatch):
+    monkeypatch.setattr(time, 'monotonic', lambda: 1000.0)
+    monkeypatch.setattr('random.uniform', lambda low, high: (low + high) / 2)
+    crawler = get_crawler(settings_dict={
+        'SCHEDULER': 'scrape_machine.scheduler.PoliteScheduler',
+        'POLITENESS_ENABLED': True,
+        'POLITENESS_DELAY': (1, 1),
+        'POLITENESS_BACKOFF_BASE': 30,
+        'AIMD_ENABLED': True,
+    })
+    middleware = PolitenessMiddleware.from_crawler(crawler)
+    spider = Spider('aimd')
+    request = Request('https://a.test/')
+    assert middleware.process_request(request, spider) is None
+    response = HtmlResponse(request.url, status=429, request=request)
+
+    retry = middleware.process_response(request, response, spider)
+    assert retry.url == request.url and retry.dont_filter and retry.meta['dont_cache']
+    assert retry.meta['backoff_attempt'] == 1
+    assert middleware.due_at('a.test') == 1030.0
+    assert middleware.aimd.limits('a.test').delay == 2.0
+    # An ordinary response passes and speeds the domain up again
+    assert middleware.process_response(request, HtmlResponse(request.url, body=b'ok'), spider).status == 200
+    assert middleware.aimd.limits('a.test').delay < 2.0
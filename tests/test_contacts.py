@@ -0,0 +1,25 @@
+import pytest
+
+from scrape_machine.contacts import extract_contact, phone_pattern
+
+
+@pytest.mark.parametrize('text, phone', [
+    ('Call +18005551234 today', '+18005551234'),
+    ('tel:18005551234', '18005551234'),
+    ('+1 (800) 555-1234', '+1 (800) 555-1234'),
+    ('(800) 555-1234', '(800) 555-1234'),
+])
+def test_whole_phone_is_extracted(text, phone):
+    assert extract_contact(text).phones == [phone]
+
+
+def test_matches_a_full_scan():
+    text = 'Office 15262882563 9785-6, fax +1.800.555.0199, order 12755516260)+66399a8592'
+    expected = list(dict.fromkeys(match.strip() for match in phone_pattern.findall(text)))
+    assert extract_contact(text).phones == expected
+
+
+def test_emails_and_phones_in_order():
+    contacts = extract_contact('Mail info@example.com or sales@example.com, call 918-555-0100 or 918-555-0100')
+    assert contacts.emails == ['info@example.com', 'sales@example.com']
+    assert contacts.phones == ['918-555-0100']
@@ -0,0 +1,58 @@
+import pytest
+
+from scrape_machine.dedup import BloomFilter, SeenIndex, forget
+
+
+def test_bloom_filter_sized_for_its_error_rate():
+    bloom = BloomFilter(1000, error_rate=0.01)
+    for i in range(1000):
+        bloom.add(f'key-{i}')
+    assert all(f'key-{i}' in bloom for i in range(1000))
+    false_positives = sum(f'other-{i}' in bloom for i in range(10_000))
+    assert false_positives < 300
+
+
+def test_sqlite_settles_what_the_bloom_filter_cannot(tmp_path):
+    # A filter this small answers "maybe" for almost everything
+    index = SeenIndex(str(tmp_path / 'seen.sqlite3'), capacity=1, error_rate=0.5)
+    assert index.add_many(f'key-{i}' for i in range(50)) == 50
+    assert index.add_many(['key-0', 'key-50']) == 1
+    assert all(f'key-{i}' in index for i in range(51))
+    assert not any(f'other-{i}' in index for i in range(50))
+    assert index.stats['false_positive'] > 0
+    index.close()
+
+
+def test_keys_reload_from_disk(tmp_path):
+    path = str(tmp_path / 'seen.sqlite3')
+    index = SeenIndex(path, commit_every=1000)
+    index.add_many(['a', 'b'])
+    index.close()
+    index = SeenIndex(path)
+    assert 'a' in index and 'b' in index and 'c' not in index
+    assert index.stats['bloom_negative'] == 1
+    index.close()
+
+
+def test_forget_rolls_back_one_owner(tmp_path):
+    path = str(tmp_path / 'seen.sqlite3')
+    first = SeenIndex(path, commit_every=1, owner='1.1')
+    first.add_many(['a', 'b'])
+    second = SeenIndex(path, commit_every=1, owner='2.1')
+    assert second.add_many(['b', 'c']) == 1
+    first.close()
+    second.close()
+
+    assert forget(path, '1.1') == 2
+    assert forget(path, '1.1') == 0
+    index = SeenIndex(path)
+    assert 'a' not in index and 'b' not in index and 'c' in index
+    index.close()
+
+
+@pytest.mark.parametrize('create', [False, True])
+def test_forget_without_an_index(tmp_path, create):
+    path = tmp_path / 'seen.sqlite3'
+    if create:
+        path.touch()
+    assert forget(str(path), '1.1') == 0
@@ -0,0 +1,13 @@
+from scrape_machine.delta import DeltaIndex
+from scrape_machine.normalize import natural_key
+
+
+def test_leads_are_keyed_in_the_crawl_region(tmp_path):
+    index = DeltaIndex(str(tmp_path / 'delta.sqlite3'), region='GB')
+    lead = {'name': 'Cafe', 'phone': '020 7946 0958'}
+    index.note_listing(lead)
+    assert index.record(lead) == 'new'
+    keys = [key for (key,) in index.db.execute('SELECT key FROM leads')]
+    assert keys == [natural_key(lead, 'GB')] == ['phone:+442079460958']
+    assert index.record(lead) == 'unchanged'
+    index.close()
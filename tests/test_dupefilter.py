@@ -0,0 +1,57 @@
+import random
+
+from scrapy import Request
+
+from scrape_machine.dupefilter import CanonicalDupeFilter, FingerprintSet, canonical_url
+
+
+def test_spellings_of_a_page_share_a_canonical_url():
+    urls = [
+        'http://www.example.com/about/',
+        'https://example.com/about',
+        'https://EXAMPLE.com:443/about?utm_source=news#team',
+        'https://example.com/about?gclid=abc&fbclid=def',
+    ]
+    assert {canonical_url(url) for url in urls} == {'https://example.com/about'}
+
+
+def test_canonical_url_keeps_what_names_another_page():
+    assert canonical_url('https://example.com:8443/a?b=2&a=1') == 'https://example.com:8443/a?a=1&b=2'
+    assert canonical_url('https://example.com/a?page=2') != canonical_url('https://example.com/a?page=3')
+    assert canonical_url('https://example.com/a') != canonical_url('https://example.com/A')
+    assert canonical_url('ftp://www.example.com/file/') == 'ftp://www.example.com/file/'
+
+
+def test_fingerprint_set_has_no_false_positives():
+    rng = random.Random(0)
+    values = list({rng.getrandbits(64) for _ in range(2000)})
+    present, absent = values[:1000], values[1000:]
+    fingerprints = FingerprintSet(present[:300], min_merge=64)
+    assert all(fingerprints.add(value) for value in present[300:])
+    assert not fingerprints.add(present[0])
+    assert len(fingerprints) == 1000
+    assert all(value in fingerprints for value in present)
+    assert not any(value in fingerprints for value in absent)
+
+
+def test_fingerprints_persist_across_runs(tmp_path):
+    path = str(tmp_path / 'requests.fingerprints')
+    dupefilter = CanonicalDupeFilter(path)
+    dupefilter.open()
+    assert not dupefilter.request_seen(Request('http://www.example.com/a/'))
+    assert dupefilter.request_seen(Request('https://example.com/a'))
+    assert not dupefilter.request_seen(Request('https://example.com/b'))
+    dupefilter.close('finished')
+    # A crash mid-write leaves a partial fingerprint behind
+    with open(path, 'ab') as f:
+        f.write(b'\x01\x02\x03')
+
+    resumed = CanonicalDupeFilter(path)
+    resumed.open()
+    assert len(resumed.fingerprints) == 2
+    assert resumed.request_seen(Request('https://example.com/a?utm_medium=email'))
+    assert resumed.request_seen(Request('https://example.com/b'))
+    assert not resumed.request_seen(Request('https://example.com/c'))
+    assert not resumed.request_seen(Request('https://example.com/a', method='POST'))
+    resumed.close('finished')
+    assert CanonicalDupeFilter(path).request_seen(Request('https://example.com/c'))
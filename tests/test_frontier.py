@@ -0,0 +1,64 @@
+from scrapy import Request
+
+from scrape_machine.frontier import JobFrontier, SharedDupeFilter, attempt_key
+
+
+def test_claim_finish_and_retry(tmp_path):
+    frontier = JobFrontier(str(tmp_path / 'frontier.sqlite3'))
+    assert frontier.add('google_maps', [{'query': 'cafe'}, {'query': 'bakery'}]) == 2
+    assert frontier.add('google_maps', [{'query': 'cafe'}]) == 0
+
+    first = frontier.claim(worker=1)
+    second = frontier.claim(worker=2)
+    assert (first['args'], second['args']) == ({'query': 'cafe'}, {'query': 'bakery'})
+    assert frontier.claim(worker=3) is None
+    assert frontier.running(worker=1) == [{'id': first['id'], 'attempts': 1}]
+
+    frontier.finish(first['id'], ok=True, output='cafe.json')
+    frontier.finish(second['id'], ok=False, max_attempts=2)
+    assert frontier.counts() == {'done': 1, 'pending': 1}
+    retry = frontier.claim(worker=1)
+    assert retry['id'] == second['id'] and retry['attempts'] == 2
+    frontier.finish(retry['id'], ok=False, max_attempts=2)
+    assert frontier.counts() == {'done': 1, 'failed': 1}
+
+    assert frontier.unmerged() == [{'id': first['id'], 'output': 'cafe.json'}]
+    frontier.mark_merged(first['id'])
+    assert frontier.unmerged() == []
+    frontier.close()
+
+
+def test_release_requeues_running_jobs(tmp_path):
+    path = str(tmp_path / 'frontier.sqlite3')
+    frontier = JobFrontier(path)
+    frontier.add('google', [{'page': n} for n in range(3)])
+    for worker in (1, 1, 2):
+        frontier.claim(worker)
+    assert frontier.release(worker=1) == 2
+    assert frontier.counts() == {'pending': 2, 'running': 1}
+    frontier.close()
+    # A restarted runner puts back what a dead worker left behind
+    frontier = JobFrontier(path)
+    assert frontier.release() == 1
+    assert frontier.counts() == {'pending': 3}
+    assert frontier.claim(worker=3)['attempts'] == 2
+    frontier.close()
+
+
+def test_forget_lets_a_retry_fetch_pages_again(tmp_path):
+    path = str(tmp_path / 'frontier.sqlite3')
+    frontier = JobFrontier(path)
+    first = SharedDupeFilter(path, owner=attempt_key(1, 1))
+    other = SharedDupeFilter(path, owner=attempt_key(2, 1))
+    assert not first.request_seen(Request('https://example.com/a'))
+    assert not other.request_seen(Request('https://example.com/b'))
+    # Shared between workers, by canonical URL
+    assert other.request_seen(Request('http://www.example.com/a/'))
+
+    assert frontier.forget(attempt_key(1, 1)) == 1
+    retry = SharedDupeFilter(path, owner=attempt_key(1, 2))
+    assert not retry.request_seen(Request('https://example.com/a'))
+    assert retry.request_seen(Request('https://example.com/b'))
+    for dupefilter in (first, other, retry):
+        dupefilter.close('finished')
+    frontier.close()
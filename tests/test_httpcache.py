@@ -0,0 +1,99 @@
+import os
+import time
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import HtmlResponse
+from scrapy.utils.test import get_crawler
+
+from scrape_machine.httpcache import SQLiteCacheStorage
+
+
+class CacheSpider(Spider):
+    name = 'cache'
+    httpcache_ttl = {'parse_listing': 60}
+
+    def parse_listing(self, response):
+        pass
+
+    def parse_profile(self, response):
+        pass
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'time', clock)
+    return clock
+
+
+def open_storage(tmp_path, **settings):
+    crawler = get_crawler(CacheSpider, settings_dict={
+        'HTTPCACHE_DIR': str(tmp_path),
+        'HTTPCACHE_EXPIRATION_SECS': 3600,
+        'HTTPCACHE_CALLBACK_TTL': {'parse_profile': 600, 'parse_listing': 1},
+        **settings,
+    })
+    spider = CacheSpider.from_crawler(crawler)
+    storage = SQLiteCacheStorage(crawler.settings)
+    storage.open_spider(spider)
+    return storage, spider
+
+
+def store(storage, spider, request, body=b'<html><body>ok</body></html>'):
+    response = HtmlResponse(request.url, body=body, headers={'Content-Type': 'text/html'})
+    storage.store_response(spider, request, response)
+
+
+def test_ttl_by_callback(tmp_path, clock):
+    storage, spider = open_storage(tmp_path)
+    listing = Request('https://example.com/list', callback=spider.parse_listing)
+    profile = Request('https://example.com/profile', callback=spider.parse_profile)
+    page = Request('https://example.com/')
+    for request in (listing, profile, page):
+        store(storage, spider, request)
+
+    # The spider's own TTL wins over HTTPCACHE_CALLBACK_TTL
+    assert [storage.ttl(spider, r) for r in (listing, profile, page)] == [60, 600, 3600]
+    clock.now += 61
+    assert storage.retrieve_response(spider, listing) is None
+    cached = storage.retrieve_response(spider, profile)
+    assert cached.body == b'<html><body>ok</body></html>' and cached.status == 200
+    clock.now += 540
+    assert storage.retrieve_response(spider, profile) is None
+    assert storage.retrieve_response(spider, page) is not None
+    clock.now += 3000
+    assert storage.retrieve_response(spider, page) is None
+    assert spider.crawler.stats.get_value('httpcache/expired') == 3
+    storage.close_spider(spider)
+
+
+def test_evicts_least_recently_used(tmp_path, clock):
+    storage, spider = open_storage(tmp_path, HTTPCACHE_SQLITE_MAX_BYTES=3500)
+    requests = {name: Request(f'https://example.com/{name}') for name in 'abcd'}
+    for name in 'abc':
+        clock.now += 1
+        store(storage, spider, requests[name], os.urandom(1000))
+    clock.now += 1
+    assert storage.retrieve_response(spider, requests['a']) is not None
+    clock.now += 1
+    store(storage, spider, requests['d'], os.urandom(1000))
+
+    assert spider.crawler.stats.get_value('httpcache/evicted') == 1
+    assert storage.retrieve_response(spider, requests['b']) is None
+    assert all(storage.retrieve_response(spider, requests[name]) is not None for name in 'acd')
+    assert storage.total_bytes <= 3500 * 0.9
+    storage.close_spider(spider)
+
+    # The running total is picked up again from the file
+    reopened, spider = open_storage(tmp_path)
+    assert reopened.total_bytes == storage.total_bytes
+    reopened.close_spider(spider)
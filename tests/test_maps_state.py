@@ -0,0 +1,68 @@
+"""maps_state on the synthetic pages in benchmarks/fixtures.py."""
+
+import random
+
+import pytest
+from scrapy.http import HtmlResponse
+
+from benchmarks.fixtures import maps_payload, maps_place, maps_search_page
+from scrape_machine import maps_state
+
+
+@pytest.fixture
+def places():
+    rng = random.Random(0)
+    return [maps_place(i, rng) for i in range(5)]
+
+
+def test_search_page_places(places):
+    found = list(maps_state.iter_page_places(maps_search_page(places, filler=50)))
+
+    assert [place['place_id'] for place in found] == [f'ChIJ{i:020d}' for i in range(5)]
+    first = found[0]
+    assert first['name'] == 'Business 0 Family Practice'
+    assert first['phone'] == '(918) 555-0000'
+    assert first['website'] == 'https://www.business0.com/'
+    assert first['address'] == '0 Main St, Tulsa, OK 74103'
+    assert first['rating'] == places[0][4][7]
+    assert (first['lat'], first['lng']) == (places[0][9][2], places[0][9][3])
+
+
+def test_guarded_payload(places):
+    found = list(maps_state.iter_page_places(maps_payload(places)))
+
+    assert [place['name'] for place in found] == [f'Business {i} Family Practice' for i in range(5)]
+
+
+def test_semicolon_inside_string(places):
+    places[2][11] = 'Smith; Jones Dental'
+    places[2][39] = '1 Main St; Suite 5, Tulsa, OK 74103'
+
+    found = list(maps_state.iter_page_places(maps_search_page(places)))
+
+    assert len(found) == 5
+    assert found[2]['name'] == 'Smith; Jones Dental'
+    assert found[2]['address'] == '1 Main St; Suite 5, Tulsa, OK 74103'
+
+
+def test_duplicate_places_yielded_once(places):
+    found = list(maps_state.iter_page_places(maps_search_page(places + places[:2])))
+
+    assert len(found) == 5
+
+
+def test_parse_search_page(places):
+    body = maps_search_page(places, next_token='CAE_token').encode()
+    page = maps_state.parse_search_page(HtmlResponse('https://www.google.com/maps/search/doctor', body=body))
+
+    assert page.found
+    assert len(page.places) == 5
+    assert page.next_token == 'CAE_token'
+    assert page.center == (36.15, -95.99)
+
+
+def test_page_without_state():
+    response = HtmlResponse('https://www.google.com/maps/search/doctor', body=b'<html><body>Sorry</body></html>')
+
+    assert list(maps_state.iter_page_places(response.text)) == []
+    assert maps_state.parse_search_page(response) == maps_state.SearchPage(False, [], None, None)
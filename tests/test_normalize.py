@@ -0,0 +1,53 @@
+import pytest
+
+from scrape_machine import normalize
+from scrape_machine.normalize import natural_key, normalize_phone
+
+
+@pytest.fixture(params=['fallback', 'phonenumbers'])
+def parser(request, monkeypatch):
+    """Run a test with PHONE_REGIONS and, when it is installed, with phonenumbers."""
+    if request.param == 'fallback':
+        monkeypatch.setattr(normalize, 'phonenumbers', None)
+    elif normalize.phonenumbers is None:
+        pytest.skip('phonenumbers is not installed')
+    return request.param
+
+
+@pytest.mark.parametrize('value, region, expected', [
+    ('(918) 555-1234', 'US', '+19185551234'),
+    ('1-918-555-1234', 'US', '+19185551234'),
+    ('+1 918 555 1234 ext. 12', 'US', '+19185551234'),
+    ('020 7946 0958', 'GB', '+442079460958'),
+    ('0044 20 7946 0958', 'US', '+442079460958'),
+    ('+44 (0)20 7946 0958', 'US', '+442079460958'),
+    ('030 1234567', 'DE', '+49301234567'),
+    ('06 12 34 56 78', 'FR', '+33612345678'),
+    ('02 1234 5678', 'IT', '+390212345678'),
+])
+def test_normalize_phone(parser, value, region, expected):
+    assert normalize_phone(value, region) == expected
+
+
+@pytest.mark.parametrize('value', [None, '', 'call us', '555-1234', '12'])
+def test_normalize_phone_rejects(parser, value):
+    assert normalize_phone(value, 'US') is None
+
+
+def test_natural_key_prefers_place_id_then_phone_then_domain():
+    lead = {'place_id': 'ChIJ123', 'phone': '(918) 555-1234', 'website': 'https://www.shop.example.co.uk/x',
+            'name': 'Shop', 'address': '1 Main St'}
+    assert natural_key(lead) == 'place:ChIJ123'
+    del lead['place_id']
+    assert natural_key(lead) == 'phone:+19185551234'
+    del lead['phone']
+    assert natural_key(lead) == 'domain:example.co.uk'
+    del lead['website']
+    assert natural_key(lead) == 'name:shop|1 main st'
+    assert natural_key({}) is None
+
+
+def test_natural_key_reads_national_numbers_in_region(parser):
+    lead = {'phone': '020 7946 0958'}
+    assert natural_key(lead, 'GB') == 'phone:+442079460958'
+    assert natural_key(lead, 'US') != natural_key(lead, 'GB')
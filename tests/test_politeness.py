@@ -0,0 +1,100 @@
+import time
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.utils.test import get_crawler
+
+from scrape_machine.middlewares import PolitenessMiddleware
+from scrape_machine.scheduler import PoliteScheduler
+
+SETTINGS = {
+    'SCHEDULER': 'scrape_machine.scheduler.PoliteScheduler',
+    'SCHEDULER_MEMORY_QUEUE': 'scrapy.squeues.FifoMemoryQueue',
+    'POLITENESS_ENABLED': True,
+    'POLITENESS_DELAY': (0, 0),
+    'POLITENESS_DOMAIN_DELAYS': {'slow.test': (3, 3)},
+    'AIMD_ENABLED': False,
+}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+@pytest.fixture
+def crawl():
+    crawler = get_crawler(settings_dict=SETTINGS)
+    spider = Spider('politeness')
+    middleware = PolitenessMiddleware.from_crawler(crawler)
+    scheduler = PoliteScheduler.from_crawler(crawler)
+    scheduler.open(spider)
+    return middleware, scheduler, spider
+
+
+def download(middleware, scheduler, spider):
+    """Hand out every request the scheduler has ready, as the engine would; returns the URLs sent."""
+    sent = []
+    while True:
+        request = scheduler.next_request()
+        if request is None:
+            return sent
+        result = middleware.process_request(request, spider)
+        if result is None:
+            sent.append(request.url)
+        else:
+            scheduler.enqueue_request(result)
+
+
+def test_slow_domain_does_not_delay_fast_one(clock, crawl):
+    middleware, scheduler, spider = crawl
+    for i in range(4):
+        scheduler.enqueue_request(Request(f'https://slow.test/{i}'))
+    for i in range(4):
+        scheduler.enqueue_request(Request(f'https://fast.test/{i}'))
+
+    assert download(middleware, scheduler, spider) == ['https://slow.test/0'] + [f'https://fast.test/{i}' for i in range(4)]
+    assert len(scheduler) == 3
+    sent = []
+    for _ in range(3):
+        clock.now += 3
+        sent += download(middleware, scheduler, spider)
+    assert sent == [f'https://slow.test/{i}' for i in range(1, 4)]
+    assert not scheduler.has_pending_requests()
+
+
+def test_held_requests_wait_out_a_block(clock, crawl):
+    middleware, scheduler, spider = crawl
+    scheduler.enqueue_request(Request('https://slow.test/0'))
+    scheduler.enqueue_request(Request('https://slow.test/1'))
+    assert download(middleware, scheduler, spider) == ['https://slow.test/0']
+    middleware.blocked_until['slow.test'] = clock.now + 60
+    clock.now += 3
+    assert download(middleware, scheduler, spider) == []
+    assert scheduler.has_pending_requests()
+    clock.now += 57
+    assert download(middleware, scheduler, spider) == ['https://slow.test/1']
+
+
+def test_request_sent_back_keeps_its_place(clock, crawl):
+    middleware, scheduler, spider = crawl
+    for i in range(3):
+        scheduler.enqueue_request(Request(f'https://slow.test/{i}'))
+    assert download(middleware, scheduler, spider) == ['https://slow.test/0']
+    clock.now += 3
+    first = scheduler.next_request()
+    # Something else took the domain's turn before it reached the middleware
+    middleware.next_slot['slow.test'] = clock.now + 3
+    scheduler.enqueue_request(middleware.process_request(first, spider))
+    clock.now += 3
+    assert download(middleware, scheduler, spider) == ['https://slow.test/1']
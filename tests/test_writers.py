@@ -0,0 +1,108 @@
+import csv
+import gzip
+import json
+import os
+
+import pytest
+
+from scrape_machine import writers
+from scrape_machine.writers import Column, CSVLeadWriter, LeadWriter, ParquetLeadWriter, lead_writer
+
+OPENERS = {None: open, 'gzip': gzip.open}
+
+
+def read_jsonl(path, compression):
+    if compression == 'zstd':
+        import zstandard
+        with open(path, 'rb') as f:
+            data = zstandard.ZstdDecompressor().stream_reader(f).read()
+        return [json.loads(line) for line in data.decode('utf-8').splitlines()]
+    with OPENERS[compression](path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_round_trip_with_rotation(tmp_path, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    records = [{'name': f'Café {i}', 'phone': f'+1918555{i:04d}', 'rating': i / 10} for i in range(25)]
+    writer = LeadWriter('leads', str(tmp_path), batch_size=7, max_records=10, compression=compression)
+    for record in records:
+        writer.write(record)
+    writer.close()
+
+    extension = LeadWriter.EXTENSIONS[compression]
+    assert [os.path.basename(path) for path in writer.paths] == [
+        f'leads_{n:05d}.json{extension}' for n in range(3)]
+    segments = [read_jsonl(path, compression) for path in writer.paths]
+    assert [len(segment) for segment in segments] == [10, 10, 5]
+    assert sum(segments, []) == records
+    assert writer.records_written == 25
+
+
+def test_rotates_on_uncompressed_size(tmp_path):
+    writer = LeadWriter('leads', str(tmp_path), max_bytes=100, compression='gzip')
+    assert len(writer._encode({'n': 0, 'padding': 'x' * 30})) == 54
+    for i in range(10):
+        writer.write({'n': i, 'padding': 'x' * 30})
+    writer.close()
+    # Each record is 54 bytes: a segment takes records until it reaches 100
+    assert [len(read_jsonl(path, 'gzip')) for path in writer.paths] == [2] * 5
+
+
+def test_single_file_without_limits(tmp_path):
+    writer = LeadWriter('leads', str(tmp_path), flush_interval=0.01)
+    writer.write({'n': 1})
+    writer.close()
+    writer.close()
+    assert writer.paths == [str(tmp_path / 'leads.json')]
+    with pytest.raises(ValueError):
+        writer.write({'n': 2})
+    with pytest.raises(ValueError):
+        LeadWriter('leads', str(tmp_path), compression='bz2')
+
+
+COLUMNS = [Column('name'), Column('category', dictionary=True), Column('rating', 'float64')]
+
+
+def test_csv_segments_each_have_a_header(tmp_path):
+    writer = CSVLeadWriter('leads', COLUMNS, directory=str(tmp_path), max_records=2)
+    for i in range(3):
+        writer.write({'name': f'Shop, {i}', 'rating': 4.5, 'ignored': 'x'})
+    writer.close()
+    rows = []
+    for path in writer.paths:
+        with open(path, newline='', encoding='utf-8') as f:
+            segment = list(csv.reader(f))
+        assert segment[0] == ['name', 'category', 'rating']
+        rows += segment[1:]
+    assert rows == [[f'Shop, {i}', '', '4.5'] for i in range(3)]
+
+
+def test_parquet_round_trip(tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    records = [{'name': f'Shop {i}', 'category': 'cafe' if i % 2 else 'bakery', 'rating': i}
+               for i in range(10)]
+    records[3]['rating'] = 'n/a'
+    writer = ParquetLeadWriter('leads', COLUMNS, directory=str(tmp_path), row_group_size=4,
+                               max_records=6, batch_size=3)
+    for record in records:
+        writer.write(record)
+    writer.close()
+
+    assert [os.path.basename(path) for path in writer.paths] == ['leads_00000.parquet', 'leads_00001.parquet']
+    files = [parquet.ParquetFile(path) for path in writer.paths]
+    assert [f.metadata.num_row_groups for f in files] == [2, 1]
+    table = [row for f in files for row in f.read().to_pylist()]
+    assert [row['name'] for row in table] == [record['name'] for record in records]
+    assert [row['category'] for row in table] == [record['category'] for record in records]
+    assert [row['rating'] for row in table] == [0.0, 1.0, 2.0, None, 4.0, 5.0, 6.0, 7.0, 8.0, 9.0]
+
+
+def test_lead_writer_falls_back_to_csv(tmp_path, monkeypatch):
+    monkeypatch.setattr(writers, 'pyarrow', None)
+    writer = lead_writer('parquet', 'leads', COLUMNS, directory=str(tmp_path), compression='gzip')
+    writer.close()
+    assert isinstance(writer, CSVLeadWriter) and writer.compression == 'gzip'
+    with pytest.raises(ValueError):
+        lead_writer('xml', 'leads', COLUMNS, directory=str(tmp_path))